@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Scale benchmark for generate_readme_cards.py.
+
+Serves a synthetic user (N repositories, several contribution years) from a
+local mock GraphQL endpoint, runs the generator against it in a fresh process
+per run, and records wall time, GraphQL request count and peak RSS. Each size
+is run cold (empty output dir) and warm (second run after a few repos changed,
+so the incremental paths are measured too). A fault run injects 5xx answers
+at a fixed rate, one secondary rate limit and one RATE_LIMITED error, and
+checks that the generator still finishes and reports the retries and the
+point cost the mock actually charged. The local language scan is timed on a
+synthetic tree, cold and with its index.
+
+    python .github/scripts/benchmark_readme_cards.py --repos 10,100,1000,10000 --latency-ms 50
+    python .github/scripts/benchmark_readme_cards.py --repos 1000 --scan-files 100000
+
+Peak RSS comes from wait4(), so runs are measured on Linux/macOS only.
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GENERATOR = os.path.join(HERE, "generate_readme_cards.py")
+LANGUAGES = ["PowerShell", "Python", "C#", "JavaScript", "VBScript", "HTML", "Shell", "YAML"]
+
+
+# ----------------------------
+# Mock GraphQL endpoint
+# ----------------------------
+class MockGitHub:
+    """
+    Synthetic account answering the generator's queries, with latency and a page size cap.
+
+    Faults are placed by request number so a run is reproducible: every
+    round(1 / failure_rate)-th request gets a 502, request secondary_at a 403
+    secondary rate limit with Retry-After, and request rate_limited_at a
+    RATE_LIMITED GraphQL error. Only answered queries are charged a point.
+    """
+
+    def __init__(self, repos: int, years: int, latency_ms: float, max_page: int,
+                 failure_rate: float = 0.0, secondary_at: int = 0, rate_limited_at: int = 0,
+                 retry_after: int = 1):
+        self.repos = repos
+        self.years = years
+        self.latency = latency_ms / 1000.0
+        self.max_page = max_page
+        self.fail_every = round(1 / failure_rate) if failure_rate > 0 else 0
+        self.secondary_at = secondary_at
+        self.rate_limited_at = rate_limited_at
+        self.retry_after = retry_after
+        self.today = dt.datetime.utcnow().date()
+        self.bumped: List[str] = []
+        self.requests = 0
+        self.charged = 0
+        self.faults = {"5xx": 0, "secondary": 0, "rateLimited": 0}
+        self._lock = threading.Lock()
+
+    def bump(self, count: int) -> None:
+        """Mark the oldest `count` repos as just updated (they move to the front)."""
+        self.bumped = [f"repo{i:05d}" for i in range(self.repos - count, self.repos)]
+
+    def reset_counter(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.charged = 0
+            self.faults = {"5xx": 0, "secondary": 0, "rateLimited": 0}
+
+    def _fault(self, n: int) -> Optional[tuple]:
+        """(status, extra headers, body, fault kind) for request number n, or None to answer it."""
+        if n == self.secondary_at:
+            return 403, {"Retry-After": str(self.retry_after)}, {
+                "message": "You have exceeded a secondary rate limit. Please wait a few minutes before you try again."
+            }, "secondary"
+        if n == self.rate_limited_at:
+            return 200, {}, {"data": None, "errors": [
+                {"type": "RATE_LIMITED", "message": "API rate limit exceeded for user ID 1."}]}, "rateLimited"
+        if self.fail_every and n % self.fail_every == 0:
+            return 502, {}, {"message": "Server Error"}, "5xx"
+        return None
+
+    def _repo_node(self, name: str) -> dict:
+        i = int(name[4:])
+        bumped = name in self.bumped
+        stamp = (dt.datetime(2026, 1, 1) - dt.timedelta(minutes=i)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        if bumped:
+            stamp = self.today.strftime("%Y-%m-%dT00:00:00Z")
+        edges = [{"size": 1000 * (i % 97 + 1) // (k + 1) + (7 if bumped else 0),
+                  "node": {"name": LANGUAGES[(i + k) % len(LANGUAGES)]}} for k in range(1 + i % 5)]
+        return {"name": name, "updatedAt": stamp, "pushedAt": stamp, "stargazerCount": i % 13,
+                "isArchived": i % 50 == 49, "languages": {"edges": edges}}
+
+    def _days(self, start: dt.date, end: dt.date) -> List[dict]:
+        out = []
+        d = start
+        while d <= end:
+            o = d.toordinal()
+            out.append({"date": d.isoformat(), "contributionCount": 0 if o % 9 == 0 else o % 5})
+            d += dt.timedelta(days=1)
+        return [{"contributionDays": out}]
+
+    def answer(self, query: str, variables: dict) -> dict:
+        rate = {"cost": 1, "remaining": 5000 - self.requests, "resetAt": "2099-01-01T00:00:00Z"}
+        if "contributionsCollection(from" in query:
+            year = int(variables["from"][:4])
+            cal = self._days(dt.date(year, 1, 1), dt.date(year, 12, 31))
+            return {"rateLimit": rate, "user": {"contributionsCollection": {"contributionCalendar": {"weeks": cal}}}}
+        if "contributionsCollection" in query:
+            cal = self._days(self.today - dt.timedelta(days=365), self.today)
+            return {"rateLimit": rate, "user": {
+                "login": "bench", "name": "Benchmark User", "followers": {"totalCount": 42},
+                "publicRepos": {"totalCount": self.repos}, "ownedRepos": {"totalCount": self.repos},
+                "contributionsCollection": {
+                    "contributionYears": list(range(self.today.year, self.today.year - self.years, -1)),
+                    "contributionCalendar": {"weeks": cal}}}}
+        if "releases" in query:
+            return {"rateLimit": rate, "repository": {"releases": {"nodes": [
+                {"tagName": "v1.0.0", "publishedAt": "2026-01-01T00:00:00Z", "url": "https://example.invalid/r"}]}}}
+        names = self.bumped + [f"repo{i:05d}" for i in range(self.repos - len(self.bumped))]
+        start = int(variables.get("cursor") or 0)
+        first = min(int(variables.get("first") or 100), self.max_page)
+        nodes = [self._repo_node(n) for n in names[start:start + first]]
+        return {"rateLimit": rate, "user": {"repositories": {
+            "totalCount": len(names),
+            "pageInfo": {"hasNextPage": start + first < len(names), "endCursor": str(start + first)},
+            "nodes": nodes}}}
+
+    def serve(self) -> ThreadingHTTPServer:
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with mock._lock:
+                    mock.requests += 1
+                    fault = mock._fault(mock.requests)
+                    if fault is not None:
+                        mock.faults[fault[3]] += 1
+                    else:
+                        mock.charged += 1
+                if mock.latency:
+                    time.sleep(mock.latency)
+                if fault is not None:
+                    status, headers, answer, _ = fault
+                else:
+                    status, headers = 200, {}
+                    answer = {"data": mock.answer(body["query"], body["variables"])}
+                raw = json.dumps(answer).encode("utf-8")
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="mock-graphql", daemon=True).start()
+        return server
+
+
+# ----------------------------
+# Measured child processes
+# ----------------------------
+def peak_rss_mb(rusage) -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(rusage.ru_maxrss / scale, 1)
+
+
+# the generator's run summary, e.g. "INFO: 58 GraphQL requests (4 retries), cost 54 points, ..."
+GRAPHQL_SUMMARY = re.compile(r"INFO: (\d+) GraphQL requests \((\d+) retries\), cost (\d+) points")
+
+
+def run_measured(cmd: List[str], cwd: str, env: Dict[str, str]) -> dict:
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = proc.stdout.read().decode("utf-8", errors="replace")
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    run = {
+        "wall_s": round(time.perf_counter() - started, 3),
+        "peak_rss_mb": peak_rss_mb(rusage),
+        "exit_code": proc.returncode,
+        "output_tail": output.strip().splitlines()[-6:],
+    }
+    summary = GRAPHQL_SUMMARY.search(output)
+    if summary:
+        run["reported"] = dict(zip(("requests", "retries", "cost"), map(int, summary.groups())))
+    return run
+
+
+def bench_generator(args, repos: int) -> dict:
+    mock = MockGitHub(repos, args.years, args.latency_ms, args.page_size)
+    server = mock.serve()
+    workdir = tempfile.mkdtemp(prefix="cards-bench-")
+    env = dict(os.environ,
+               GITHUB_TOKEN="bench", GITHUB_USERNAME="bench", GITHUB_REPOSITORY="bench/bench",
+               GITHUB_GRAPHQL_URL=f"http://127.0.0.1:{server.server_port}/graphql",
+               LOCAL_SCAN="false", FORCE_REFRESH="false")
+    try:
+        result = {"repos": repos}
+        for phase in ("cold", "warm"):
+            if phase == "warm":
+                mock.bump(min(args.changed, repos))
+            mock.reset_counter()
+            run = run_measured([sys.executable, GENERATOR], workdir, env)
+            run["requests"] = mock.requests
+            result[phase] = run
+            print(f"  {repos:>6} repos {phase}: {run['wall_s']}s, {run['requests']} requests, "
+                  f"{run['peak_rss_mb']} MB peak RSS, exit {run['exit_code']}")
+        return result
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_faults(args) -> dict:
+    # small pages so a few hundred repos take enough requests for the failure rate to show
+    mock = MockGitHub(args.fault_repos, args.years, args.latency_ms, 25, failure_rate=args.failure_rate,
+                      secondary_at=3, rate_limited_at=7)
+    server = mock.serve()
+    workdir = tempfile.mkdtemp(prefix="cards-bench-faults-")
+    env = dict(os.environ,
+               GITHUB_TOKEN="bench", GITHUB_USERNAME="bench", GITHUB_REPOSITORY="bench/bench",
+               GITHUB_GRAPHQL_URL=f"http://127.0.0.1:{server.server_port}/graphql",
+               LOCAL_SCAN="false", FORCE_REFRESH="false",
+               GRAPHQL_BACKOFF_BASE="0.05", GRAPHQL_BACKOFF_MAX="0.5")
+    try:
+        run = run_measured([sys.executable, GENERATOR], workdir, env)
+        injected = sum(mock.faults.values())
+        expected = {"requests": mock.requests, "retries": injected, "cost": mock.charged}
+        run.update(repos=args.fault_repos, faults=dict(mock.faults), expected=expected)
+        run["ok"] = run["exit_code"] == 0 and run.get("reported") == expected
+        print(f"  faults {mock.faults}: {run['wall_s']}s, exit {run['exit_code']}, "
+              f"reported {run.get('reported')}, expected {expected} -> {'OK' if run['ok'] else 'FAIL'}")
+        return run
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def make_tree(root: str, files: int, per_dir: int = 50) -> None:
+    exts = [".ps1", ".psm1", ".vbs", ".hta", ".py", ".md", ".json", ".xml", ".png", ".txt"]
+    for i in range(files):
+        d = os.path.join(root, f"d{i // (per_dir * 40):03d}", f"s{i // per_dir:05d}")
+        if i % per_dir == 0:
+            os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, f"f{i}{exts[i % len(exts)]}"), "w", encoding="utf-8") as f:
+            f.write("x" * (i % 2048))
+
+
+SCAN_CHILD = """
+import importlib.util, json, sys
+spec = importlib.util.spec_from_file_location("cards", sys.argv[1])
+cards = importlib.util.module_from_spec(spec)
+sys.modules["cards"] = cards
+spec.loader.exec_module(cards)
+langs, info = cards.local_scan_language_bytes(sys.argv[2])
+print(json.dumps(info))
+"""
+
+
+def bench_scan(args) -> dict:
+    root = tempfile.mkdtemp(prefix="cards-scan-bench-")
+    index_dir = tempfile.mkdtemp(prefix="cards-scan-index-")
+    try:
+        print(f"  building {args.scan_files} files...")
+        make_tree(root, args.scan_files)
+        # index kept outside the tree, so writing it does not touch the scanned root
+        env = dict(os.environ, LOCAL_SCAN_GIT="false", LOCAL_SCAN_INDEX=os.path.join(index_dir, "scan-index.json"))
+        result = {"files": args.scan_files}
+        for phase in ("cold", "indexed"):
+            run = run_measured([sys.executable, "-c", SCAN_CHILD, GENERATOR, root], root, env)
+            try:
+                run["scan"] = json.loads(run["output_tail"][-1])
+            except (ValueError, IndexError):
+                pass
+            result[phase] = run
+            print(f"  scan {phase}: {run['wall_s']}s, {run['peak_rss_mb']} MB peak RSS, exit {run['exit_code']}")
+        return result
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repos", default="10,100,1000,10000", help="comma-separated repository counts")
+    parser.add_argument("--years", type=int, default=5, help="contribution years of the synthetic user")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="delay added to every GraphQL request")
+    parser.add_argument("--page-size", type=int, default=100, help="largest page the mock returns")
+    parser.add_argument("--changed", type=int, default=5, help="repos updated before the warm run")
+    parser.add_argument("--failure-rate", type=float, default=0.05, help="5xx share of the fault run (0 = skip)")
+    parser.add_argument("--fault-repos", type=int, default=500, help="repository count of the fault run")
+    parser.add_argument("--scan-files", type=int, default=100000, help="synthetic files for the scan (0 = skip)")
+    parser.add_argument("--output", help="JSON report (default: .github/scripts/benchmark-results/<utc>-<commit>.json)")
+    args = parser.parse_args()
+
+    if not hasattr(os, "wait4"):
+        print("ERROR: peak RSS needs os.wait4 (Linux/macOS).", file=sys.stderr)
+        sys.exit(1)
+
+    report = {
+        "timestamp": dt.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {k: v for k, v in vars(args).items() if k != "output"},
+        "generator": [],
+        "faults": None,
+        "scan": None,
+    }
+    for n in [int(r) for r in args.repos.split(",") if r.strip()]:
+        print(f"Generator against {n} repos...")
+        report["generator"].append(bench_generator(args, n))
+    if args.failure_rate > 0:
+        print(f"Generator with injected faults ({args.fault_repos} repos)...")
+        report["faults"] = bench_faults(args)
+    if args.scan_files:
+        print("Local scan...")
+        report["scan"] = bench_scan(args)
+
+    output = args.output or os.path.join(
+        HERE, "benchmark-results",
+        f"{dt.datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}-{report['commit'] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"OK: wrote {output}")
+    if report["faults"] is not None and not report["faults"]["ok"]:
+        print("ERROR: the fault run did not finish with the expected retry and cost totals.", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
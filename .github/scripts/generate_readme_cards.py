@@ -2,38 +2,89 @@
 from __future__ import annotations
 
 import datetime as dt
+import gzip
+import hashlib
+import http.client
 import json
 import os
+import random
 import re
+import struct
+import subprocess
 import sys
-import urllib.request
+import tempfile
+import threading
+import time
+import urllib.parse
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Dict, List, Tuple, Optional
+from typing import Callable, Dict, List, Set, Tuple, Optional
 
 
 # ----------------------------
 # Config (Tokyonight-ish)
 # ----------------------------
-BG = "#1a1b26"
-CARD = "#24283b"
-BORDER = "#414868"
-TEXT = "#c0caf5"
-MUTED = "#a9b1d6"
-ACCENT = "#7aa2f7"
+THEMES = {
+    "tokyonight": {
+        "bg": "#1a1b26", "card": "#24283b", "border": "#414868", "text": "#c0caf5",
+        "muted": "#a9b1d6", "accent": "#7aa2f7", "track": "#1f2335",
+        "palette": ["#7aa2f7", "#bb9af7", "#2ac3de", "#9ece6a", "#f7768e", "#e0af68", "#7dcfff", "#c0caf5"],
+    },
+    "tokyonight-day": {
+        "bg": "#e1e2e7", "card": "#f0f0f4", "border": "#a8aecb", "text": "#3760bf",
+        "muted": "#6172b0", "accent": "#2e7de9", "track": "#d0d5e3",
+        "palette": ["#2e7de9", "#9854f1", "#007197", "#587539", "#f52a65", "#8c6c3e", "#188092", "#3760bf"],
+    },
+}
+FONT = "ui-sans-serif, system-ui, -apple-system, Segoe UI"
 
 WIDTH = 495
 HEIGHT = 195
 PADDING = 18
 
+# Variants rendered every run; the first theme at the first width keeps the plain file names
+CARD_THEMES = [t.strip() for t in os.environ.get("CARD_THEMES", "tokyonight,tokyonight-day").split(",") if t.strip()]
+CARD_WIDTHS = [int(w) for w in os.environ.get("CARD_WIDTHS", str(WIDTH)).split(",") if w.strip()]
+
 OUT_DIR = "assets/readme-cards"
 STATS_SVG = os.path.join(OUT_DIR, "github-stats.svg")
 LANG_SVG = os.path.join(OUT_DIR, "top-languages.svg")
 STREAK_SVG = os.path.join(OUT_DIR, "streak.svg")
+# content hash + last change of every output; files whose content is unchanged are not rewritten
+MANIFEST_JSON = os.path.join(OUT_DIR, "cards-manifest.json")
 
 PER_REPO_JSON = os.path.join(OUT_DIR, "per-repo-languages.json")
 PER_REPO_MD = os.path.join(OUT_DIR, "per-repo-languages.md")
 RELEASE_JSON = os.path.join(OUT_DIR, "release-info.json")
 
+# Daily contribution counts for every year, fetched once per past year (committed with the cards)
+CONTRIB_HISTORY_BIN = os.path.join(OUT_DIR, "contributions-history.bin")
+CONTRIB_SUMMARY_JSON = os.path.join(OUT_DIR, "contributions-summary.json")
+
+# Per-repo cache (committed with the cards): only repos updated since the last
+# run are re-downloaded; a full refresh is forced after REPO_CACHE_MAX_AGE_DAYS
+REPO_CACHE_JSON = os.path.join(OUT_DIR, "repo-cache.json")
+REPO_CACHE_VERSION = 1
+REPO_CACHE_MAX_AGE_DAYS = float(os.environ.get("REPO_CACHE_MAX_AGE_DAYS", "7"))
+FORCE_REFRESH = os.environ.get("FORCE_REFRESH", "false").lower() == "true"
+# first page size on incremental runs; most runs find no or few changed repos
+INCREMENTAL_PAGE_SIZE = int(os.environ.get("INCREMENTAL_PAGE_SIZE", "10"))
+
+# GitHub API client
+GRAPHQL_URL = os.environ.get("GITHUB_GRAPHQL_URL", "https://api.github.com/graphql")
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "30"))
+# independent queries (user/calendar, release, repositories) run side by side
+GRAPHQL_CONCURRENCY = max(1, int(os.environ.get("GRAPHQL_CONCURRENCY", "4")))
+# retries for 5xx / secondary rate limits / network errors, with jittered exponential backoff
+GRAPHQL_MAX_RETRIES = int(os.environ.get("GRAPHQL_MAX_RETRIES", "5"))
+GRAPHQL_BACKOFF_BASE = float(os.environ.get("GRAPHQL_BACKOFF_BASE", "1"))
+GRAPHQL_BACKOFF_MAX = float(os.environ.get("GRAPHQL_BACKOFF_MAX", "60"))
+# longest single wait for a rate-limit reset before giving up
+GRAPHQL_MAX_WAIT = float(os.environ.get("GRAPHQL_MAX_WAIT", "900"))
+# below this many points left, run one query at a time with smaller pages
+GRAPHQL_LOW_BUDGET = int(os.environ.get("GRAPHQL_LOW_BUDGET", "200"))
+
 # If you want to exclude repos from aggregation (comma-separated names)
 EXCLUDE_REPOS = {r.strip() for r in os.environ.get("EXCLUDE_REPOS", "").split(",") if r.strip()}
 
@@ -41,7 +92,14 @@ EXCLUDE_REPOS = {r.strip() for r in os.environ.get("EXCLUDE_REPOS", "").split(",
 # - OFF by default (because you aggregate across all repos via GitHub Linguist)
 LOCAL_SCAN = os.environ.get("LOCAL_SCAN", "false").lower() == "true"
 LOCAL_SCAN_ROOT = os.environ.get("LOCAL_SCAN_ROOT", ".")
-LOCAL_SCAN_MAX_MB = int(os.environ.get("LOCAL_SCAN_MAX_MB", "250"))  # safety guard
+LOCAL_SCAN_MAX_MB = int(os.environ.get("LOCAL_SCAN_MAX_MB", "0"))  # optional cap, 0 = size everything
+LOCAL_SCAN_WORKERS = max(1, int(os.environ.get("LOCAL_SCAN_WORKERS", str(min(16, (os.cpu_count() or 1) * 2)))))
+# only files `git ls-files` reports (tracked + untracked, not ignored) when ROOT is a work tree
+LOCAL_SCAN_GIT = os.environ.get("LOCAL_SCAN_GIT", "true").lower() == "true"
+# per-directory (mtime, file sizes) index reused between runs; defaults to .git/ so it is never
+# committed (directory mtimes are not stable across checkouts, so a fresh CI checkout scans in full)
+LOCAL_SCAN_INDEX = os.environ.get("LOCAL_SCAN_INDEX", "")
+LOCAL_SCAN_JSON = os.path.join(OUT_DIR, "local-scan-languages.json")
 
 # File/path excludes for local scan
 EXCLUDE_DIRS = {
@@ -70,24 +128,244 @@ def die(msg: str) -> None:
     sys.exit(1)
 
 
-def gh_graphql(token: str, query: str, variables: dict) -> dict:
-    url = "https://api.github.com/graphql"
-    body = json.dumps({"query": query, "variables": variables}).encode("utf-8")
-    req = urllib.request.Request(url, data=body, method="POST")
-    req.add_header("Authorization", f"Bearer {token}")
-    req.add_header("Content-Type", "application/json")
-    req.add_header("User-Agent", "readme-cards-generator")
+class GitHubClient:
+    """
+    Keep-alive HTTP client for the GraphQL endpoint: one persistent connection
+    per thread (http.client connections are not thread-safe), gzip responses,
+    and one reconnect when the server has closed an idle connection.
+    """
+
+    def __init__(self, token: str, url: str = GRAPHQL_URL, timeout: float = HTTP_TIMEOUT):
+        self.token = token
+        self.url = urllib.parse.urlsplit(url)
+        self.timeout = timeout
+        self.requests = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conns: List[http.client.HTTPConnection] = []
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.url.scheme == "https" else http.client.HTTPConnection
+            conn = cls(self.url.netloc, timeout=self.timeout)
+            self._local.conn = conn
+            with self._lock:
+                self._conns.append(conn)
+        return conn
+
+    def post_json(self, payload: dict) -> Tuple[int, Dict[str, str], dict]:
+        body = json.dumps(payload).encode("utf-8")
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json",
+            "Accept-Encoding": "gzip",
+            "User-Agent": "readme-cards-generator",
+        }
+        for attempt in (1, 2):
+            conn = self._connection()
+            try:
+                conn.request("POST", self.url.path or "/", body=body, headers=headers)
+                resp = conn.getresponse()
+                raw = resp.read()
+                break
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                    http.client.BadStatusLine, ConnectionError):
+                # stale keep-alive connection: reopen once
+                conn.close()
+                self._local.conn = None
+                if attempt == 2:
+                    raise
+        with self._lock:
+            self.requests += 1
+        if resp.getheader("Content-Encoding", "").lower() == "gzip":
+            raw = gzip.decompress(raw)
+        resp_headers = {k.lower(): v for k, v in resp.getheaders()}
+        try:
+            body_json = json.loads(raw.decode("utf-8")) if raw else {}
+        except ValueError:
+            # proxies answer 502/504 with HTML
+            body_json = {"message": raw[:200].decode("utf-8", errors="replace")}
+        return resp.status, resp_headers, body_json
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns.clear()
+
+
+class RetryableError(Exception):
+    def __init__(self, msg: str, wait: Optional[float] = None):
+        super().__init__(msg)
+        self.wait = wait
 
-    with urllib.request.urlopen(req, timeout=30) as resp:
-        payload = json.loads(resp.read().decode("utf-8"))
 
-    if "errors" in payload:
-        die(json.dumps(payload["errors"], indent=2))
+class GraphQLScheduler:
+    """
+    Runs queries through a GitHubClient within GitHub's rate limits.
+
+    - Every query selects rateLimit { cost remaining resetAt }; the costs are
+      summed for the run report and the remaining budget steers the run.
+    - With less than low_budget points left, only one query runs at a time and
+      page_size() halves; when the next query would not fit, it waits for resetAt.
+    - 5xx, secondary (abuse) rate limits, RATE_LIMITED errors and network
+      errors are retried with full-jitter exponential backoff, or after
+      Retry-After / x-ratelimit-reset when the server says how long to wait.
+      A secondary limit also drops concurrency to one for the rest of the run.
+
+    sleep/clock/rng are injectable so the policy can be driven against a mock
+    server without real waits.
+    """
 
-    if "data" not in payload or payload["data"] is None:
-        die("GraphQL returned no data.")
+    def __init__(self, client: GitHubClient, concurrency: int = GRAPHQL_CONCURRENCY,
+                 max_retries: int = GRAPHQL_MAX_RETRIES, backoff_base: float = GRAPHQL_BACKOFF_BASE,
+                 backoff_max: float = GRAPHQL_BACKOFF_MAX, max_wait: float = GRAPHQL_MAX_WAIT,
+                 low_budget: int = GRAPHQL_LOW_BUDGET,
+                 sleep: Callable[[float], None] = time.sleep, clock: Callable[[], float] = time.time,
+                 rng: Optional[random.Random] = None):
+        self.client = client
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_wait = max_wait
+        self.low_budget = low_budget
+        self.sleep = sleep
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self.remaining: Optional[int] = None
+        self.reset_at: Optional[float] = None
+        self.last_cost = 1
+        self.stats = {"requests": 0, "retries": 0, "cost": 0, "waitedSeconds": 0.0}
+
+    # -- budget -------------------------------------------------------------
+
+    def _limit(self) -> int:
+        if self.remaining is not None and self.remaining < self.low_budget:
+            return 1
+        return self.concurrency
+
+    def page_size(self, default: int) -> int:
+        """Smaller pages while the budget is low: a failing page then costs less to repeat."""
+        with self._cond:
+            if self.remaining is not None and self.remaining < self.low_budget:
+                return max(10, default // 2)
+            return default
+
+    def _wait(self, seconds: float, why: str) -> None:
+        seconds = max(0.0, seconds)
+        if seconds > self.max_wait:
+            die(f"{why}: would have to wait {seconds:.0f}s (GRAPHQL_MAX_WAIT={self.max_wait:.0f}s).")
+        print(f"WARN: {why}; waiting {seconds:.1f}s", file=sys.stderr)
+        with self._cond:
+            self.stats["waitedSeconds"] += seconds
+        self.sleep(seconds)
+
+    def _acquire(self) -> None:
+        with self._cond:
+            while self._inflight >= self._limit():
+                self._cond.wait()
+            self._inflight += 1
+            exhausted = (self.remaining is not None and self.reset_at is not None
+                         and self.remaining < self.last_cost)
+            reset_in = (self.reset_at - self.clock()) if exhausted else 0.0
+        if exhausted and reset_in > 0:
+            self._wait(reset_in + 1, "GraphQL rate limit budget exhausted")
+
+    def _release(self) -> None:
+        with self._cond:
+            self._inflight -= 1
+            self._cond.notify_all()
+
+    def _account(self, headers: Dict[str, str], data: Optional[dict]) -> None:
+        with self._cond:
+            rl = (data or {}).get("rateLimit") if isinstance(data, dict) else None
+            if rl:
+                self.last_cost = int(rl.get("cost") or 1)
+                self.stats["cost"] += self.last_cost
+                self.remaining = int(rl["remaining"])
+                reset = rl.get("resetAt")
+                if reset:
+                    self.reset_at = dt.datetime.strptime(reset, "%Y-%m-%dT%H:%M:%SZ").replace(
+                        tzinfo=dt.timezone.utc).timestamp()
+            elif "x-ratelimit-remaining" in headers:
+                self.remaining = int(headers["x-ratelimit-remaining"])
+                if "x-ratelimit-reset" in headers:
+                    self.reset_at = float(headers["x-ratelimit-reset"])
+
+    # -- retries ------------------------------------------------------------
+
+    def _backoff(self, attempt: int) -> float:
+        return self.rng.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _server_wait(self, headers: Dict[str, str]) -> Optional[float]:
+        if "retry-after" in headers:
+            try:
+                return float(headers["retry-after"])
+            except ValueError:
+                return None
+        if headers.get("x-ratelimit-remaining") == "0" and "x-ratelimit-reset" in headers:
+            return float(headers["x-ratelimit-reset"]) - self.clock() + 1
+        return None
 
-    return payload["data"]
+    def _check(self, status: int, headers: Dict[str, str], payload: dict) -> dict:
+        """Return data, raise RetryableError, or die on a permanent failure."""
+        errors = payload.get("errors") or []
+        message = payload.get("message", "")
+        if status in (403, 429) and (
+                "retry-after" in headers or headers.get("x-ratelimit-remaining") == "0"
+                or "rate limit" in message.lower()):
+            with self._cond:
+                # GitHub asks clients that hit a secondary limit to serialize requests
+                self.concurrency = 1
+            raise RetryableError(f"HTTP {status} rate limited: {message}", self._server_wait(headers))
+        if status >= 500:
+            raise RetryableError(f"HTTP {status}: {message}", self._server_wait(headers))
+        if any(isinstance(e, dict) and e.get("type") == "RATE_LIMITED" for e in errors):
+            raise RetryableError("RATE_LIMITED", self._server_wait(headers))
+        if status >= 400 and not errors:
+            die(f"GraphQL HTTP {status}: {message}")
+        if errors:
+            die(json.dumps(errors, indent=2))
+        if "data" not in payload or payload["data"] is None:
+            die("GraphQL returned no data.")
+        return payload["data"]
+
+    def query(self, query: str, variables: dict) -> dict:
+        attempt = 0
+        while True:
+            self._acquire()
+            try:
+                try:
+                    status, headers, payload = self.client.post_json({"query": query, "variables": variables})
+                except (OSError, http.client.HTTPException) as e:
+                    status, headers, payload = 0, {}, {}
+                    error: Optional[RetryableError] = RetryableError(f"network error: {e}")
+                else:
+                    with self._cond:
+                        self.stats["requests"] += 1
+                    self._account(headers, payload.get("data"))
+                    try:
+                        return self._check(status, headers, payload)
+                    except RetryableError as e:
+                        error = e
+            finally:
+                self._release()
+
+            if attempt >= self.max_retries:
+                die(f"GraphQL request failed after {attempt + 1} attempts: {error}")
+            with self._cond:
+                self.stats["retries"] += 1
+            wait = error.wait if error.wait is not None else self._backoff(attempt)
+            self._wait(wait, f"{error} (attempt {attempt + 1})")
+            attempt += 1
+
+
+def gh_graphql(api: GraphQLScheduler, query: str, variables: dict) -> dict:
+    return api.query(query, variables)
 
 
 def svg_escape(s: str) -> str:
@@ -98,134 +376,352 @@ def svg_escape(s: str) -> str:
             .replace("'", "&#39;"))
 
 
-def svg_card(title: str, lines: List[Tuple[str, str]], footer: Optional[str] = None) -> str:
-    title = svg_escape(title)
-    now = dt.datetime.utcnow().strftime("%Y-%m-%d %H:%M UTC")
+class CardRenderer:
+    """
+    Card templates for one theme and width. Everything fixed per variant
+    (frame, colors, fonts, x positions) is formatted once here; rendering a
+    card only fills in text and y positions.
+    """
 
-    y = PADDING + 28
-    line_h = 22
+    def __init__(self, theme: str, width: int = WIDTH, height: int = HEIGHT):
+        if theme not in THEMES:
+            die(f"Unknown card theme '{theme}' (known: {', '.join(THEMES)}).")
+        t = THEMES[theme]
+        self.theme = theme
+        self.width = width
+        self.height = height
+        self.palette = t["palette"]
+        w, h, p = width, height, PADDING
+        self._frame = (
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{w}" height="{h}" viewBox="0 0 {w} {h}">\n'
+            f'  <rect x="0" y="0" width="{w}" height="{h}" rx="16" fill="{t["bg"]}"/>\n'
+            f'  <rect x="10" y="10" width="{w-20}" height="{h-20}" rx="14" fill="{t["card"]}" stroke="{t["border"]}" stroke-width="1"/>\n'
+        )
+        self._title = (
+            f'<text x="{p}" y="{p+20}" fill="{t["text"]}" font-size="18" '
+            f'font-family="{FONT}">{{title}}</text>'
+        )
+        self._stamp = (
+            f'<text x="{w-p}" y="{p+20}" text-anchor="end" fill="{t["muted"]}" font-size="11" '
+            f'font-family="{FONT}">{{now}}</text>'
+        )
+        self._row = (
+            f'<text x="{p}" y="{{y}}" fill="{t["muted"]}" font-size="13" '
+            f'font-family="{FONT}">{{label}}</text>'
+            f'<text x="{w-p}" y="{{y}}" text-anchor="end" fill="{t["text"]}" font-size="13" '
+            f'font-family="{FONT}">{{value}}</text>'
+        )
+        self._footer = (
+            f'<text x="{p}" y="{h-p}" fill="{t["accent"]}" font-size="12" '
+            f'font-family="{FONT}">{{footer}}</text>'
+        )
+        self._bar_y = p + 46
+        self._bar_w = w - (p * 2)
+        self._lang_head = (
+            f'  <text x="{p}" y="{p+40}" fill="{t["muted"]}" font-size="13" font-family="{FONT}">'
+            f'Top languages by GitHub Linguist bytes (non-fork repos)</text>\n'
+            f'  <rect x="{p}" y="{self._bar_y}" width="{self._bar_w}" height="10" rx="4" fill="{t["track"]}" '
+            f'stroke="{t["border"]}" stroke-width="1"/>\n'
+        )
+        self._seg = f'<rect x="{{x}}" y="{self._bar_y}" width="{{w}}" height="10" rx="4" fill="{{color}}"/>'
+        self._legend = (
+            f'<circle cx="{p+6}" cy="{{cy}}" r="5" fill="{{color}}"/>'
+            f'<text x="{p+18}" y="{{y}}" fill="{t["muted"]}" font-size="13" '
+            f'font-family="{FONT}">{{name}}</text>'
+            f'<text x="{w-p}" y="{{y}}" text-anchor="end" fill="{t["text"]}" font-size="13" '
+            f'font-family="{FONT}">{{pct:.1f}}%</text>'
+        )
 
-    text_nodes = []
-    text_nodes.append(
-        f'<text x="{PADDING}" y="{PADDING+20}" fill="{TEXT}" font-size="18" '
-        f'font-family="ui-sans-serif, system-ui, -apple-system, Segoe UI">{title}</text>'
-    )
-    text_nodes.append(
-        f'<text x="{WIDTH-PADDING}" y="{PADDING+20}" text-anchor="end" fill="{MUTED}" font-size="11" '
-        f'font-family="ui-sans-serif, system-ui, -apple-system, Segoe UI">{now}</text>'
-    )
+    def card(self, title: str, lines: List[Tuple[str, str]], footer: Optional[str], now: str) -> str:
+        nodes = [self._title.format(title=svg_escape(title)), self._stamp.format(now=now)]
+        y = PADDING + 28
+        for (label, value) in lines:
+            nodes.append(self._row.format(y=y, label=svg_escape(label), value=svg_escape(value)))
+            y += 22
+        if footer:
+            nodes.append(self._footer.format(footer=svg_escape(footer)))
+        return f"{self._frame}  {''.join(nodes)}\n</svg>\n"
+
+    def lang_bars(self, title: str, langs: List[RepoLang], now: str) -> str:
+        total = sum(l.bytes for l in langs) or 1
+        segs = []
+        x = PADDING
+        for i, l in enumerate(langs):
+            w = max(2, int(self._bar_w * (l.bytes / total)))
+            segs.append(self._seg.format(x=x, w=w, color=self.palette[i % len(self.palette)]))
+            x += w
+        legend = []
+        y = self._bar_y + 30
+        for i, l in enumerate(langs[:8]):
+            legend.append(self._legend.format(cy=y - 5, y=y, color=self.palette[i % len(self.palette)],
+                                              name=svg_escape(l.name), pct=(l.bytes / total) * 100))
+            y += 20
+        return (f"{self._frame}  {self._title.format(title=svg_escape(title))}\n  {self._stamp.format(now=now)}\n"
+                f"{self._lang_head}  {''.join(segs)}\n  {''.join(legend)}\n</svg>\n")
+
+
+# Parts of an output that change on every run and must not count as a change
+SVG_VOLATILE = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2} UTC")
+JSON_VOLATILE = re.compile(r'"generatedAtUtc": "[^"]*"')
+MD_VOLATILE = re.compile(r"- Generated \(UTC\): .*")
+SCAN_VOLATILE = re.compile(r'"generatedAtUtc": "[^"]*"|"(seconds|dirsReused)": [\d.]+')
+
+
+class OutputWriter:
+    """
+    Writes outputs only when their content changed. Each file is compared by
+    a sha256 over its text with the volatile parts (timestamps) removed, so a
+    run with no real change leaves the tree untouched and the workflow has
+    nothing to commit. The manifest records every output's hash and when it
+    last changed.
+    """
 
-    for (label, value) in lines:
-        label_e = svg_escape(label)
-        value_e = svg_escape(value)
-        text_nodes.append(
-            f'<text x="{PADDING}" y="{y}" fill="{MUTED}" font-size="13" '
-            f'font-family="ui-sans-serif, system-ui, -apple-system, Segoe UI">{label_e}</text>'
-            f'<text x="{WIDTH-PADDING}" y="{y}" text-anchor="end" fill="{TEXT}" font-size="13" '
-            f'font-family="ui-sans-serif, system-ui, -apple-system, Segoe UI">{value_e}</text>'
-        )
-        y += line_h
+    def __init__(self, manifest_path: str = MANIFEST_JSON):
+        self.manifest_path = manifest_path
+        self.now = dt.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                self.previous = json.load(f).get("files", {})
+        except (OSError, ValueError):
+            self.previous = {}
+        self.files: Dict[str, dict] = {}
+        self.regenerated: List[str] = []
+        self.unchanged: List[str] = []
+
+    @staticmethod
+    def digest(text: str, volatile: Optional[re.Pattern] = None) -> str:
+        if volatile is not None:
+            text = volatile.sub("", text)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def write(self, path: str, text: str, volatile: Optional[re.Pattern] = None, **meta) -> bool:
+        digest = self.digest(text, volatile)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                same = self.digest(f.read(), volatile) == digest
+        except OSError:
+            same = False
+
+        name = os.path.relpath(path, OUT_DIR).replace(os.sep, "/")
+        if same:
+            self.unchanged.append(path)
+            updated = self.previous.get(name, {}).get("updatedAtUtc", self.now)
+        else:
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, path)
+            self.regenerated.append(path)
+            updated = self.now
+        self.files[name] = dict(meta, sha256=digest, updatedAtUtc=updated)
+        return not same
+
+    def write_json(self, path: str, payload: dict, volatile: Optional[re.Pattern] = None, **meta) -> bool:
+        return self.write(path, json.dumps(payload, indent=2), volatile, **meta)
+
+    def save_manifest(self) -> None:
+        payload = json.dumps({"files": dict(sorted(self.files.items()))}, indent=2)
+        existing = None
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                existing = f.read()
+        except OSError:
+            pass
+        if payload != existing:
+            with open(self.manifest_path, "w", encoding="utf-8") as f:
+                f.write(payload)
 
-    if footer:
-        footer_e = svg_escape(footer)
-        text_nodes.append(
-            f'<text x="{PADDING}" y="{HEIGHT-PADDING}" fill="{ACCENT}" font-size="12" '
-            f'font-family="ui-sans-serif, system-ui, -apple-system, Segoe UI">{footer_e}</text>'
-        )
 
-    return f"""<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{HEIGHT}" viewBox="0 0 {WIDTH} {HEIGHT}">
-  <rect x="0" y="0" width="{WIDTH}" height="{HEIGHT}" rx="16" fill="{BG}"/>
-  <rect x="10" y="10" width="{WIDTH-20}" height="{HEIGHT-20}" rx="14" fill="{CARD}" stroke="{BORDER}" stroke-width="1"/>
-  {''.join(text_nodes)}
-</svg>
-"""
+def variant_path(base: str, theme: str, width: int) -> str:
+    """first theme/width -> base name (what the README links); others get -<theme>[-<width>]"""
+    stem, ext = os.path.splitext(base)
+    suffix = ""
+    if theme != CARD_THEMES[0]:
+        suffix += f"-{theme}"
+    if width != CARD_WIDTHS[0]:
+        suffix += f"-{width}"
+    return f"{stem}{suffix}{ext}"
 
 
-def svg_lang_bars(title: str, langs: List[RepoLang]) -> str:
-    title = svg_escape(title)
+def render_cards(writer: OutputWriter, cards: List[dict]) -> None:
+    """
+    Render every card in every theme/width variant from one set of card data.
+    cards: [{"path", "kind": "card"|"langs", "title", ...}]
+    """
     now = dt.datetime.utcnow().strftime("%Y-%m-%d %H:%M UTC")
+    for theme in CARD_THEMES:
+        for width in CARD_WIDTHS:
+            r = CardRenderer(theme, width)
+            for c in cards:
+                if c["kind"] == "langs":
+                    svg = r.lang_bars(c["title"], c["langs"], now)
+                else:
+                    svg = r.card(c["title"], c["lines"], c.get("footer"), now)
+                writer.write(variant_path(c["path"], theme, width), svg, SVG_VOLATILE,
+                             card=os.path.basename(c["path"]), theme=theme, width=width)
+
+
+class ContributionHistory:
+    """
+    Daily contribution counts in one uint32 array indexed by
+    (date ordinal - start). Stored as a 16-byte header followed by the raw
+    array: magic, start ordinal, final_through ordinal, day count.
+    Years ending on or before final_through have been fetched in full and
+    are not asked for again.
+    """
 
-    total = sum(l.bytes for l in langs) or 1
-    x0 = PADDING
-    y0 = PADDING + 46
-    bar_w = WIDTH - (PADDING * 2)
-    bar_h = 10
-
-    palette = ["#7aa2f7", "#bb9af7", "#2ac3de", "#9ece6a", "#f7768e", "#e0af68", "#7dcfff", "#c0caf5"]
-
-    segs = []
-    x = x0
-    for i, l in enumerate(langs):
-        w = max(2, int(bar_w * (l.bytes / total)))
-        color = palette[i % len(palette)]
-        segs.append(f'<rect x="{x}" y="{y0}" width="{w}" height="{bar_h}" rx="4" fill="{color}"/>')
-        x += w
-
-    legend = []
-    y = y0 + 30
-    line_h = 20
-    for i, l in enumerate(langs[:8]):
-        pct = (l.bytes / total) * 100
-        color = palette[i % len(palette)]
-        legend.append(
-            f'<circle cx="{x0+6}" cy="{y-5}" r="5" fill="{color}"/>'
-            f'<text x="{x0+18}" y="{y}" fill="{MUTED}" font-size="13" '
-            f'font-family="ui-sans-serif, system-ui, -apple-system, Segoe UI">{svg_escape(l.name)}</text>'
-            f'<text x="{WIDTH-PADDING}" y="{y}" text-anchor="end" fill="{TEXT}" font-size="13" '
-            f'font-family="ui-sans-serif, system-ui, -apple-system, Segoe UI">{pct:.1f}%</text>'
-        )
-        y += line_h
-
-    return f"""<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{HEIGHT}" viewBox="0 0 {WIDTH} {HEIGHT}">
-  <rect x="0" y="0" width="{WIDTH}" height="{HEIGHT}" rx="16" fill="{BG}"/>
-  <rect x="10" y="10" width="{WIDTH-20}" height="{HEIGHT-20}" rx="14" fill="{CARD}" stroke="{BORDER}" stroke-width="1"/>
-  <text x="{PADDING}" y="{PADDING+20}" fill="{TEXT}" font-size="18" font-family="ui-sans-serif, system-ui, -apple-system, Segoe UI">{title}</text>
-  <text x="{WIDTH-PADDING}" y="{PADDING+20}" text-anchor="end" fill="{MUTED}" font-size="11" font-family="ui-sans-serif, system-ui, -apple-system, Segoe UI">{now}</text>
-  <text x="{PADDING}" y="{PADDING+40}" fill="{MUTED}" font-size="13" font-family="ui-sans-serif, system-ui, -apple-system, Segoe UI">Top languages by GitHub Linguist bytes (non-fork repos)</text>
-  <rect x="{x0}" y="{y0}" width="{bar_w}" height="{bar_h}" rx="4" fill="#1f2335" stroke="{BORDER}" stroke-width="1"/>
-  {''.join(segs)}
-  {''.join(legend)}
-</svg>
-"""
+    MAGIC = b"RCH1"
+    HEADER = struct.Struct("<4sIII")
 
+    def __init__(self, start: int = 0, counts: Optional[array] = None, final_through: int = 0):
+        self.start = start
+        self.counts = counts if counts is not None else array("I")
+        self.final_through = final_through
 
-def compute_streak_utc(days: List[Tuple[str, int]]) -> Tuple[int, int, int]:
+    @classmethod
+    def load(cls, path: str) -> "ContributionHistory":
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+            magic, start, final_through, n = cls.HEADER.unpack_from(raw)
+            if magic != cls.MAGIC:
+                return cls()
+            counts = array("I")
+            counts.frombytes(raw[cls.HEADER.size:cls.HEADER.size + n * counts.itemsize])
+            if sys.byteorder == "big":
+                counts.byteswap()
+            return cls(start, counts, final_through)
+        except (OSError, struct.error, ValueError):
+            return cls()
+
+    def save(self, path: str) -> None:
+        counts = array("I", self.counts)
+        if sys.byteorder == "big":
+            counts.byteswap()
+        raw = self.HEADER.pack(self.MAGIC, self.start, self.final_through, len(self.counts)) + counts.tobytes()
+        try:
+            with open(path, "rb") as f:
+                if f.read() == raw:
+                    return
+        except OSError:
+            pass
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(raw)
+        os.replace(tmp, path)
+
+    def set_days(self, days: List[Tuple[str, int]]) -> None:
+        if not days:
+            return
+        ords = [(dt.date.fromisoformat(ds).toordinal(), c) for ds, c in days]
+        lo = min(o for o, _ in ords)
+        hi = max(o for o, _ in ords)
+        if not self.counts:
+            self.start = lo
+        if lo < self.start:
+            self.counts = array("I", bytes((self.start - lo) * self.counts.itemsize)) + self.counts
+            self.start = lo
+        end = self.start + len(self.counts)
+        if hi >= end:
+            self.counts.extend(array("I", bytes((hi - end + 1) * self.counts.itemsize)))
+        for o, c in ords:
+            self.counts[o - self.start] = c
+
+    def missing_years(self, years: List[int], today: dt.date) -> List[int]:
+        """Past years not fetched in full yet (the current year comes with the rolling calendar)."""
+        return sorted(y for y in years
+                      if y < today.year and dt.date(y, 12, 31).toordinal() > self.final_through)
+
+
+@dataclass
+class ContributionStats:
+    current_streak: int
+    longest_streak: int
+    longest_start: Optional[str]
+    longest_end: Optional[str]
+    total: int
+    total_1y: int
+    active_days: int
+    first_day: Optional[str]
+    weekly: Dict[str, int]
+    monthly: Dict[str, int]
+
+
+def compute_contribution_stats(history: ContributionHistory, today: dt.date,
+                               window_start: Optional[dt.date] = None) -> ContributionStats:
     """
-    days: list of (YYYY-MM-DD, count) sorted ascending.
-    returns: (current_streak, longest_streak, total_contribs)
-    Uses UTC anchoring to match GitHub contribution calendar dates.
+    Streaks and aggregates in one pass over the day ordinals (UTC, matching
+    GitHub contribution calendar dates). The current streak may skip today
+    while it is still 0 (common early UTC). total_1y sums from window_start,
+    the first day of GitHub's rolling one-year calendar.
     """
-    total = sum(c for _, c in days)
-    longest = 0
-
-    # longest streak
-    streak = 0
-    prev_date = None
-    for ds, c in days:
-        d = dt.date.fromisoformat(ds)
-        if prev_date and (d - prev_date).days != 1:
-            streak = 0
-        if c > 0:
+    counts = history.counts
+    base = history.start
+    today_o = today.toordinal()
+    window_o = window_start.toordinal() if window_start else today_o - 364
+    end = max(0, min(len(counts), today_o - base + 1))
+
+    total = total_1y = active = 0
+    longest = streak = prev_streak = 0
+    longest_end_o = first_o = 0
+    weekly: Dict[str, int] = {}
+    monthly: Dict[str, int] = {}
+    week_key = month_key = ""
+    next_week = next_month = 0
+
+    for i in range(end):
+        o = base + i
+        c = counts[i]
+        if o >= next_week:
+            y, w, _ = dt.date.fromordinal(o).isocalendar()
+            week_key = f"{y}-W{w:02d}"
+            next_week = o + 7 - (o - 1) % 7  # ordinal 1 is a Monday
+            weekly[week_key] = 0
+        if o >= next_month:
+            d = dt.date.fromordinal(o)
+            month_key = f"{d.year}-{d.month:02d}"
+            next_month = dt.date(d.year + d.month // 12, d.month % 12 + 1, 1).toordinal()
+            monthly[month_key] = 0
+
+        prev_streak = streak
+        if c:
             streak += 1
-            longest = max(longest, streak)
+            if streak > longest:
+                longest, longest_end_o = streak, o
+            total += c
+            active += 1
+            if not first_o:
+                first_o = o
+            weekly[week_key] += c
+            monthly[month_key] += c
+            if o >= window_o:
+                total_1y += c
         else:
             streak = 0
-        prev_date = d
 
-    # current streak: allow “today is 0” once (common early UTC)
-    day_map = {dt.date.fromisoformat(ds): c for ds, c in days}
-
-    anchor = dt.datetime.utcnow().date()
-    if day_map.get(anchor, 0) == 0:
-        anchor = anchor - dt.timedelta(days=1)
-
-    current = 0
-    d = anchor
-    while day_map.get(d, 0) > 0:
-        current += 1
-        d = d - dt.timedelta(days=1)
-
-    return current, longest, total
+    today_i = today_o - base
+    if end and end - 1 == today_i:
+        current = streak if counts[today_i] else prev_streak
+    elif end and end - 1 == today_i - 1:
+        current = streak  # today not in the calendar yet
+    else:
+        current = 0
+
+    def iso(o: int) -> Optional[str]:
+        return dt.date.fromordinal(o).isoformat() if o else None
+
+    return ContributionStats(
+        current_streak=current,
+        longest_streak=longest,
+        longest_start=iso(longest_end_o - longest + 1) if longest else None,
+        longest_end=iso(longest_end_o),
+        total=total,
+        total_1y=total_1y,
+        active_days=active,
+        first_day=iso(first_o),
+        weekly=weekly,
+        monthly=monthly,
+    )
 
 
 def read_nuspec_version(nuspec_path: str) -> Optional[str]:
@@ -242,216 +738,563 @@ def read_nuspec_version(nuspec_path: str) -> Optional[str]:
         return None
 
 
-def local_scan_language_bytes(root: str) -> Dict[str, int]:
-    """
-    Optional: estimate language composition by scanning files in checkout.
-    Excludes binary/media/archives and common build directories.
-    NOTE: This is *repo-local*, not cross-repo.
-    """
-    ext_map = {
-        ".ps1": "PowerShell",
-        ".psm1": "PowerShell",
-        ".psd1": "PowerShell",
-        ".vbs": "VBScript",
-        ".hta": "HTML/VBScript",
-        ".py": "Python",
-        ".js": "JavaScript",
-        ".ts": "TypeScript",
-        ".json": "JSON",
-        ".md": "Markdown",
-        ".yml": "YAML",
-        ".yaml": "YAML",
-        ".xml": "XML",
-        ".nuspec": "XML",
-        ".cs": "C#",
-        ".cpp": "C++",
-        ".c": "C",
-        ".h": "C/C++ Header",
-        ".html": "HTML",
-        ".css": "CSS",
-        ".sh": "Shell",
-        ".bat": "Batchfile",
-        ".cmd": "Batchfile",
-    }
+LOCAL_SCAN_EXT_MAP = {
+    ".ps1": "PowerShell",
+    ".psm1": "PowerShell",
+    ".psd1": "PowerShell",
+    ".vbs": "VBScript",
+    ".hta": "HTML/VBScript",
+    ".py": "Python",
+    ".js": "JavaScript",
+    ".ts": "TypeScript",
+    ".json": "JSON",
+    ".md": "Markdown",
+    ".yml": "YAML",
+    ".yaml": "YAML",
+    ".xml": "XML",
+    ".nuspec": "XML",
+    ".cs": "C#",
+    ".cpp": "C++",
+    ".c": "C",
+    ".h": "C/C++ Header",
+    ".html": "HTML",
+    ".css": "CSS",
+    ".sh": "Shell",
+    ".bat": "Batchfile",
+    ".cmd": "Batchfile",
+}
 
-    total_bytes = 0
-    limit = LOCAL_SCAN_MAX_MB * 1024 * 1024
-    out: Dict[str, int] = {}
+LOCAL_SCAN_INDEX_VERSION = 3
 
-    for base, dirs, files in os.walk(root):
-        # prune excluded dirs
-        dirs[:] = [d for d in dirs if d not in EXCLUDE_DIRS and not d.startswith(".git")]
 
-        for fn in files:
-            path = os.path.join(base, fn)
-            _, ext = os.path.splitext(fn.lower())
+def _file_ext(name: str) -> str:
+    # os.path.splitext for a bare file name ("" for dotfiles), without the generic path handling
+    i = name.rfind(".")
+    return name[i:].lower() if i > 0 else ""
 
-            if ext in EXCLUDE_EXTS:
-                continue
 
-            try:
-                sz = os.path.getsize(path)
-            except OSError:
-                continue
+def git_listed_files(root: str) -> Optional[Set[str]]:
+    """
+    Paths (relative, "/"-separated) that git does not ignore: tracked files plus
+    untracked ones outside .gitignore. None when root is not a git work tree.
+    """
+    try:
+        out = subprocess.run(
+            ["git", "-C", root, "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+            check=True, capture_output=True, timeout=120,
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return {p for p in out.decode("utf-8", errors="surrogateescape").split("\0") if p}
 
-            total_bytes += sz
-            if total_bytes > limit:
-                # safety guard: stop scanning
-                out["(scan-truncated)"] = out.get("(scan-truncated)", 0) + 1
-                return out
 
-            lang = ext_map.get(ext, "Other")
-            out[lang] = out.get(lang, 0) + sz
+def default_scan_index_path(root: str) -> str:
+    git_dir = os.path.join(root, ".git")
+    if os.path.isdir(git_dir):
+        return os.path.join(git_dir, "readme-cards-scan-index.json")
+    return os.path.join(tempfile.gettempdir(), "readme-cards-scan-index.json")
 
-    return out
 
+class LocalScanner:
+    """
+    Parallel, incremental directory scan.
+
+    Each directory level is listed with os.scandir across a thread pool, and
+    files are sized from the stat results of their scandir entries. The index
+    keeps every directory's mtime with its file sizes and subdirectories. When
+    a directory's mtime is unchanged on the next run, that listing is reused
+    without listing or stat-ing the directory's files. Adding, removing or
+    renaming a file bumps the directory mtime, and so does git checkout,
+    which rewrites files through unlink + create. An edit made in place
+    leaves the directory mtime alone and is only picked up by FORCE_REFRESH.
+    """
 
-def main() -> None:
-    token = os.environ.get("GITHUB_TOKEN")
-    user = os.environ.get("GITHUB_USERNAME")
-    if not token:
-        die("GITHUB_TOKEN is missing.")
-    if not user:
-        die("GITHUB_USERNAME is missing.")
+    def __init__(self, root: str, index_path: str, workers: int = LOCAL_SCAN_WORKERS,
+                 allowed: Optional[Set[str]] = None, refresh: bool = False):
+        self.root = os.path.abspath(root)
+        self.index_path = index_path
+        # the index may live inside the scanned tree; it must not count itself
+        index_rel = os.path.relpath(os.path.abspath(index_path), self.root).replace(os.sep, "/")
+        self._index_dir, _, self._index_name = index_rel.rpartition("/")
+        self.workers = workers
+        self.allowed = allowed
+        self.allowed_dirs: Optional[Set[str]] = None
+        if allowed is not None:
+            self.allowed_dirs = {""}
+            for path in allowed:
+                parts = path.split("/")[:-1]
+                for i in range(1, len(parts) + 1):
+                    self.allowed_dirs.add("/".join(parts[:i]))
+        self.old: Dict[str, dict] = {} if refresh else self._load_index()
+        self.new: Dict[str, dict] = {}
+        self.stats = {"dirs": 0, "dirsReused": 0, "files": 0, "bytes": 0}
+
+    def _load_index(self) -> Dict[str, dict]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("version") == LOCAL_SCAN_INDEX_VERSION and index.get("root") == self.root:
+                return index["dirs"]
+        except Exception:
+            pass
+        return {}
 
-    os.makedirs(OUT_DIR, exist_ok=True)
+    def _save_index(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+            tmp = self.index_path + ".tmp"
+            # json.dumps runs the C encoder; json.dump to a file does not
+            payload = json.dumps({"version": LOCAL_SCAN_INDEX_VERSION, "root": self.root, "dirs": self.new},
+                                 separators=(",", ":"))
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp, self.index_path)
+        except OSError as e:
+            print(f"WARN: could not write scan index {self.index_path}: {e}", file=sys.stderr)
+
+    def _scan_dir(self, rel: str) -> Tuple[str, Optional[dict], bool]:
+        """returns: (rel, listing, whether the listing came from the index)"""
+        path = os.path.join(self.root, rel) if rel else self.root
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return rel, None, False
+        old = self.old.get(rel)
+        if old is not None and old["mtime_ns"] == mtime_ns:
+            return rel, old, True
+
+        skip = self._index_name if rel == self._index_dir else None
+        files: Dict[str, int] = {}
+        dirs: List[str] = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in EXCLUDE_DIRS and not entry.name.startswith(".git"):
+                                dirs.append(entry.name)
+                        elif entry.is_file(follow_symlinks=False):
+                            if entry.name == skip or _file_ext(entry.name) in EXCLUDE_EXTS:
+                                continue
+                            files[entry.name] = entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+        except OSError:
+            return rel, None, False
+        return rel, {"mtime_ns": mtime_ns, "files": files, "dirs": sorted(dirs)}, False
+
+    def scan(self) -> List[Tuple[str, int]]:
+        """returns: [(relative path, size)] sorted by path"""
+        out: List[Tuple[str, int]] = []
+        level = [""]
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scan") as pool:
+            while level:
+                next_level: List[str] = []
+                for rel, listing, reused in pool.map(self._scan_dir, level):
+                    if listing is None:
+                        continue
+                    self.new[rel] = listing
+                    self.stats["dirs"] += 1
+                    self.stats["dirsReused"] += int(reused)
+                    prefix = rel + "/" if rel else ""
+                    for name, size in listing["files"].items():
+                        if self.allowed is None or prefix + name in self.allowed:
+                            out.append((prefix + name, size))
+                    for name in listing["dirs"]:
+                        if self.allowed_dirs is None or prefix + name in self.allowed_dirs:
+                            next_level.append(prefix + name)
+                level = next_level
+        if self.stats["dirsReused"] != len(self.new) or self.new.keys() != self.old.keys():
+            self._save_index()
+        out.sort()
+        self.stats["files"] = len(out)
+        self.stats["bytes"] = sum(size for _, size in out)
+        return out
+
+
+def local_scan_language_bytes(root: str, refresh: bool = False) -> Tuple[Dict[str, int], dict]:
+    """
+    Optional: estimate language composition by scanning files in checkout.
+    Excludes binary/media/archives, common build directories and (in a git
+    work tree) ignored files.
+    NOTE: This is *repo-local*, not cross-repo.
+    returns: (bytes per language, scan info)
+    """
+    started = time.perf_counter()
+    allowed = git_listed_files(root) if LOCAL_SCAN_GIT else None
+    scanner = LocalScanner(root, LOCAL_SCAN_INDEX or default_scan_index_path(root),
+                           allowed=allowed, refresh=refresh)
+    files = scanner.scan()
 
-    # Repository context (for release + nuspec alignment)
-    gh_repo = os.environ.get("GITHUB_REPOSITORY", "").strip()  # owner/name
-    owner, repo_name = (gh_repo.split("/", 1) + [""])[:2] if "/" in gh_repo else (user, "")
+    limit = LOCAL_SCAN_MAX_MB * 1024 * 1024
+    total_bytes = 0
+    out: Dict[str, int] = {}
+    truncated = False
+    for path, sz in files:
+        total_bytes += sz
+        if limit and total_bytes > limit:
+            # optional cap: sizes past it (in path order) are left out
+            out["(scan-truncated)"] = out.get("(scan-truncated)", 0) + 1
+            truncated = True
+            break
+        lang = LOCAL_SCAN_EXT_MAP.get(_file_ext(path.rpartition("/")[2]), "Other")
+        out[lang] = out.get(lang, 0) + sz
+
+    info = dict(scanner.stats, source="git ls-files" if allowed is not None else "filesystem",
+                truncated=truncated, workers=scanner.workers,
+                seconds=round(time.perf_counter() - started, 3))
+    return out, info
+
+
+Q_USER = """
+query($login: String!) {
+  rateLimit { cost remaining resetAt }
+  user(login: $login) {
+    login
+    name
+    followers { totalCount }
+    publicRepos: repositories(privacy: PUBLIC) { totalCount }
+    ownedRepos: repositories(ownerAffiliations: OWNER) { totalCount }
+    contributionsCollection {
+      contributionYears
+      contributionCalendar {
+        weeks {
+          contributionDays { date contributionCount }
+        }
+      }
+    }
+  }
+}
+"""
 
-    # ---------
-    # Query user + contribution calendar (UTC)
-    # ---------
-    q_user = """
-    query($login: String!) {
-      user(login: $login) {
-        login
+Q_CONTRIB_YEAR = """
+query($login: String!, $from: DateTime!, $to: DateTime!) {
+  rateLimit { cost remaining resetAt }
+  user(login: $login) {
+    contributionsCollection(from: $from, to: $to) {
+      contributionCalendar {
+        weeks {
+          contributionDays { date contributionCount }
+        }
+      }
+    }
+  }
+}
+"""
+
+Q_RELEASE = """
+query($owner: String!, $name: String!) {
+  rateLimit { cost remaining resetAt }
+  repository(owner: $owner, name: $name) {
+    releases(first: 1, orderBy: {field: CREATED_AT, direction: DESC}) {
+      nodes { tagName publishedAt url }
+    }
+  }
+}
+"""
+
+Q_REPOS = """
+query($login: String!, $cursor: String, $first: Int!) {
+  rateLimit { cost remaining resetAt }
+  user(login: $login) {
+    repositories(
+      first: $first,
+      after: $cursor,
+      ownerAffiliations: OWNER,
+      isFork: false,
+      orderBy: {field: UPDATED_AT, direction: DESC}
+    ) {
+      totalCount
+      pageInfo { hasNextPage endCursor }
+      nodes {
         name
-        followers { totalCount }
-        publicRepos: repositories(privacy: PUBLIC) { totalCount }
-        ownedRepos: repositories(ownerAffiliations: OWNER) { totalCount }
-        contributionsCollection {
-          contributionCalendar {
-            weeks {
-              contributionDays { date contributionCount }
-            }
-          }
+        updatedAt
+        pushedAt
+        stargazerCount
+        isArchived
+        languages(first: 12, orderBy: {field: SIZE, direction: DESC}) {
+          edges { size node { name } }
         }
       }
     }
+  }
+}
+"""
+
+
+def fetch_user(api: GraphQLScheduler, login: str) -> Tuple[dict, List[Tuple[str, int]]]:
     """
-    data = gh_graphql(token, q_user, {"login": user})
-    u = data["user"]
+    User profile + contribution calendar (UTC).
+    returns: (user node, [(YYYY-MM-DD, count)] sorted ascending)
+    """
+    u = gh_graphql(api, Q_USER, {"login": login})["user"]
     cal_days = []
     for w in u["contributionsCollection"]["contributionCalendar"]["weeks"]:
         for d in w["contributionDays"]:
             cal_days.append((d["date"], int(d["contributionCount"])))
     cal_days.sort(key=lambda x: x[0])
+    return u, cal_days
 
-    current_streak, longest_streak, total_contribs = compute_streak_utc(cal_days)
 
-    # ---------
-    # Latest release (align to NuGet/release cadence)
-    # ---------
+def fetch_contribution_year(api: GraphQLScheduler, login: str, year: int) -> List[Tuple[str, int]]:
+    data = gh_graphql(api, Q_CONTRIB_YEAR, {
+        "login": login, "from": f"{year}-01-01T00:00:00Z", "to": f"{year}-12-31T23:59:59Z"})
+    days = []
+    for w in data["user"]["contributionsCollection"]["contributionCalendar"]["weeks"]:
+        for d in w["contributionDays"]:
+            days.append((d["date"], int(d["contributionCount"])))
+    return days
+
+
+def update_contribution_history(api: GraphQLScheduler, login: str, years: List[int],
+                                recent_days: List[Tuple[str, int]], today: dt.date) -> Tuple[ContributionHistory, int]:
+    """
+    Load the stored history, fetch only the past years it does not hold in
+    full, overlay the rolling one-year calendar and save it back.
+    returns: (history, number of years fetched)
+    """
+    history = ContributionHistory() if FORCE_REFRESH else ContributionHistory.load(CONTRIB_HISTORY_BIN)
+    missing = history.missing_years(years, today)
+    if missing:
+        with ThreadPoolExecutor(max_workers=GRAPHQL_CONCURRENCY, thread_name_prefix="contrib") as pool:
+            for days in pool.map(lambda y: fetch_contribution_year(api, login, y), missing):
+                history.set_days(days)
+    history.set_days(recent_days)
+    history.final_through = max(history.final_through, dt.date(today.year - 1, 12, 31).toordinal())
+    history.save(CONTRIB_HISTORY_BIN)
+    return history, len(missing)
+
+
+def fetch_latest_release(api: GraphQLScheduler, owner: str, name: str) -> dict:
+    """Latest release (align to NuGet/release cadence); never fails the run."""
     latest_release = {"tag": None, "publishedAt": None, "url": None}
-    if repo_name:
-        q_release = """
-        query($owner: String!, $name: String!) {
-          repository(owner: $owner, name: $name) {
-            releases(first: 1, orderBy: {field: CREATED_AT, direction: DESC}) {
-              nodes { tagName publishedAt url }
+    if not name:
+        return latest_release
+    try:
+        rd = gh_graphql(api, Q_RELEASE, {"owner": owner, "name": name})
+        nodes = rd["repository"]["releases"]["nodes"]
+        if nodes:
+            latest_release = {
+                "tag": nodes[0].get("tagName"),
+                "publishedAt": nodes[0].get("publishedAt"),
+                "url": nodes[0].get("url"),
             }
-          }
-        }
-        """
-        try:
-            rd = gh_graphql(token, q_release, {"owner": owner, "name": repo_name})
-            nodes = rd["repository"]["releases"]["nodes"]
-            if nodes:
-                latest_release = {
-                    "tag": nodes[0].get("tagName"),
-                    "publishedAt": nodes[0].get("publishedAt"),
-                    "url": nodes[0].get("url"),
-                }
-        except Exception:
-            # don’t fail cards generation if release query fails
-            pass
+    except (Exception, SystemExit):
+        # don’t fail cards generation if release query fails
+        pass
+    return latest_release
 
-    with open(RELEASE_JSON, "w", encoding="utf-8") as f:
-        json.dump(latest_release, f, indent=2)
 
-    # If nuspec exists, extract version for display
-    nuspec_version = read_nuspec_version("sysadmin-prosuite.nuspec")
+def load_repo_cache(login: str) -> Optional[dict]:
+    """
+    Cached repo nodes from the last run, or None when missing, stale,
+    for another user, or FORCE_REFRESH is set.
+    """
+    if FORCE_REFRESH or not os.path.isfile(REPO_CACHE_JSON):
+        return None
+    try:
+        with open(REPO_CACHE_JSON, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        if cache.get("version") != REPO_CACHE_VERSION or cache.get("user") != login:
+            return None
+        refreshed = dt.datetime.strptime(cache["fullRefreshUtc"], "%Y-%m-%dT%H:%M:%SZ")
+        if (dt.datetime.utcnow() - refreshed).total_seconds() > REPO_CACHE_MAX_AGE_DAYS * 86400:
+            return None
+        return cache
+    except Exception:
+        return None
 
-    # ---------
-    # Repos pagination: per-repo + aggregate (GitHub Linguist sizes)
-    # ---------
-    q_repos = """
-    query($login: String!, $cursor: String) {
-      user(login: $login) {
-        repositories(
-          first: 100,
-          after: $cursor,
-          ownerAffiliations: OWNER,
-          isFork: false,
-          orderBy: {field: UPDATED_AT, direction: DESC}
-        ) {
-          pageInfo { hasNextPage endCursor }
-          nodes {
-            name
-            stargazerCount
-            isArchived
-            languages(first: 12, orderBy: {field: SIZE, direction: DESC}) {
-              edges { size node { name } }
-            }
-          }
-        }
-      }
+
+def save_repo_cache(cache: dict) -> None:
+    payload = json.dumps(cache, indent=2)
+    try:
+        with open(REPO_CACHE_JSON, "r", encoding="utf-8") as f:
+            if f.read() == payload:
+                return
+    except OSError:
+        pass
+    tmp = REPO_CACHE_JSON + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(payload)
+    os.replace(tmp, REPO_CACHE_JSON)
+
+
+def _repo_entry(repo: dict) -> dict:
+    rlangs: Dict[str, int] = {}
+    for e in repo["languages"]["edges"]:
+        lname = e["node"]["name"]
+        rlangs[lname] = rlangs.get(lname, 0) + int(e["size"])
+    return {
+        "updatedAt": repo.get("updatedAt"),
+        "pushedAt": repo.get("pushedAt"),
+        "stargazerCount": int(repo["stargazerCount"]),
+        "isArchived": bool(repo.get("isArchived")),
+        "languages": dict(sorted(rlangs.items(), key=lambda kv: kv[1], reverse=True)),
     }
+
+
+def fetch_repos(api: GraphQLScheduler, login: str) -> Tuple[Dict[str, dict], dict]:
     """
+    Repo nodes (GitHub Linguist sizes), newest first.
+    Pages are ordered by UPDATED_AT DESC, so with a cache the walk stops at
+    the first repo whose updatedAt/pushedAt are unchanged and the rest come
+    from the cache. If the merged set does not match totalCount (a repo was
+    deleted, renamed or made a fork), paging continues to the end.
+    returns: (repos by name, fetch info)
+    """
+    cache = load_repo_cache(login)
+    cached: Dict[str, dict] = cache["repos"] if cache else {}
+    fetched: Dict[str, dict] = {}
+    cursor = None
+    first = INCREMENTAL_PAGE_SIZE if cache else api.page_size(100)
+    pages = 0
+    total = None
+    stopped_early = False
+    merged: Dict[str, dict] = {}
+
+    while True:
+        data_r = gh_graphql(api, Q_REPOS, {"login": login, "cursor": cursor, "first": first})
+        repos = data_r["user"]["repositories"]
+        total = int(repos["totalCount"])
+        pages += 1
+
+        nodes = repos["nodes"]
+        stop = next((i for i, repo in enumerate(nodes)
+                     if repo["name"] in cached
+                     and cached[repo["name"]]["updatedAt"] == repo.get("updatedAt")
+                     and cached[repo["name"]]["pushedAt"] == repo.get("pushedAt")), None)
+        for repo in nodes[:stop]:
+            fetched[repo["name"]] = _repo_entry(repo)
+
+        if stop is not None:
+            merged = dict(fetched)
+            for rname, entry in cached.items():
+                merged.setdefault(rname, entry)
+            if len(merged) == total:
+                stopped_early = True
+                break
+            # cache no longer lines up with the account: walk everything
+            cached = {}
+            for repo in nodes[stop:]:
+                fetched[repo["name"]] = _repo_entry(repo)
 
+        if not repos["pageInfo"]["hasNextPage"]:
+            break
+        cursor = repos["pageInfo"]["endCursor"]
+        first = api.page_size(100)
+
+    if stopped_early:
+        repos_by_name = merged
+        full_refresh_utc = cache["fullRefreshUtc"]
+    else:
+        repos_by_name = fetched
+        full_refresh_utc = dt.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    save_repo_cache({
+        "version": REPO_CACHE_VERSION,
+        "user": login,
+        "fullRefreshUtc": full_refresh_utc,
+        "repos": repos_by_name,
+    })
+    info = {"pages": pages, "fetched": len(fetched), "fromCache": len(repos_by_name) - len(fetched),
+            "incremental": stopped_early}
+    return repos_by_name, info
+
+
+def aggregate_repos(repos: Dict[str, dict]) -> Tuple[int, Dict[str, int], Dict[str, Dict[str, int]]]:
+    """
+    returns: (stars, aggregate language bytes, per-repo language bytes)
+    skipping EXCLUDE_REPOS and archived repos
+    """
     stars = 0
     lang_bytes: Dict[str, int] = {}
     per_repo: Dict[str, Dict[str, int]] = {}
-    cursor = None
+    for rname, repo in repos.items():
+        if rname in EXCLUDE_REPOS or repo["isArchived"]:
+            continue
+        stars += repo["stargazerCount"]
+        for lname, size in repo["languages"].items():
+            lang_bytes[lname] = lang_bytes.get(lname, 0) + size
+        per_repo[rname] = repo["languages"]
+    return stars, lang_bytes, per_repo
 
-    while True:
-        data_r = gh_graphql(token, q_repos, {"login": user, "cursor": cursor})
-        repos = data_r["user"]["repositories"]
 
-        for repo in repos["nodes"]:
-            rname = repo["name"]
-            if rname in EXCLUDE_REPOS:
-                continue
-            if repo.get("isArchived"):
-                continue
+def main() -> None:
+    token = os.environ.get("GITHUB_TOKEN")
+    user = os.environ.get("GITHUB_USERNAME")
+    if not token:
+        die("GITHUB_TOKEN is missing.")
+    if not user:
+        die("GITHUB_USERNAME is missing.")
 
-            stars += int(repo["stargazerCount"])
-            rlangs: Dict[str, int] = {}
+    os.makedirs(OUT_DIR, exist_ok=True)
 
-            for e in repo["languages"]["edges"]:
-                lname = e["node"]["name"]
-                size = int(e["size"])
-                rlangs[lname] = rlangs.get(lname, 0) + size
-                lang_bytes[lname] = lang_bytes.get(lname, 0) + size
+    # Repository context (for release + nuspec alignment)
+    gh_repo = os.environ.get("GITHUB_REPOSITORY", "").strip()  # owner/name
+    owner, repo_name = (gh_repo.split("/", 1) + [""])[:2] if "/" in gh_repo else (user, "")
 
-            per_repo[rname] = dict(sorted(rlangs.items(), key=lambda kv: kv[1], reverse=True))
+    # ---------
+    # Independent queries run concurrently: the run takes as long as the slowest one
+    # ---------
+    client = GitHubClient(token)
+    api = GraphQLScheduler(client)
+    try:
+        with ThreadPoolExecutor(max_workers=GRAPHQL_CONCURRENCY, thread_name_prefix="graphql") as pool:
+            # Optional local scan mode (repo checkout only), overlapped with the network calls
+            scan_thread = None
+            scan_result: List[Tuple[Dict[str, int], dict]] = []
+            if LOCAL_SCAN:
+                scan_thread = threading.Thread(
+                    target=lambda: scan_result.append(local_scan_language_bytes(LOCAL_SCAN_ROOT, FORCE_REFRESH)),
+                    name="local-scan", daemon=True)
+                scan_thread.start()
+            f_user = pool.submit(fetch_user, api, user)
+            f_release = pool.submit(fetch_latest_release, api, owner, repo_name)
+            f_repos = pool.submit(fetch_repos, api, user)
+            u, cal_days = f_user.result()
+            # past years are fetched while the repository pages are still coming in
+            today = dt.datetime.utcnow().date()
+            history, years_fetched = update_contribution_history(
+                api, user, u["contributionsCollection"].get("contributionYears") or [], cal_days, today)
+            latest_release = f_release.result()
+            repos, repo_fetch = f_repos.result()
+            if scan_thread is not None:
+                scan_thread.join()
+    finally:
+        client.close()
+
+    stars, lang_bytes, per_repo = aggregate_repos(repos)
+    writer = OutputWriter()
+
+    window_start = dt.date.fromisoformat(cal_days[0][0]) if cal_days else None
+    contrib = compute_contribution_stats(history, today, window_start)
+    total_contribs = contrib.total_1y
+    writer.write_json(CONTRIB_SUMMARY_JSON, {
+        "currentStreak": contrib.current_streak,
+        "longestStreak": {"days": contrib.longest_streak, "start": contrib.longest_start,
+                          "end": contrib.longest_end},
+        "totalAllTime": contrib.total,
+        "totalLastYear": contrib.total_1y,
+        "activeDays": contrib.active_days,
+        "firstContribution": contrib.first_day,
+        "monthly": contrib.monthly,
+        "weekly": contrib.weekly,
+    })
+
+    writer.write_json(RELEASE_JSON, latest_release)
 
-        if not repos["pageInfo"]["hasNextPage"]:
-            break
-        cursor = repos["pageInfo"]["endCursor"]
+    # If nuspec exists, extract version for display
+    nuspec_version = read_nuspec_version("sysadmin-prosuite.nuspec")
 
     # write per-repo JSON
     out_payload = {
-        "generatedAtUtc": dt.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "generatedAtUtc": writer.now,
         "user": u["login"],
         "method": "github-linguist-bytes",
         "excludedRepos": sorted(EXCLUDE_REPOS),
         "repos": per_repo,
     }
-    with open(PER_REPO_JSON, "w", encoding="utf-8") as f:
-        json.dump(out_payload, f, indent=2)
+    writer.write_json(PER_REPO_JSON, out_payload, JSON_VOLATILE)
 
     # optional per-repo markdown summary (top 10 repos, top 5 langs each)
     try:
@@ -468,8 +1311,7 @@ def main() -> None:
             for lname, b in top5:
                 rows.append(f"- {lname}: {b} bytes ({(b/total)*100:.1f}%)")
             rows.append("")
-        with open(PER_REPO_MD, "w", encoding="utf-8") as f:
-            f.write("\n".join(rows))
+        writer.write(PER_REPO_MD, "\n".join(rows), MD_VOLATILE)
     except Exception:
         pass
 
@@ -483,12 +1325,21 @@ def main() -> None:
     # Optional local scan mode (repo checkout only)
     # ---------
     local_scan_info = None
-    if LOCAL_SCAN:
-        scan = local_scan_language_bytes(LOCAL_SCAN_ROOT)
+    if scan_result:
+        scan, scan_stats = scan_result[0]
         local_scan_info = dict(sorted(scan.items(), key=lambda kv: kv[1], reverse=True))
+        writer.write_json(LOCAL_SCAN_JSON, {
+            "generatedAtUtc": writer.now,
+            "root": LOCAL_SCAN_ROOT,
+            "method": "local-extension-bytes",
+            "scan": scan_stats,
+            "languages": local_scan_info,
+        }, SCAN_VOLATILE)
+    elif LOCAL_SCAN:
+        die("Local scan failed.")
 
     # ---------
-    # Build SVGs
+    # Build SVGs: one data pass, every theme/width variant
     # ---------
     display_name = u["name"] or u["login"]
 
@@ -508,30 +1359,42 @@ def main() -> None:
         ("NuGet nuspec", nuspec_line),
     ]
 
-    footer = "Generated by GitHub Actions • GitHub API only"
-    stats_svg = svg_card("GitHub Stats", lines_stats, footer=footer)
-    with open(STATS_SVG, "w", encoding="utf-8") as f:
-        f.write(stats_svg)
-
-    lang_svg = svg_lang_bars("Top Languages", top_langs)
-    with open(LANG_SVG, "w", encoding="utf-8") as f:
-        f.write(lang_svg)
-
+    best_month = "n/a"
+    if contrib.monthly and max(contrib.monthly.values()):
+        bm = max(contrib.monthly.items(), key=lambda kv: kv[1])
+        best_month = f"{bm[1]} ({bm[0]})"
     lines_streak = [
-        ("Current streak", f"{current_streak} days"),
-        ("Longest streak", f"{longest_streak} days"),
+        ("Current streak", f"{contrib.current_streak} days"),
+        ("Longest streak", f"{contrib.longest_streak} days"),
+        ("Contributions (all time)", f"{contrib.total}"),
         ("Contributions (1y)", f"{total_contribs}"),
+        ("Best month", best_month),
     ]
-    streak_svg = svg_card("Contribution Streak", lines_streak, footer="Computed from GitHub contribution calendar (UTC, 1y)")
-    with open(STREAK_SVG, "w", encoding="utf-8") as f:
-        f.write(streak_svg)
-
-    print(f"OK: wrote {STATS_SVG}, {LANG_SVG}, {STREAK_SVG}")
-    print(f"OK: wrote {PER_REPO_JSON}, {RELEASE_JSON}")
-    if os.path.isfile(PER_REPO_MD):
-        print(f"OK: wrote {PER_REPO_MD}")
+    since = f", since {contrib.first_day[:4]}" if contrib.first_day else ""
+
+    render_cards(writer, [
+        {"path": STATS_SVG, "kind": "card", "title": "GitHub Stats", "lines": lines_stats,
+         "footer": "Generated by GitHub Actions • GitHub API only"},
+        {"path": LANG_SVG, "kind": "langs", "title": "Top Languages", "langs": top_langs},
+        {"path": STREAK_SVG, "kind": "card", "title": "Contribution Streak", "lines": lines_streak,
+         "footer": f"Computed from GitHub contribution calendar (UTC{since})"},
+    ])
+    writer.save_manifest()
+
+    for path in writer.regenerated:
+        print(f"OK: wrote {path}")
+    print(f"OK: {len(writer.regenerated)} outputs regenerated, {len(writer.unchanged)} unchanged "
+          f"(manifest: {MANIFEST_JSON})")
+    print(f"INFO: {api.stats['requests']} GraphQL requests ({api.stats['retries']} retries), "
+          f"cost {api.stats['cost']} points, {api.remaining} remaining, "
+          f"{api.stats['waitedSeconds']:.1f}s waited on limits")
+    print(f"INFO: contribution history: {len(history.counts)} days, {years_fetched} past years fetched")
+    print(f"INFO: repos: {repo_fetch['fetched']} fetched, "
+          f"{repo_fetch['fromCache']} from cache ({'incremental' if repo_fetch['incremental'] else 'full'} refresh)")
     if local_scan_info:
         print("INFO: LOCAL_SCAN enabled -> repo-local normalized sizes computed (not shown in SVG by default).")
+        print(f"INFO: local scan: {scan_stats['files']} files, {scan_stats['dirsReused']}/"
+              f"{scan_stats['dirs']} dirs from index, {scan_stats['seconds']}s")
 
 
 if __name__ == "__main__":
@@ -1,12 +1,133 @@
-from flask import Flask
+import time
+
+from flask import Flask, jsonify, request, g
 from controllers.auth_controller import auth_bp
 from controllers.user_controller import user_bp
+from controllers.admin_controller import admin_bp
+from controllers.health_controller import health_bp, mark_draining, mark_ready
+from controllers.metrics_controller import metrics_bp
+from config import LDAP_SERVER_INFO_CONFIG, LDAP_POOL_CONFIG, TOKEN_CONFIG, GROUP_GRAPH_CONFIG, METRICS_CONFIG
+from middleware.concurrency import OverloadedError, UpstreamTimeoutError, shutdown as shutdown_offload
+from middleware.group_graph import get_group_graph
+from middleware.ldap_pool import get_pool, close_pool
+from middleware.server_registry import load_server_info
+from middleware.token_auth import protect_blueprint
+from utils.logger import get_logger, setup_logging, start_request_context, stop_logging
+from utils.metrics import (HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_FLIGHT, start_request_timing, server_timing_header,
+                           start_snapshots, stop_snapshots)
+
+setup_logging()
+logger = get_logger(__name__)
+
+def create_app(config=None):
+    """
+    Build the Flask app. Nothing here touches the directory, so the app can be
+    imported in a pre-fork master; each worker calls warm_up() after fork.
+    """
+    app = Flask(__name__)
+    app.config.update(config or {})
+
+    # Verify session tokens locally instead of re-binding against the DC
+    if TOKEN_CONFIG["PROTECT_USER_API"]:
+        protect_blueprint(user_bp)
+
+    # Register blueprints (routes)
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(user_bp, url_prefix='/api/user')
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
+    app.register_blueprint(health_bp, url_prefix='/health')
+    if METRICS_CONFIG["ENABLED"]:
+        app.register_blueprint(metrics_bp)
+
+    # Request id and source IP for every log record written while serving the request
+    @app.before_request
+    def start_request_log():
+        g.request_id = start_request_context(request.headers.get('X-Request-ID'), request.remote_addr)["request_id"]
+
+    @app.after_request
+    def add_request_id(response):
+        if "request_id" in g:
+            response.headers["X-Request-ID"] = g.request_id
+        return response
+
+    # Per-endpoint latency histograms, in-flight gauge and Server-Timing header
+    @app.before_request
+    def start_metrics():
+        g.request_started = time.perf_counter()
+        g.metrics_endpoint = request.endpoint or "unmatched"
+        HTTP_REQUESTS_IN_FLIGHT.inc(endpoint=g.metrics_endpoint)
+        start_request_timing()
+
+    @app.after_request
+    def record_metrics(response):
+        if "request_started" in g:
+            elapsed = time.perf_counter() - g.request_started
+            HTTP_REQUEST_DURATION.observe(elapsed, endpoint=g.metrics_endpoint,
+                                          method=request.method, status=str(response.status_code))
+            if METRICS_CONFIG["SERVER_TIMING"]:
+                response.headers["Server-Timing"] = server_timing_header(elapsed)
+        return response
+
+    @app.teardown_request
+    def finish_metrics(exc):
+        if "metrics_endpoint" in g:
+            HTTP_REQUESTS_IN_FLIGHT.dec(endpoint=g.metrics_endpoint)
+
+    # Shed load quickly instead of queueing behind a slow DC
+    @app.errorhandler(OverloadedError)
+    def handle_overloaded(e):
+        return jsonify({"error": "Service busy, retry shortly"}), 503, {"Retry-After": "1"}
+
+    @app.errorhandler(UpstreamTimeoutError)
+    def handle_upstream_timeout(e):
+        return jsonify({"error": "Directory did not respond in time"}), 504
+
+    return app
+
+def warm_up():
+    """
+    Open pooled connections and load schema/DSA info and the group graph in
+    this process, then report ready. Failures are logged; the affected parts
+    fall back to lazy loading on first use.
+    """
+    started = time.perf_counter()
+    report = {"errors": []}
+    try:
+        report["connections"] = get_pool().warm(LDAP_POOL_CONFIG["WARM_CONNECTIONS"])
+    except Exception as e:
+        logger.error(f"Connection warm-up failed: {str(e)}")
+        report["errors"].append("connections")
+
+    # Download schema/DSA info once at startup instead of on the first lookup
+    if LDAP_SERVER_INFO_CONFIG["LOAD_MODE"] == "startup":
+        try:
+            load_server_info(get_pool())
+        except Exception as e:
+            logger.error(f"Server info preload failed: {str(e)}")
+            report["errors"].append("server_info")
+
+    if GROUP_GRAPH_CONFIG["LOAD_MODE"] == "startup":
+        try:
+            get_group_graph()
+        except Exception as e:
+            logger.error(f"Group graph preload failed: {str(e)}")
+            report["errors"].append("group_graph")
+
+    report["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    start_snapshots()
+    mark_ready(report)
+    return report
 
-app = Flask(__name__)
+def shutdown():
+    """Report not-ready, let running directory calls finish, then unbind and flush logs."""
+    mark_draining()
+    shutdown_offload(wait=True)
+    close_pool()
+    stop_snapshots()
+    stop_logging()
 
-# Register blueprints (routes)
-app.register_blueprint(auth_bp, url_prefix='/api/auth')
-app.register_blueprint(user_bp, url_prefix='/api/user')
+app = create_app()
 
 if __name__ == '__main__':
+    warm_up()
     app.run(host='0.0.0.0', port=5000, debug=True)
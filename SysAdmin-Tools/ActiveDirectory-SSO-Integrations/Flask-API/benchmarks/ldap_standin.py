@@ -0,0 +1,133 @@
+"""
+In-process LDAP stand-in for benchmarks.
+
+Replaces the ldap3 Connection used by the middleware with one running on the
+MOCK_SYNC strategy against a single seeded directory, adds a configurable
+delay to every bind and search, and counts the connections the app opens.
+Install it before importing app.py.
+"""
+import random
+import threading
+import time
+
+import ldap3
+from ldap3 import MOCK_SYNC, NTLM
+from ldap3.core.exceptions import LDAPBindError
+from ldap3.utils.ciDict import CaseInsensitiveDict
+
+PASSWORD = "Benchmark#2026"
+DOMAIN = "HEADQ"
+
+
+class LdapStandIn:
+    def __init__(self, base_dn, bind_dn, bind_password, users=1000, groups=100,
+                 groups_per_user=5, latency_ms=0.0, jitter_ms=0.0, seed=42):
+        self.base_dn = base_dn
+        self.bind_dn = bind_dn
+        self.bind_password = bind_password
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.usernames = [f"user{i:06d}" for i in range(users)]
+        self.dit = CaseInsensitiveDict()
+        self.dit_lock = threading.Lock()
+        self._dns = {}
+        self._random = random.Random(seed)
+        self._counter_lock = threading.Lock()
+        self.counters = {"connections": 0, "binds": 0, "searches": 0}
+        self._seed(groups, groups_per_user)
+
+    def _seed(self, groups, groups_per_user):
+        conn = self._raw_connection(ldap3.Server("standin"))
+        usn = 1000
+        add = conn.strategy.add_entry
+        add(self.bind_dn, {"userPassword": self.bind_password, "objectClass": ["top", "person"]})
+        # MOCK_SYNC cannot search base "": root DSE reads are redirected to this entry
+        self.root_dse = f"cn=RootDSE,{self.base_dn}"
+        ntds = f"cn=NTDS Settings,cn=BENCH-DC1,cn=Servers,{self.base_dn}"
+        add(self.root_dse, {"objectClass": ["top"], "dnsHostName": "bench-dc1.headq.scriptguy",
+                            "dsServiceName": ntds})
+        add(ntds, {"objectClass": ["top", "nTDSDSA"], "invocationId": "bench-dc1-invocation"})
+
+        group_dns = [f"cn=group{i:05d},ou=Groups,{self.base_dn}" for i in range(groups)]
+        members = {dn: [] for dn in group_dns}
+        parents = {}
+        for i, dn in enumerate(group_dns):
+            # a shallow nesting so ?groups=effective has something to expand
+            parents[dn] = [group_dns[(i - 1) // 2]] if i else []
+
+        for name in self.usernames:
+            dn = f"cn={name},ou=Users,{self.base_dn}"
+            self._dns[name.lower()] = dn
+            memberships = self._random.sample(group_dns, min(groups_per_user, len(group_dns)))
+            for group in memberships:
+                members[group].append(dn)
+            usn += 1
+            add(dn, {
+                "objectClass": ["top", "person", "user"],
+                "sAMAccountName": name,
+                "cn": name,
+                "mail": f"{name}@headq.scriptguy",
+                "department": "Benchmark",
+                "memberOf": memberships,
+                "userPassword": PASSWORD,
+                "uSNChanged": str(usn)
+            })
+
+        for dn in group_dns:
+            usn += 1
+            attributes = {"objectClass": ["top", "group"], "cn": dn.split(",")[0][3:], "uSNChanged": str(usn)}
+            if members[dn]:
+                attributes["member"] = members[dn]
+            if parents[dn]:
+                attributes["memberOf"] = parents[dn]
+            add(dn, attributes)
+
+    def _raw_connection(self, server, user=None, password=None):
+        # every Server descriptor the app creates shares the one seeded directory
+        server.dit = self.dit
+        server.dit_lock = self.dit_lock
+        return ldap3.Connection(server, user=user, password=password, client_strategy=MOCK_SYNC)
+
+    def _count(self, name):
+        with self._counter_lock:
+            self.counters[name] += 1
+
+    def _delay(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self._random.uniform(0, self.jitter))
+
+    def connection(self, server, user=None, password=None, authentication=None, auto_bind=False, **kwargs):
+        """Drop-in for ldap3.Connection as called by the middleware."""
+        if authentication == NTLM and user:
+            # MOCK_SYNC only speaks simple binds: map DOMAIN\\name to the user's DN
+            user = self._dns.get(user.split("\\")[-1].lower(), user)
+        conn = self._raw_connection(server, user, password)
+        self._count("connections")
+
+        bind, search = conn.bind, conn.search
+
+        def delayed_bind(*args, **kw):
+            self._count("binds")
+            self._delay()
+            return bind(*args, **kw)
+
+        def delayed_search(search_base, *args, **kw):
+            self._count("searches")
+            self._delay()
+            return search(search_base or self.root_dse, *args, **kw)
+
+        conn.bind, conn.search = delayed_bind, delayed_search
+        # the mock ignores auto_bind; real connections raise on a failed bind
+        if auto_bind and not conn.bind():
+            raise LDAPBindError(conn.last_error or "invalidCredentials")
+        return conn
+
+    def install(self):
+        """Patch the middleware modules so the app talks to this stand-in."""
+        from middleware import ldap_auth_middleware, ldap_pool, server_registry
+        for module in (ldap_auth_middleware, ldap_pool, server_registry):
+            module.Connection = self.connection
+
+    def snapshot(self):
+        with self._counter_lock:
+            return dict(self.counters)
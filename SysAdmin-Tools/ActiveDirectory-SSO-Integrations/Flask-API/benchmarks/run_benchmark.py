@@ -0,0 +1,203 @@
+"""
+Throughput/latency benchmark for the Flask API.
+
+Starts app.py on a local threaded WSGI server against the in-process LDAP
+stand-in (benchmarks/ldap_standin.py), drives the login and user endpoints
+at a fixed concurrency and writes the results as JSON, so runs can be
+compared between commits.
+
+    python benchmarks/run_benchmark.py --users 5000 --latency-ms 2 --concurrency 32
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000, help="seeded user accounts")
+    parser.add_argument("--groups", type=int, default=100, help="seeded groups")
+    parser.add_argument("--groups-per-user", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay added to every bind and search")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="random extra delay, 0..jitter")
+    parser.add_argument("--concurrency", type=int, default=16, help="client threads")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=50, help="unmeasured requests per scenario")
+    parser.add_argument("--scenarios", default="login,user", help="comma-separated: login, user, user-effective")
+    parser.add_argument("--no-cache", action="store_true", help="disable the user details cache")
+    parser.add_argument("--throttle", action="store_true",
+                        help="keep login throttling on (all benchmark traffic comes from one IP)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="JSON file (default: benchmarks/results/<utc time>-<commit>.json)")
+    return parser.parse_args()
+
+
+def configure_environment(args, workdir):
+    # must run before config.py is imported
+    os.environ["LDAP_SERVER"] = "ldap://bench-dc1:389"
+    os.environ["LDAP_PASSWORD"] = "bench-service-password"
+    os.environ["LDAP_PROBE_INTERVAL"] = "0"
+    os.environ.setdefault("SESSION_SIGNING_KEYS", "bench:benchmark-signing-key")
+    os.environ["AUDIT_LOG_PATH"] = os.path.join(workdir, "audit.log")
+    os.environ["SINGLE_FLIGHT_LOCK_DIR"] = workdir
+    os.environ["USER_CACHE_SQLITE_PATH"] = os.path.join(workdir, "user_cache.sqlite3")
+    if args.no_cache:
+        os.environ["USER_CACHE_ENABLED"] = "false"
+    if not args.throttle:
+        os.environ["LOGIN_THROTTLE_ENABLED"] = "false"
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def request_once(port, method, path, body=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    started = time.perf_counter()
+    try:
+        conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status, time.perf_counter() - started
+    except Exception:
+        return None, time.perf_counter() - started
+    finally:
+        conn.close()
+
+
+def scenario_requests(name, usernames, password, count, rng):
+    for _ in range(count):
+        user = rng.choice(usernames)
+        if name == "login":
+            yield "POST", "/api/auth/login", {"username": f"HEADQ\\{user}", "password": password}
+        elif name == "user":
+            yield "GET", f"/api/user/{user}", None
+        elif name == "user-effective":
+            yield "GET", f"/api/user/{user}?groups=effective", None
+        else:
+            raise ValueError(f"Unknown scenario: {name}")
+
+
+def run_scenario(name, port, args, standin, rng):
+    from ldap_standin import PASSWORD
+    for method, path, body in scenario_requests(name, standin.usernames, PASSWORD, args.warmup, rng):
+        request_once(port, method, path, body)
+
+    work = list(scenario_requests(name, standin.usernames, PASSWORD, args.requests, rng))
+    before = standin.snapshot()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(lambda item: request_once(port, *item), work))
+    elapsed = time.perf_counter() - started
+    after = standin.snapshot()
+
+    latencies = sorted(latency for _, latency in results)
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    opened = after["connections"] - before["connections"]
+    return {
+        "requests": len(results),
+        "duration_s": round(elapsed, 3),
+        "requests_per_s": round(len(results) / elapsed, 1) if elapsed else None,
+        "status_counts": statuses,
+        "errors": sum(1 for status, _ in results if status is None or status >= 500),
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 3),
+            "p50": round(percentile(latencies, 0.50) * 1000, 3),
+            "p95": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3)
+        },
+        "ldap": {
+            "connections_opened": opened,
+            "connections_per_request": round(opened / len(results), 4),
+            "binds": after["binds"] - before["binds"],
+            "searches": after["searches"] - before["searches"]
+        }
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="flask-api-bench-")
+    configure_environment(args, workdir)
+    sys.path.insert(0, APP_DIR)
+    sys.path.insert(0, HERE)
+
+    from config import LDAP_CONFIG
+    from ldap_standin import LdapStandIn
+
+    print(f"Seeding {args.users} users / {args.groups} groups...")
+    standin = LdapStandIn(LDAP_CONFIG["BASE_DN"], LDAP_CONFIG["BIND_DN"], LDAP_CONFIG["BIND_PASSWORD"],
+                          users=args.users, groups=args.groups, groups_per_user=args.groups_per_user,
+                          latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=args.seed)
+    standin.install()
+
+    from werkzeug.serving import make_server
+    from app import app, warm_up
+
+    warm_up()
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    port = server.server_port
+    threading.Thread(target=server.serve_forever, name="bench-server", daemon=True).start()
+
+    rng = random.Random(args.seed)
+    scenarios = {}
+    try:
+        for name in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+            print(f"Running '{name}': {args.requests} requests at concurrency {args.concurrency}...")
+            scenarios[name] = run_scenario(name, port, args, standin, rng)
+            result = scenarios[name]
+            print(f"  {result['requests_per_s']} req/s, p50 {result['latency_ms']['p50']} ms, "
+                  f"p99 {result['latency_ms']['p99']} ms, "
+                  f"{result['ldap']['connections_per_request']} connections/request, {result['errors']} errors")
+    finally:
+        server.shutdown()
+
+    commit = git_commit()
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {k: v for k, v in vars(args).items() if k != "output"},
+        "scenarios": scenarios
+    }
+    output = args.output or os.path.join(
+        HERE, "results", f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{commit or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,202 @@
 import os
+import tempfile
 
 LDAP_CONFIG = {
-    "LDAP_SERVER": "ldap://ldap.headq.scriptguy:3268",
+    # one URL, or several comma-separated DCs/GCs for latency-aware failover
+    "LDAP_SERVER": os.getenv("LDAP_SERVER", "ldap://ldap.headq.scriptguy:3268"),
     "BASE_DN": "dc=headq,dc=scriptguy",
     "BIND_DN": "cn=ad-sso-authentication,ou=ServiceAccounts,dc=headq,dc=scriptguy",
     "BIND_PASSWORD": os.getenv("LDAP_PASSWORD"),
     "USER_SEARCH_FILTER": "(sAMAccountName={username})"
 }
+
+# ?fields= projection and ?groups_range= retrieval on GET /api/user/<username>
+USER_FIELDS_CONFIG = {
+    # extra directory attributes callers may request by name, on top of
+    # displayName, email and groups
+    "EXTRA_FIELDS": [f.strip() for f in os.getenv("USER_EXTRA_FIELDS", "department,title,telephoneNumber").split(",") if f.strip()],
+    # largest groups_range span accepted (AD's default MaxValRange is 1500)
+    "MAX_RANGE": int(os.getenv("USER_GROUPS_MAX_RANGE", "1500"))
+}
+
+# POST /api/user/batch
+BATCH_CONFIG = {
+    # values per (|...) filter; each chunk is one directory round trip
+    "CHUNK_SIZE": int(os.getenv("USER_BATCH_CHUNK_SIZE", "100")),
+    "MAX_ITEMS": int(os.getenv("USER_BATCH_MAX_ITEMS", "1000"))
+}
+
+# ?groups=effective on GET /api/user/<username> (see middleware/group_graph.py)
+GROUP_GRAPH_CONFIG = {
+    # "startup" builds the graph when the app starts, "lazy" on first use
+    "LOAD_MODE": os.getenv("GROUP_GRAPH_LOAD", "lazy"),
+    # seconds between incremental (uSNChanged) refreshes
+    "REFRESH_INTERVAL": float(os.getenv("GROUP_GRAPH_REFRESH_INTERVAL", "60")),
+    # seconds between full rescans, which also catch deleted groups
+    "FULL_REBUILD_INTERVAL": float(os.getenv("GROUP_GRAPH_FULL_REBUILD_INTERVAL", "3600")),
+    "GROUP_FILTER": os.getenv("GROUP_GRAPH_FILTER", "(objectClass=group)"),
+    "PAGE_SIZE": int(os.getenv("GROUP_GRAPH_PAGE_SIZE", "1000"))
+}
+
+# Coalescing of concurrent identical lookups (see middleware/single_flight.py)
+SINGLE_FLIGHT_CONFIG = {
+    "ENABLED": os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true",
+    # also coalesce across worker processes with file locks; pairs with USER_CACHE_BACKEND=sqlite
+    "CROSS_PROCESS": os.getenv("SINGLE_FLIGHT_CROSS_PROCESS", "false").lower() == "true",
+    "LOCK_DIR": os.getenv("SINGLE_FLIGHT_LOCK_DIR", os.path.join(tempfile.gettempdir(), "flask-ad-sso-locks")),
+    "LOCK_TIMEOUT": float(os.getenv("SINGLE_FLIGHT_LOCK_TIMEOUT", "10"))
+}
+
+# Local replica of users and groups answering lookups (see middleware/directory_replica.py)
+REPLICA_CONFIG = {
+    "ENABLED": os.getenv("DIRECTORY_REPLICA_ENABLED", "false").lower() == "true",
+    # ":memory:" or a SQLite file; a file keeps the uSNChanged cookie across restarts
+    "PATH": os.getenv("DIRECTORY_REPLICA_PATH", ":memory:"),
+    "SYNC_INTERVAL": float(os.getenv("DIRECTORY_REPLICA_SYNC_INTERVAL", "30")),
+    # full reloads also drop deleted objects, which uSNChanged polling cannot see
+    "FULL_RESYNC_INTERVAL": float(os.getenv("DIRECTORY_REPLICA_FULL_RESYNC_INTERVAL", "86400")),
+    # beyond this lag (seconds) lookups fall back to the directory
+    "MAX_LAG": float(os.getenv("DIRECTORY_REPLICA_MAX_LAG", "300")),
+    "FILTER": os.getenv("DIRECTORY_REPLICA_FILTER", "(|(&(objectCategory=person)(objectClass=user))(objectClass=group))"),
+    "PAGE_SIZE": int(os.getenv("DIRECTORY_REPLICA_PAGE_SIZE", "1000"))
+}
+
+# GET /api/user/export (streamed NDJSON over the simple paged results control)
+EXPORT_CONFIG = {
+    "PAGE_SIZE": int(os.getenv("USER_EXPORT_PAGE_SIZE", "500")),
+    "BASE_FILTER": os.getenv("USER_EXPORT_BASE_FILTER", "(&(objectCategory=person)(objectClass=user))"),
+    "DEFAULT_ATTRIBUTES": ["sAMAccountName", "cn", "mail"]
+}
+
+# Process-wide pool of connections bound as BIND_DN (see middleware/ldap_pool.py)
+LDAP_POOL_CONFIG = {
+    "POOL_SIZE": int(os.getenv("LDAP_POOL_SIZE", "10")),
+    "POOL_TIMEOUT": float(os.getenv("LDAP_POOL_TIMEOUT", "5")),
+    "HEALTH_CHECK_INTERVAL": float(os.getenv("LDAP_POOL_HEALTH_CHECK_INTERVAL", "30")),
+    "MAX_LIFETIME": float(os.getenv("LDAP_POOL_MAX_LIFETIME", "3600")),
+    # connections each worker opens during warm-up, before it reports ready
+    "WARM_CONNECTIONS": int(os.getenv("LDAP_POOL_WARM_CONNECTIONS", "2")),
+    "CONNECT_TIMEOUT": float(os.getenv("LDAP_CONNECT_TIMEOUT", "5")),
+    "RECEIVE_TIMEOUT": float(os.getenv("LDAP_RECEIVE_TIMEOUT", "10"))
+}
+
+# Shared Server descriptors and cached schema/root DSE (see middleware/server_registry.py)
+LDAP_SERVER_INFO_CONFIG = {
+    # ALL, DSA, SCHEMA or NO_INFO for the directory lookup path
+    "GET_INFO": os.getenv("LDAP_GET_INFO", "ALL"),
+    # "startup" loads schema/DSA info when the app starts, "lazy" on first lookup
+    "LOAD_MODE": os.getenv("LDAP_SERVER_INFO_LOAD", "lazy"),
+    # seconds between background refreshes of the cached info; 0 disables
+    "REFRESH_TTL": float(os.getenv("LDAP_SERVER_INFO_TTL", "3600")),
+    # the login path only binds, so it never needs the schema
+    "AUTH_BIND_ONLY": os.getenv("LDAP_AUTH_BIND_ONLY", "true").lower() == "true"
+}
+
+# Health probes and ejection when LDAP_SERVER lists several servers (see middleware/server_registry.py)
+LDAP_SERVER_HEALTH_CONFIG = {
+    # seconds between background bind/search probes of every server; 0 disables
+    "PROBE_INTERVAL": float(os.getenv("LDAP_PROBE_INTERVAL", "15")),
+    # ejection backoff doubles on each consecutive failure, up to the maximum
+    "BACKOFF_BASE": float(os.getenv("LDAP_EJECT_BACKOFF_BASE", "5")),
+    "BACKOFF_MAX": float(os.getenv("LDAP_EJECT_BACKOFF_MAX", "300")),
+    # weight of the newest sample in the moving latency average
+    "EWMA_ALPHA": float(os.getenv("LDAP_LATENCY_EWMA_ALPHA", "0.3"))
+}
+
+# In front of get_user_details (see middleware/user_cache.py)
+USER_CACHE_CONFIG = {
+    "ENABLED": os.getenv("USER_CACHE_ENABLED", "true").lower() == "true",
+    "MAX_ENTRIES": int(os.getenv("USER_CACHE_MAX_ENTRIES", "5000")),
+    "TTL": float(os.getenv("USER_CACHE_TTL", "300")),
+    # "user not found" results are kept for a much shorter time
+    "NEGATIVE_TTL": float(os.getenv("USER_CACHE_NEGATIVE_TTL", "30")),
+    # "memory" (per process) or "sqlite" (shared by all workers on the host)
+    "BACKEND": os.getenv("USER_CACHE_BACKEND", "memory"),
+    "SQLITE_PATH": os.getenv("USER_CACHE_SQLITE_PATH", "user_cache.sqlite3")
+}
+
+ADMIN_CONFIG = {
+    # /api/admin/* is disabled unless a key is configured
+    "API_KEY": os.getenv("ADMIN_API_KEY")
+}
+
+# Signed session tokens issued by /api/auth/login (see middleware/token_auth.py)
+TOKEN_CONFIG = {
+    # "kid:secret" pairs, comma-separated; the first key signs, all keys verify
+    "SIGNING_KEYS": os.getenv("SESSION_SIGNING_KEYS", ""),
+    "TTL": int(os.getenv("SESSION_TOKEN_TTL", "900")),
+    # tokens can be refreshed without re-authenticating until this age
+    "MAX_SESSION_AGE": int(os.getenv("SESSION_MAX_AGE", "28800")),
+    "ISSUER": os.getenv("SESSION_TOKEN_ISSUER", "flask-ad-sso"),
+    "PROTECT_USER_API": os.getenv("SESSION_PROTECT_USER_API", "false").lower() == "true"
+}
+
+# LDAP calls run on a bounded executor with per-endpoint in-flight limits (see middleware/concurrency.py)
+CONCURRENCY_CONFIG = {
+    "ENABLED": os.getenv("LDAP_OFFLOAD_ENABLED", "true").lower() == "true",
+    "WORKERS": int(os.getenv("LDAP_OFFLOAD_WORKERS", "32")),
+    # "endpoint=limit" pairs; endpoints not listed use DEFAULT_LIMIT
+    "LIMITS": os.getenv("LDAP_INFLIGHT_LIMITS", "auth=16,user=32,batch=4,export=2"),
+    "DEFAULT_LIMIT": int(os.getenv("LDAP_INFLIGHT_DEFAULT_LIMIT", "16")),
+    # seconds to wait for a free slot before answering 503 (0 = fail fast)
+    "QUEUE_WAIT": float(os.getenv("LDAP_INFLIGHT_QUEUE_WAIT", "0")),
+    # seconds a request waits for its LDAP call before answering 504
+    "CALL_TIMEOUT": float(os.getenv("LDAP_CALL_TIMEOUT", "15"))
+}
+
+# Prometheus /metrics endpoint and per-response Server-Timing header (see utils/metrics.py)
+METRICS_CONFIG = {
+    "ENABLED": os.getenv("METRICS_ENABLED", "true").lower() == "true",
+    "SERVER_TIMING": os.getenv("METRICS_SERVER_TIMING", "true").lower() == "true",
+    # shared directory for multi-worker Gunicorn: each worker snapshots its metrics
+    # there and /metrics on any worker reports the sum (empty = this process only)
+    "MULTIPROC_DIR": os.getenv("METRICS_MULTIPROC_DIR", os.getenv("PROMETHEUS_MULTIPROC_DIR", "")),
+    "MULTIPROC_INTERVAL": float(os.getenv("METRICS_MULTIPROC_INTERVAL", "5"))
+}
+
+# JSON-lines audit/application log written from a background thread (see utils/logger.py)
+AUDIT_LOG_CONFIG = {
+    # "{pid}" gives each process its own file: size/time rotation is not safe across workers
+    "PATH": os.getenv("AUDIT_LOG_PATH", "authentication.{pid}.log"),
+    "LEVEL": os.getenv("AUDIT_LOG_LEVEL", "INFO").upper(),
+    # "size" rotates at MAX_BYTES, "time" rotates on WHEN (e.g. midnight)
+    "ROTATE": os.getenv("AUDIT_LOG_ROTATE", "size").lower(),
+    "MAX_BYTES": int(os.getenv("AUDIT_LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+    "WHEN": os.getenv("AUDIT_LOG_WHEN", "midnight"),
+    "BACKUP_COUNT": int(os.getenv("AUDIT_LOG_BACKUP_COUNT", "7")),
+    # records beyond this many waiting are dropped and counted instead of blocking requests
+    "QUEUE_SIZE": int(os.getenv("AUDIT_LOG_QUEUE_SIZE", "10000"))
+}
+
+# Pre-bind throttling of POST /api/auth/login (see middleware/login_throttle.py)
+LOGIN_THROTTLE_CONFIG = {
+    "ENABLED": os.getenv("LOGIN_THROTTLE_ENABLED", "true").lower() == "true",
+    # token buckets: attempts allowed in a burst, then refilled at *_PER_MINUTE
+    "IP_BURST": int(os.getenv("LOGIN_THROTTLE_IP_BURST", "30")),
+    "IP_PER_MINUTE": float(os.getenv("LOGIN_THROTTLE_IP_PER_MINUTE", "60")),
+    "USER_BURST": int(os.getenv("LOGIN_THROTTLE_USER_BURST", "5")),
+    "USER_PER_MINUTE": float(os.getenv("LOGIN_THROTTLE_USER_PER_MINUTE", "10")),
+    # failed logins tolerated within FAILURE_WINDOW seconds before the key is
+    # blocked for BACKOFF_BASE * 2^n seconds, capped at BACKOFF_MAX
+    "IP_FREE_FAILURES": int(os.getenv("LOGIN_THROTTLE_IP_FREE_FAILURES", "20")),
+    "USER_FREE_FAILURES": int(os.getenv("LOGIN_THROTTLE_USER_FREE_FAILURES", "3")),
+    "BACKOFF_BASE": float(os.getenv("LOGIN_THROTTLE_BACKOFF_BASE", "2")),
+    "BACKOFF_MAX": float(os.getenv("LOGIN_THROTTLE_BACKOFF_MAX", "300")),
+    "FAILURE_WINDOW": float(os.getenv("LOGIN_THROTTLE_FAILURE_WINDOW", "900")),
+    # use the first X-Forwarded-For address as the client IP (only behind a trusted proxy)
+    "TRUST_FORWARDED_FOR": os.getenv("LOGIN_THROTTLE_TRUST_FORWARDED_FOR", "false").lower() == "true",
+    # "memory" (per process) or "sqlite" (shared by all workers on the host)
+    "BACKEND": os.getenv("LOGIN_THROTTLE_BACKEND", "memory"),
+    "SQLITE_PATH": os.getenv("LOGIN_THROTTLE_SQLITE_PATH",
+                             os.path.join(tempfile.gettempdir(), "flask-ad-sso-login-throttle.sqlite3")),
+    "MAX_KEYS": int(os.getenv("LOGIN_THROTTLE_MAX_KEYS", "100000"))
+}
+
+# ETag / If-None-Match on GET /api/user/<username>
+ETAG_CONFIG = {
+    "ENABLED": os.getenv("USER_ETAG_ENABLED", "true").lower() == "true",
+    # uSNChanged validators remembered per representation, so conditional
+    # requests without groups can be answered after a single-attribute read
+    "VALIDATOR_MAX_ENTRIES": int(os.getenv("USER_ETAG_VALIDATOR_MAX_ENTRIES", "10000")),
+    "VALIDATOR_TTL": float(os.getenv("USER_ETAG_VALIDATOR_TTL", "3600"))
+}
@@ -0,0 +1,54 @@
+import hmac
+from functools import wraps
+
+from flask import Blueprint, request, jsonify
+from config import ADMIN_CONFIG
+from middleware.server_registry import selector
+from middleware.single_flight import single_flight
+from middleware.user_cache import get_user_cache
+
+admin_bp = Blueprint('admin', __name__)
+
+def require_admin_key(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        expected = ADMIN_CONFIG["API_KEY"]
+        provided = request.headers.get('X-Admin-Key', '')
+        if not expected or not hmac.compare_digest(provided, expected):
+            return jsonify({"error": "Forbidden"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+@admin_bp.route('/cache/users/<username>', methods=['DELETE'])
+@require_admin_key
+def invalidate_user(username):
+    cache = get_user_cache()
+    if cache is None:
+        return jsonify({"error": "User cache is disabled"}), 404
+
+    removed = cache.invalidate(username)
+    return jsonify({"message": "User invalidated", "username": username, "removed": removed}), 200
+
+@admin_bp.route('/cache/users', methods=['DELETE'])
+@require_admin_key
+def flush_users():
+    cache = get_user_cache()
+    if cache is None:
+        return jsonify({"error": "User cache is disabled"}), 404
+
+    cache.clear()
+    return jsonify({"message": "User cache flushed"}), 200
+
+@admin_bp.route('/cache/stats', methods=['GET'])
+@require_admin_key
+def cache_stats():
+    cache = get_user_cache()
+    if cache is None:
+        return jsonify({"enabled": False, "single_flight": single_flight.stats()}), 200
+
+    return jsonify(dict(cache.stats(), enabled=True, single_flight=single_flight.stats())), 200
+
+@admin_bp.route('/servers', methods=['GET'])
+@require_admin_key
+def server_stats():
+    return jsonify({"order": selector.candidates(), "servers": selector.stats()}), 200
@@ -1,20 +1,91 @@
-from flask import Blueprint, request, jsonify
-from middleware.ldap_auth_middleware import authenticate_user
+from flask import Blueprint, request, jsonify, g
+from config import TOKEN_CONFIG, LOGIN_THROTTLE_CONFIG
+from middleware.concurrency import offload, OverloadedError, UpstreamTimeoutError
+from middleware.ldap_auth_middleware import authenticate_user, get_session_groups
+from middleware.login_throttle import get_login_throttle
+from middleware.token_auth import issue_token, refresh_token, require_token, TokenError
+from utils.logger import get_logger, log_authentication_attempt
+from utils.metrics import AUTH_ATTEMPTS
+
+logger = get_logger(__name__)
 
 auth_bp = Blueprint('auth', __name__)
 
+def _account_name(username):
+    # NTLM expects DOMAIN\user; directory lookups use the bare sAMAccountName
+    return username.split('\\')[-1].split('@')[0]
+
+def _authenticate_and_load_groups(username, password):
+    if not authenticate_user(username, password):
+        return None
+    # raises when the lookup fails: a token without groups would look like a valid session
+    return get_session_groups(_account_name(username))
+
+def _client_ip():
+    if LOGIN_THROTTLE_CONFIG["TRUST_FORWARDED_FOR"] and request.headers.get('X-Forwarded-For'):
+        return request.headers['X-Forwarded-For'].split(',')[0].strip()
+    return request.remote_addr
+
+def _token_response(token):
+    return {"token": token, "token_type": "Bearer", "expires_in": TOKEN_CONFIG["TTL"]}
+
 @auth_bp.route('/login', methods=['POST'])
 def login():
-    data = request.json
+    data = request.get_json(silent=True)
+    data = data if isinstance(data, dict) else {}
     username = data.get('username')
     password = data.get('password')
 
-    if not username or not password:
+    # anything but two non-empty strings is rejected before the throttle parses the name
+    if not isinstance(username, str) or not isinstance(password, str) or not username or not password:
+        AUTH_ATTEMPTS.inc(outcome="missing_credentials")
+        log_authentication_attempt(username, "missing_credentials")
         return jsonify({"error": "Missing credentials"}), 400
 
-    auth_result = authenticate_user(username, password)
+    # reject sprays and retry loops before they cost a DC bind
+    throttle = get_login_throttle()
+    account, client_ip = _account_name(username).lower(), _client_ip()
+    if throttle is not None:
+        retry_after = throttle.check(account, client_ip)
+        if retry_after:
+            AUTH_ATTEMPTS.inc(outcome="throttled")
+            log_authentication_attempt(username, "throttled")
+            return jsonify({"error": "Too many login attempts"}), 429, {"Retry-After": str(retry_after)}
+
+    try:
+        groups = offload('auth', _authenticate_and_load_groups, username, password)
+    except (OverloadedError, UpstreamTimeoutError):
+        raise
+    except Exception as e:
+        logger.error(f"Group lookup after login failed: {str(e)}")
+        AUTH_ATTEMPTS.inc(outcome="error")
+        log_authentication_attempt(username, "error")
+        return jsonify({"error": "Directory unavailable, try again"}), 503
 
-    if auth_result:
-        return jsonify({"message": "Authentication successful"}), 200
+    if groups is not None:
+        if throttle is not None:
+            throttle.record_success(account, client_ip)
+        AUTH_ATTEMPTS.inc(outcome="success")
+        log_authentication_attempt(username, "success")
+        token = issue_token(_account_name(username), groups)
+        return jsonify(dict(_token_response(token), message="Authentication successful")), 200
     else:
+        if throttle is not None:
+            throttle.record_failure(account, client_ip)
+        AUTH_ATTEMPTS.inc(outcome="failure")
+        log_authentication_attempt(username, "failure")
         return jsonify({"error": "Invalid credentials"}), 401
+
+@auth_bp.route('/refresh', methods=['POST'])
+@require_token
+def refresh():
+    try:
+        token = refresh_token(g.token_claims, lambda username: offload('auth', get_session_groups, username))
+    except TokenError as e:
+        return jsonify({"error": str(e)}), 401
+    except (OverloadedError, UpstreamTimeoutError):
+        raise
+    except Exception as e:
+        logger.error(f"Group lookup on refresh failed: {str(e)}")
+        return jsonify({"error": "Directory unavailable, try again"}), 503
+    return jsonify(_token_response(token)), 200
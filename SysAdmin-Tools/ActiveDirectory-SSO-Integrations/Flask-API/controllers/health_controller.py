@@ -0,0 +1,25 @@
+from flask import Blueprint, jsonify
+
+health_bp = Blueprint('health', __name__)
+
+# flipped by app.warm_up() and app.shutdown(); per worker process
+_state = {"ready": False, "draining": False, "warm_up": None}
+
+def mark_ready(report):
+    _state["warm_up"] = report
+    _state["ready"] = True
+
+def mark_draining():
+    _state["draining"] = True
+
+@health_bp.route('/live', methods=['GET'])
+def live():
+    return jsonify({"status": "alive"}), 200
+
+@health_bp.route('/ready', methods=['GET'])
+def ready():
+    if _state["draining"]:
+        return jsonify({"status": "draining"}), 503
+    if not _state["ready"]:
+        return jsonify({"status": "warming up"}), 503
+    return jsonify({"status": "ready", "warm_up": _state["warm_up"]}), 200
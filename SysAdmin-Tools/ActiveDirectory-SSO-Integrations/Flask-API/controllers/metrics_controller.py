@@ -0,0 +1,92 @@
+from flask import Blueprint, Response
+from middleware import directory_replica, group_graph, ldap_pool
+from middleware.concurrency import limiter
+from middleware.login_throttle import get_login_throttle
+from middleware.server_registry import selector
+from middleware.single_flight import single_flight
+from middleware.user_cache import get_user_cache
+from utils.logger import logging_stats
+from utils.metrics import registry
+
+metrics_bp = Blueprint('metrics', __name__)
+
+def _collect_runtime_stats():
+    # read the singletons that already exist; a scrape must not build a pool or a graph
+    families = []
+
+    pool = ldap_pool._pool
+    if pool is not None:
+        stats = pool.stats()
+        families += [
+            ("ldap_pool_size", "gauge", "Configured LDAP pool size.", [({}, stats["size"])]),
+            ("ldap_pool_idle_connections", "gauge", "Idle pooled LDAP connections.", [({}, stats["idle"])]),
+            ("ldap_pool_opened_total", "counter", "LDAP connections opened by the pool.", [({}, stats["opened"])]),
+            ("ldap_pool_rebinds_total", "counter", "Pooled operations retried after a lost connection.", [({}, stats["rebinds"])])
+        ]
+
+    servers = selector.stats()
+    families += [
+        ("ldap_server_latency_seconds", "gauge", "Smoothed LDAP round-trip time per server.",
+         [({"server": url}, s["latency_ms"] / 1000 if s["latency_ms"] is not None else None) for url, s in servers.items()]),
+        ("ldap_server_failures_total", "counter", "Connection failures per server.",
+         [({"server": url}, s["failures"]) for url, s in servers.items()]),
+        ("ldap_server_ejected", "gauge", "1 while a server is ejected after repeated failures.",
+         [({"server": url}, 1 if s["ejected_for"] > 0 else 0) for url, s in servers.items()])
+    ]
+
+    limits = limiter.stats()
+    families += [
+        ("ldap_inflight_calls", "gauge", "Offloaded directory calls in flight per endpoint.",
+         [({"endpoint": name}, s["in_flight"]) for name, s in limits.items()]),
+        ("ldap_inflight_limit", "gauge", "In-flight limit per endpoint.",
+         [({"endpoint": name}, s["limit"]) for name, s in limits.items()]),
+        ("ldap_inflight_rejected_total", "counter", "Requests rejected with 503 per endpoint.",
+         [({"endpoint": name}, s["rejected"]) for name, s in limits.items()])
+    ]
+
+    cache = get_user_cache()
+    if cache is not None:
+        stats = cache.stats()
+        families += [
+            ("user_cache_lookups_total", "counter", "User cache lookups by result.",
+             [({"result": "hit"}, stats["hits"]), ({"result": "negative_hit"}, stats["negative_hits"]),
+              ({"result": "miss"}, stats["misses"])]),
+            ("user_cache_hit_ratio", "gauge", "User cache hit ratio since start.", [({}, stats["hit_ratio"])]),
+            ("user_cache_entries", "gauge", "Entries in the user cache.", [({}, stats["size"])])
+        ]
+
+    throttle = get_login_throttle()
+    if throttle is not None:
+        stats = throttle.stats()
+        families.append(("login_throttle_decisions_total", "counter", "Login throttle decisions by result.",
+                         [({"result": name}, stats[name]) for name in ("allowed", "throttled", "blocked")]))
+
+    flights = single_flight.stats()
+    families.append(("single_flight_in_flight", "gauge", "Distinct lookups currently in flight.",
+                     [({}, flights["in_flight"])]))
+    families.append(("single_flight_calls_total", "counter", "Coalesced lookup calls by role.",
+                     [({"role": name}, value) for name, value in flights.items() if name != "in_flight"]))
+
+    graph = group_graph._graph
+    if graph is not None:
+        families.append(("group_graph_groups", "gauge", "Groups in the cached group graph.",
+                         [({}, graph.stats()["groups"])]))
+
+    replica = directory_replica._replica
+    if replica is not None:
+        families.append(("directory_replica_lag_seconds", "gauge", "Seconds since the last successful replica sync.",
+                         [({}, replica.lag())]))
+
+    logs = logging_stats()
+    families += [
+        ("log_queue_depth", "gauge", "Log records waiting for the writer thread.", [({}, logs["queued"])]),
+        ("log_records_dropped_total", "counter", "Log records dropped because the queue was full.",
+         [({}, logs["dropped"])])
+    ]
+    return families
+
+registry.add_collector(_collect_runtime_stats)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,13 +1,180 @@
-from flask import Blueprint, jsonify
-from middleware.ldap_auth_middleware import get_user_details
+import hashlib
+import itertools
+import json
+import re
+
+from flask import Blueprint, Response, request, jsonify
+from ldap3.core.exceptions import LDAPInvalidFilterError
+from config import BATCH_CONFIG, CONCURRENCY_CONFIG, ETAG_CONFIG, USER_FIELDS_CONFIG
+from middleware.concurrency import offload, limiter, OverloadedError, UpstreamTimeoutError
+from middleware.ldap_auth_middleware import get_user_details, get_user_details_versioned, get_user_version, get_users_details, iter_directory_entries, FIELD_ATTRIBUTES
+from middleware.user_cache import MemoryBackend
+from utils.logger import audit, get_logger
+
+logger = get_logger(__name__)
 
 user_bp = Blueprint('user', __name__)
 
+@user_bp.route('/batch', methods=['POST'])
+def get_users_batch():
+    data = request.get_json(silent=True) or {}
+    lookups = {kind: data.get(kind) or [] for kind in ('usernames', 'mails', 'dns')}
+
+    if not all(isinstance(v, list) and all(isinstance(i, str) and i for i in v) for v in lookups.values()):
+        return jsonify({"error": "usernames, mails and dns must be lists of non-empty strings"}), 400
+    total = sum(len(v) for v in lookups.values())
+    if total == 0:
+        return jsonify({"error": "Nothing to look up"}), 400
+    if total > BATCH_CONFIG["MAX_ITEMS"]:
+        return jsonify({"error": f"At most {BATCH_CONFIG['MAX_ITEMS']} items per batch"}), 400
+
+    try:
+        results = offload('batch', get_users_details, **lookups)
+    except (OverloadedError, UpstreamTimeoutError):
+        raise
+    except Exception as e:
+        logger.error(f"LDAP batch search failed: {str(e)}")
+        audit("user.batch", items=total, status="error")
+        return jsonify({"error": "Directory lookup failed"}), 502
+    audit("user.batch", items=total, status="ok")
+
+    response = {}
+    for kind, found in results.items():
+        if lookups[kind]:
+            response[kind] = found
+            response[f"{kind}_not_found"] = [k for k, v in found.items() if v is None]
+    return jsonify(response), 200
+
+ATTRIBUTE_NAME = re.compile(r'^[A-Za-z][A-Za-z0-9-]*$')
+VALUE_RANGE = re.compile(r'^(\d+)-(\d+)$')
+
+def _ndjson(records):
+    try:
+        for record in records:
+            yield json.dumps(record, default=str) + "\n"
+    except Exception as e:
+        # headers are already sent; report the failure in-band as the last line
+        logger.error(f"LDAP export failed: {str(e)}")
+        yield json.dumps({"error": "Export aborted"}) + "\n"
+
+@user_bp.route('/export', methods=['GET'])
+def export_users():
+    attributes = [a.strip() for a in request.args.get('attributes', '').split(',') if a.strip()]
+    if not all(ATTRIBUTE_NAME.match(a) for a in attributes):
+        return jsonify({"error": "Invalid attribute name"}), 400
+
+    search_filter = request.args.get('filter', '').strip()
+    if search_filter and not (search_filter.startswith('(') and search_filter.endswith(')')):
+        return jsonify({"error": "filter must be a parenthesized LDAP filter"}), 400
+
+    # the stream runs on the request thread; the slot is held until it closes
+    limited = CONCURRENCY_CONFIG["ENABLED"]
+    if limited:
+        limiter.acquire('export')
+
+    records = iter_directory_entries(search_filter or None, attributes or None)
+    try:
+        # run the first page before answering so bad filters or an exhausted
+        # pool still produce a proper HTTP error instead of a truncated stream
+        first = list(itertools.islice(records, 1))
+    except Exception as e:
+        if limited:
+            limiter.release('export')
+        if isinstance(e, LDAPInvalidFilterError):
+            return jsonify({"error": "Invalid LDAP filter"}), 400
+        logger.error(f"LDAP export failed: {str(e)}")
+        audit("user.export", filter=search_filter, status="error")
+        return jsonify({"error": "Directory export failed"}), 502
+    audit("user.export", filter=search_filter, attributes=attributes, status="started")
+
+    # no Content-Length: Werkzeug/WSGI servers send this with chunked encoding
+    response = Response(_ndjson(itertools.chain(first, records)), mimetype='application/x-ndjson')
+    response.call_on_close(records.close)
+    if limited:
+        response.call_on_close(lambda: limiter.release('export'))
+    return response
+
+# (username, representation) -> (uSNChanged version, ETag) for group-less representations
+_validators = MemoryBackend(ETAG_CONFIG["VALIDATOR_MAX_ENTRIES"])
+
+def _etag(user_info):
+    # strong validator over the exact representation, so it is correct whatever the source
+    body = json.dumps(user_info, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()[:32]
+
+def _not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+def _version_or_none(username):
+    try:
+        return get_user_version(username)
+    except Exception as e:
+        logger.warning(f"uSNChanged read failed: {str(e)}")
+        return None
+
+def _load_user(username, groups, fields, groups_range, want_version):
+    if want_version:
+        # body and version from the same DC read; cached bodies get no validator
+        try:
+            return get_user_details_versioned(username, fields)
+        except Exception as e:
+            logger.warning(f"Versioned lookup failed, serving without a validator: {str(e)}")
+    return get_user_details(username, groups, fields, groups_range), None
+
 @user_bp.route('/<username>', methods=['GET'])
 def get_user(username):
-    user_info = get_user_details(username)
+    groups = request.args.get('groups', 'direct')
+    if groups not in ('direct', 'effective'):
+        return jsonify({"error": "groups must be 'direct' or 'effective'"}), 400
+
+    fields = None
+    if 'fields' in request.args:
+        fields = [f.strip() for f in request.args['fields'].split(',') if f.strip()]
+        unknown = [f for f in fields if f not in FIELD_ATTRIBUTES and f != 'username']
+        if unknown:
+            return jsonify({"error": f"Unknown fields: {', '.join(unknown)}", "allowed": sorted(FIELD_ATTRIBUTES)}), 400
+        fields = [f for f in fields if f != 'username']
+
+    groups_range = None
+    if 'groups_range' in request.args:
+        match = VALUE_RANGE.match(request.args['groups_range'])
+        if not match or int(match.group(1)) > int(match.group(2)):
+            return jsonify({"error": "groups_range must look like 0-999"}), 400
+        groups_range = (int(match.group(1)), int(match.group(2)))
+        if groups_range[1] - groups_range[0] + 1 > USER_FIELDS_CONFIG["MAX_RANGE"]:
+            return jsonify({"error": f"groups_range spans at most {USER_FIELDS_CONFIG['MAX_RANGE']} values"}), 400
+        if groups == 'effective':
+            return jsonify({"error": "groups_range cannot be combined with groups=effective"}), 400
+        fields = (fields if fields is not None else ['displayName', 'email']) + ['groups']
+
+    # memberOf is a back-link: membership changes do not bump the user's
+    # uSNChanged, so only representations without groups use the cheap check
+    validator_key = None
+    # only conditional requests pay for the versioned DC read; the rest go
+    # through the replica, the cache and single-flight like any lookup
+    if ETAG_CONFIG["ENABLED"] and request.if_none_match and fields is not None \
+            and 'groups' not in fields and groups == 'direct':
+        validator_key = json.dumps([username.strip().lower(), sorted(fields)])
+        validator = _validators.get(validator_key)
+        if validator is not None and request.if_none_match.contains(validator[1]):
+            if offload('user', _version_or_none, username) == validator[0]:
+                audit("user.lookup", target=username, groups=groups, status="not_modified")
+                return _not_modified(validator[1])
+
+    user_info, version = offload('user', _load_user, username, groups, fields, groups_range, validator_key is not None)
+    audit("user.lookup", target=username, groups=groups, status="found" if user_info else "not_found")
 
     if user_info:
-        return jsonify(user_info), 200
+        response = jsonify(user_info)
+        if ETAG_CONFIG["ENABLED"]:
+            etag = _etag(user_info)
+            if version is not None:
+                _validators.set(validator_key, [version, etag], ETAG_CONFIG["VALIDATOR_TTL"])
+            response.set_etag(etag)
+            # answers If-None-Match with 304 and no body
+            response = response.make_conditional(request)
+        return response
     else:
         return jsonify({"error": "User not found"}), 404
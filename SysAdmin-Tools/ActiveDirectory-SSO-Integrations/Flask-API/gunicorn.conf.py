@@ -0,0 +1,79 @@
+"""
+Production launch settings:  gunicorn -c gunicorn.conf.py
+
+The app is imported once in the master (preload_app) without touching the
+directory. Every worker then opens its own LDAP connections after fork (the
+middleware drops any inherited state through os.register_at_fork) and warms
+up before it accepts requests. On SIGTERM a worker reports not-ready on
+/health/ready, finishes in-flight requests within graceful_timeout, then
+unbinds its connections and flushes the audit log.
+
+With more than one worker, set METRICS_MULTIPROC_DIR (or PROMETHEUS_MULTIPROC_DIR)
+so /metrics reports all workers: the master clears it on start and folds
+each exited worker's counts into its archive.
+"""
+import os
+import signal
+
+wsgi_app = "app:app"
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", str(min(4, (os.cpu_count() or 1) * 2))))
+# LDAP calls block, so each worker serves requests from a thread pool
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# recycle workers now and then; jitter keeps them from restarting together
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+
+def on_starting(server):
+    from utils.metrics import clear_snapshots
+
+    # snapshots left by a previous run would be counted again
+    clear_snapshots()
+
+
+def when_ready(server):
+    from config import AUDIT_LOG_CONFIG, METRICS_CONFIG
+
+    if server.cfg.workers > 1 and "{pid}" not in AUDIT_LOG_CONFIG["PATH"]:
+        server.log.warning(f"AUDIT_LOG_PATH={AUDIT_LOG_CONFIG['PATH']} is shared by {server.cfg.workers} "
+                           "workers; add {pid} so each worker rotates its own file")
+    if server.cfg.workers > 1 and METRICS_CONFIG["ENABLED"] and not METRICS_CONFIG["MULTIPROC_DIR"]:
+        server.log.warning(f"METRICS_MULTIPROC_DIR is not set; /metrics on {server.cfg.workers} workers "
+                           "shows only the worker that answers each scrape")
+
+
+def post_worker_init(worker):
+    from app import warm_up
+    from controllers.health_controller import mark_draining
+
+    report = warm_up()
+    worker.log.info(f"Worker {worker.pid} warmed up: {report}")
+
+    # flip readiness as soon as the drain starts, then let gunicorn stop the worker
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def drain(signum, frame):
+        mark_draining()
+        if callable(previous):
+            previous(signum, frame)
+
+    signal.signal(signal.SIGTERM, drain)
+
+
+def worker_exit(server, worker):
+    from app import shutdown
+
+    shutdown()
+
+
+def child_exit(server, worker):
+    from utils.metrics import mark_process_dead
+
+    # runs in the master once the worker is gone, including after a timeout kill
+    mark_process_dead(worker.pid)
@@ -0,0 +1,154 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from config import CONCURRENCY_CONFIG
+
+
+class OverloadedError(Exception):
+    """Raised when an endpoint already has its maximum number of LDAP calls in flight."""
+
+    def __init__(self, endpoint):
+        super().__init__(f"Too many in-flight directory calls for '{endpoint}'")
+        self.endpoint = endpoint
+
+
+class UpstreamTimeoutError(Exception):
+    """Raised when an offloaded LDAP call does not finish within CALL_TIMEOUT."""
+
+
+def _parse_limits(spec):
+    limits = {}
+    for pair in spec.split(","):
+        name, sep, value = pair.strip().partition("=")
+        if sep and name:
+            limits[name] = int(value)
+    return limits
+
+
+class InflightLimiter:
+    """
+    Per-endpoint semaphores. A slot is held until the directory call itself
+    finishes, not until the HTTP request returns, so a slow DC cannot pile up
+    unbounded work behind requests that already timed out.
+    """
+
+    def __init__(self, limits, default_limit, queue_wait):
+        self.limits = limits
+        self.default_limit = default_limit
+        self.queue_wait = queue_wait
+        self._semaphores = {}
+        self._inflight = {}
+        self._rejected = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, name):
+        with self._lock:
+            if name not in self._semaphores:
+                self._semaphores[name] = threading.BoundedSemaphore(self.limits.get(name, self.default_limit))
+                self._inflight[name] = 0
+                self._rejected[name] = 0
+            return self._semaphores[name]
+
+    def acquire(self, name):
+        semaphore = self._semaphore(name)
+        if self.queue_wait > 0:
+            acquired = semaphore.acquire(timeout=self.queue_wait)
+        else:
+            acquired = semaphore.acquire(blocking=False)
+        with self._lock:
+            if acquired:
+                self._inflight[name] += 1
+            else:
+                self._rejected[name] += 1
+        if not acquired:
+            raise OverloadedError(name)
+
+    def release(self, name):
+        with self._lock:
+            self._inflight[name] -= 1
+        self._semaphores[name].release()
+
+    def reset(self):
+        """Drop all slots, e.g. those still held by the parent's threads after fork."""
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._inflight = {}
+        self._rejected = {}
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    "limit": self.limits.get(name, self.default_limit),
+                    "in_flight": self._inflight[name],
+                    "rejected": self._rejected[name]
+                }
+                for name in self._semaphores
+            }
+
+
+limiter = InflightLimiter(
+    _parse_limits(CONCURRENCY_CONFIG["LIMITS"]),
+    CONCURRENCY_CONFIG["DEFAULT_LIMIT"],
+    CONCURRENCY_CONFIG["QUEUE_WAIT"]
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=CONCURRENCY_CONFIG["WORKERS"],
+                                               thread_name_prefix="ldap-offload")
+    return _executor
+
+
+def offload(endpoint, fn, *args, **kwargs):
+    """
+    Run a blocking LDAP call on the shared executor under the endpoint's
+    in-flight limit. Raises OverloadedError when the limit is reached and
+    UpstreamTimeoutError when the call exceeds CALL_TIMEOUT.
+    """
+    if not CONCURRENCY_CONFIG["ENABLED"]:
+        return fn(*args, **kwargs)
+
+    limiter.acquire(endpoint)
+    try:
+        # carry the request context (e.g. Server-Timing entries) into the worker
+        future = _get_executor().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+    except Exception:
+        limiter.release(endpoint)
+        raise
+    future.add_done_callback(lambda _: limiter.release(endpoint))
+
+    try:
+        return future.result(timeout=CONCURRENCY_CONFIG["CALL_TIMEOUT"])
+    except FutureTimeoutError:
+        raise UpstreamTimeoutError(f"Directory call for '{endpoint}' timed out")
+
+
+def shutdown(wait=True):
+    """Stop accepting offloaded work and, by default, wait for running calls to finish."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def _reset_after_fork():
+    # executor threads and held slots belong to the parent
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+    limiter.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,274 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from ldap3.utils.conv import escape_filter_chars
+from config import LDAP_CONFIG, REPLICA_CONFIG, BATCH_CONFIG
+from middleware.group_graph import as_list
+from middleware.ldap_pool import get_pool
+from middleware.server_registry import read_dc_identity
+from utils.logger import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = get_logger(__name__)
+
+_ATTRIBUTES = ['cn', 'mail', 'memberOf', 'objectClass', 'uSNChanged']
+
+
+class DirectoryReplica:
+    """
+    SQLite index of the users and groups under BASE_DN. A full paged load
+    seeds it, then only entries whose uSNChanged is above the persisted
+    cookie are fetched, so a restart with an on-disk file is cheap.
+    memberOf is a back-link and does not bump a member's uSNChanged, so
+    the old and new members of every changed group are re-read as well.
+    USNs are local to each DC: syncs are pinned to the DC that produced the
+    cookie, and a different DC answering forces a full reload.
+
+    Several workers may open the same file. Only the one holding its
+    ".sync.lock" syncs; the others read the index and reload the sync state.
+    """
+
+    def __init__(self, pool, path, search_filter, key_attribute, page_size, chunk_size=100):
+        self.pool = pool
+        self.search_filter = search_filter
+        self.key_attribute = key_attribute
+        self.page_size = page_size
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._lock_fd = None if path == ":memory:" else \
+            os.open(path + ".sync.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        self._leading = self._lock_fd is None
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        tables = {row[0] for row in self._db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self._db.executescript(
+            "PRAGMA journal_mode=WAL;"
+            "CREATE TABLE IF NOT EXISTS users (key TEXT PRIMARY KEY, dn TEXT UNIQUE, data TEXT);"
+            "CREATE TABLE IF NOT EXISTS groups (dn TEXT PRIMARY KEY, member_of TEXT);"
+            "CREATE TABLE IF NOT EXISTS memberships (dn TEXT, group_dn TEXT, PRIMARY KEY (group_dn, dn));"
+            "CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, value TEXT);"
+        )
+        self.load_state()
+        if 'users' in tables and 'memberships' not in tables:
+            # file written before memberships were tracked: reload it once
+            self.full_synced_at = None
+            self._save_state(full_synced_at=0)
+
+    def load_state(self):
+        """(Re)read the sync cookie and timestamps, as written by whichever process syncs."""
+        self.highest_usn = int(self._state("highest_usn") or 0)
+        self.synced_at = float(self._state("synced_at") or 0) or None
+        self.full_synced_at = float(self._state("full_synced_at") or 0) or None
+        self.dc = self._state("dc")
+        self.dc_server = self._state("dc_server")
+
+    def lead(self):
+        """True when this process runs the sync: always in memory, else while holding the file lock."""
+        if self._leading:
+            return True
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(self._lock_fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        # held until the process exits; take over from where the previous syncer stopped
+        self._leading = True
+        self.load_state()
+        return True
+
+    def _state(self, name):
+        row = self._db.execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _save_state(self, **values):
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)",
+                                 [(k, str(v)) for k, v in values.items()])
+
+    def _scan(self, conn, search_filter):
+        attributes = list(dict.fromkeys(_ATTRIBUTES + [self.key_attribute]))
+        entries = conn.extend.standard.paged_search(
+            LDAP_CONFIG["BASE_DN"], search_filter, attributes=attributes,
+            paged_size=self.page_size, generator=True
+        )
+        return [e for e in entries if e.get('type') == 'searchResEntry']
+
+    def _scan_chunked(self, conn, attribute, values):
+        entries = []
+        for start in range(0, len(values), self.chunk_size):
+            filters = "".join(f"({attribute}={escape_filter_chars(v)})" for v in values[start:start + self.chunk_size])
+            entries += self._scan(conn, f"(&{self.search_filter}(|{filters}))")
+        return entries
+
+    def _apply(self, entries, advance=True, replace=False):
+        highest = 0 if replace else self.highest_usn
+        users, groups, memberships = [], [], []
+        for entry in entries:
+            attributes = entry['attributes']
+            usn = as_list(attributes.get('uSNChanged'))
+            highest = max(highest, int(usn[0]) if usn else 0)
+            memberships += [(entry['dn'], g.lower()) for g in as_list(attributes.get('memberOf'))]
+            classes = {c.lower() for c in as_list(attributes.get('objectClass'))}
+            if 'group' in classes:
+                groups.append((entry['dn'], json.dumps(as_list(attributes.get('memberOf')))))
+                continue
+            key = as_list(attributes.get(self.key_attribute))
+            if not key:
+                continue
+            member_of = as_list(attributes.get('memberOf'))
+            # same shape as ldap3's Attribute.value used by live lookups
+            data = {
+                "displayName": (as_list(attributes.get('cn')) or [None])[0],
+                "email": (as_list(attributes.get('mail')) or ["N/A"])[0],
+                "groups": member_of[0] if len(member_of) == 1 else member_of
+            }
+            users.append((str(key[0]).lower(), entry['dn'], json.dumps(data)))
+
+        with self._lock:
+            self._db.execute("BEGIN")
+            if replace:
+                # same transaction as the inserts, so readers never see an empty index
+                self._db.execute("DELETE FROM users")
+                self._db.execute("DELETE FROM groups")
+                self._db.execute("DELETE FROM memberships")
+            # a renamed account keeps its DN row but changes key, so replace by DN first
+            self._db.executemany("DELETE FROM users WHERE dn = ?", [(u[1],) for u in users])
+            self._db.executemany("INSERT OR REPLACE INTO users (key, dn, data) VALUES (?, ?, ?)", users)
+            self._db.executemany("INSERT OR REPLACE INTO groups (dn, member_of) VALUES (?, ?)", groups)
+            self._db.executemany("DELETE FROM memberships WHERE dn = ?", [(e['dn'],) for e in entries])
+            self._db.executemany("INSERT OR IGNORE INTO memberships (dn, group_dn) VALUES (?, ?)", memberships)
+            self._db.execute("COMMIT")
+        if advance:
+            self.highest_usn = highest
+        return len(users) + len(groups)
+
+    def _read_members(self, conn, group_dns, seen):
+        """Re-read the entries that are, or were, members of the changed groups."""
+        keys = [dn.lower() for dn in group_dns]
+        with self._lock:
+            previous = set()
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT dn FROM memberships WHERE group_dn IN ({','.join('?' * len(chunk))})", chunk)
+                previous |= {row[0] for row in rows}
+        members = self._scan_chunked(conn, 'memberOf', group_dns)
+        seen = seen | {e['dn'].lower() for e in members}
+        removed = [dn for dn in previous if dn.lower() not in seen]
+        return members + self._scan_chunked(conn, 'distinguishedName', removed)
+
+    def full_sync(self):
+        def scan(conn):
+            return read_dc_identity(conn), conn.server.name, self._scan(conn, self.search_filter)
+
+        dc, dc_server, entries = self.pool.execute(scan)
+        applied = self._apply(entries, replace=True)
+        self.dc, self.dc_server = dc, dc_server
+        self.synced_at = self.full_synced_at = time.time()
+        self._save_state(highest_usn=self.highest_usn, synced_at=self.synced_at, full_synced_at=self.full_synced_at,
+                         dc=dc, dc_server=dc_server)
+        return applied
+
+    def incremental_sync(self):
+        if self.full_synced_at is None:
+            return self.full_sync()
+
+        def scan(conn):
+            # every search of one sync runs on the same connection, hence the same DC
+            dc = read_dc_identity(conn)
+            if dc != self.dc:
+                return dc, None, None
+            entries = self._scan(conn, f"(&{self.search_filter}(uSNChanged>={self.highest_usn + 1}))")
+            changed_groups = [e['dn'] for e in entries
+                              if 'group' in {c.lower() for c in as_list(e['attributes'].get('objectClass'))}]
+            members = self._read_members(conn, changed_groups, {e['dn'].lower() for e in entries}) \
+                if changed_groups else []
+            return dc, entries, members
+
+        dc, entries, members = self.pool.execute(scan, prefer=self.dc_server)
+        if entries is None:
+            logger.warning(f"Directory replica served by {dc} instead of {self.dc}; "
+                           f"uSNChanged is per DC, reloading in full")
+            return self.full_sync()
+        applied = self._apply(entries)
+        if members:
+            # members are read after the cookie scan; their USNs must not move it past unseen changes
+            applied += self._apply(members, advance=False)
+        self.synced_at = time.time()
+        self._save_state(highest_usn=self.highest_usn, synced_at=self.synced_at)
+        return applied
+
+    def lag(self):
+        """Seconds since the last successful sync, or None before the first one."""
+        return None if self.synced_at is None else time.time() - self.synced_at
+
+    def lookup(self, username):
+        """Return (found, user_info) from the local index."""
+        with self._lock:
+            row = self._db.execute("SELECT data FROM users WHERE key = ?", (username.strip().lower(),)).fetchone()
+        if row is None:
+            return False, None
+        return True, dict(json.loads(row[0]), username=username)
+
+    def stats(self):
+        with self._lock:
+            users = self._db.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+            groups = self._db.execute("SELECT COUNT(*) FROM groups").fetchone()[0]
+        return {"users": users, "groups": groups, "highest_usn": self.highest_usn, "dc": self.dc, "lag": self.lag()}
+
+
+_replica = None
+_replica_lock = threading.Lock()
+
+
+def _sync_loop(replica):
+    while True:
+        try:
+            if not replica.lead():
+                # another worker syncs the shared file
+                replica.load_state()
+            elif replica.full_synced_at is None or \
+                    time.time() - replica.full_synced_at >= REPLICA_CONFIG["FULL_RESYNC_INTERVAL"]:
+                replica.full_sync()
+            else:
+                replica.incremental_sync()
+        except Exception as e:
+            logger.error(f"Directory replica sync failed: {str(e)}")
+        time.sleep(REPLICA_CONFIG["SYNC_INTERVAL"])
+
+
+def get_replica(key_attribute='sAMAccountName'):
+    """Return the process-wide replica (syncing in the background), or None when disabled."""
+    global _replica
+    if not REPLICA_CONFIG["ENABLED"]:
+        return None
+    if _replica is None:
+        with _replica_lock:
+            if _replica is None:
+                replica = DirectoryReplica(get_pool(), REPLICA_CONFIG["PATH"], REPLICA_CONFIG["FILTER"],
+                                           key_attribute, REPLICA_CONFIG["PAGE_SIZE"],
+                                           max(1, BATCH_CONFIG["CHUNK_SIZE"]))
+                threading.Thread(target=_sync_loop, args=(replica,),
+                                 name="directory-replica-sync", daemon=True).start()
+                _replica = replica
+    return _replica
+
+
+def _reset_after_fork():
+    # SQLite connections and the sync thread must not be shared with the parent
+    global _replica, _replica_lock
+    _replica = None
+    _replica_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,223 @@
+import os
+import threading
+import time
+
+from ldap3.utils.conv import escape_filter_chars
+from config import LDAP_CONFIG, BATCH_CONFIG, GROUP_GRAPH_CONFIG
+from middleware.ldap_pool import get_pool
+from middleware.server_registry import read_dc_identity
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+class GroupGraph:
+    """
+    In-memory group -> parent-groups index built from one paged scan of the
+    group objects under BASE_DN. Effective (transitive) membership is then
+    resolved without any per-request directory traffic.
+    """
+
+    def __init__(self, pool, base_dn, group_filter, page_size, chunk_size):
+        self.pool = pool
+        self.base_dn = base_dn
+        self.group_filter = group_filter
+        self.page_size = page_size
+        self.chunk_size = chunk_size
+
+        self._parents = {}   # group key -> set of parent keys
+        self._children = {}  # reverse index, used by incremental refreshes
+        self._names = {}     # group key -> DN as stored in the directory
+        self._closure = {}   # memoized transitive parents per group
+        self._highest_usn = 0
+        self._dc = None         # DC identity the USN cookie belongs to
+        self._dc_server = None  # its server name, to pin refreshes there
+        self._lock = threading.RLock()
+        self.built_at = None
+        self.refreshed_at = None
+
+    def _scan(self, conn, search_filter):
+        entries = conn.extend.standard.paged_search(
+            self.base_dn, search_filter, attributes=['memberOf', 'uSNChanged'],
+            paged_size=self.page_size, generator=True
+        )
+        for entry in entries:
+            if entry.get('type') != 'searchResEntry':
+                continue
+            attributes = entry['attributes']
+            usn = as_list(attributes.get('uSNChanged'))
+            yield entry['dn'], as_list(attributes.get('memberOf')), int(usn[0]) if usn else 0
+
+    def _scan_chunked(self, conn, attribute, values):
+        for start in range(0, len(values), self.chunk_size):
+            filters = "".join(f"({attribute}={escape_filter_chars(v)})" for v in values[start:start + self.chunk_size])
+            yield from self._scan(conn, f"(&{self.group_filter}(|{filters}))")
+
+    def _set_parents(self, dn, member_of):
+        key = dn.lower()
+        for parent in self._parents.get(key, ()):
+            self._children.get(parent, set()).discard(key)
+        parents = set()
+        for parent_dn in member_of:
+            parent = parent_dn.lower()
+            parents.add(parent)
+            self._names.setdefault(parent, parent_dn)
+            self._children.setdefault(parent, set()).add(key)
+        self._names[key] = dn
+        self._parents[key] = parents
+
+    def _remove(self, key):
+        for parent in self._parents.pop(key, ()):
+            self._children.get(parent, set()).discard(key)
+        self._names.pop(key, None)
+
+    def rebuild(self):
+        """Full paged scan of every group; also drops groups deleted since the last scan."""
+        def scan(conn):
+            return read_dc_identity(conn), conn.server.name, list(self._scan(conn, self.group_filter))
+
+        dc, dc_server, entries = self.pool.execute(scan)
+        with self._lock:
+            self._parents, self._children, self._names, self._closure = {}, {}, {}, {}
+            self._highest_usn = 0
+            self._dc, self._dc_server = dc, dc_server
+            for dn, member_of, usn in entries:
+                self._set_parents(dn, member_of)
+                self._highest_usn = max(self._highest_usn, usn)
+            self.built_at = self.refreshed_at = time.time()
+
+    def refresh(self):
+        """
+        Apply groups changed since the highest uSNChanged seen. Adding a group
+        to a group only bumps the parent's uSNChanged (member is the forward
+        link, memberOf a back-link), so the old and new children of every
+        changed group are re-read as well. USNs are local to each DC, so a
+        refresh answered by another DC than the last build rebuilds instead.
+        """
+        if self.built_at is None:
+            return self.rebuild()
+
+        since = self._highest_usn + 1
+
+        def incremental(conn):
+            if read_dc_identity(conn) != self._dc:
+                return None, None, None
+            changed = list(self._scan(conn, f"(&{self.group_filter}(uSNChanged>={since}))"))
+            if not changed:
+                return changed, [], set()
+            changed_dns = [dn for dn, _, _ in changed]
+            with self._lock:
+                previous = set()
+                for dn in changed_dns:
+                    previous |= self._children.get(dn.lower(), set())
+            children = list(self._scan_chunked(conn, 'memberOf', changed_dns))
+            seen = {dn.lower() for dn, _, _ in changed + children}
+            stale = [self._names.get(key, key) for key in previous - seen]
+            children += list(self._scan_chunked(conn, 'distinguishedName', stale))
+            return changed, children, set(k.lower() for k in stale)
+
+        changed, children, stale = self.pool.execute(incremental, prefer=self._dc_server)
+        if changed is None:
+            logger.warning(f"Group graph refresh not served by {self._dc}; uSNChanged is per DC, rebuilding")
+            return self.rebuild()
+        with self._lock:
+            if changed:
+                returned = set()
+                for dn, member_of, usn in changed + children:
+                    self._set_parents(dn, member_of)
+                    self._highest_usn = max(self._highest_usn, usn)
+                    returned.add(dn.lower())
+                for key in stale - returned:
+                    self._remove(key)
+                self._closure = {}
+            self.refreshed_at = time.time()
+
+    def _ancestors(self, key):
+        cached = self._closure.get(key)
+        if cached is not None:
+            return cached
+        seen = set()
+        stack = list(self._parents.get(key, ()))
+        while stack:
+            parent = stack.pop()
+            if parent in seen:
+                continue
+            seen.add(parent)
+            stack.extend(self._parents.get(parent, ()))
+        self._closure[key] = seen
+        return seen
+
+    def effective_groups(self, direct_groups):
+        """Direct groups plus every group they are nested in, cycles included once."""
+        with self._lock:
+            keys = set()
+            for dn in as_list(direct_groups):
+                key = dn.lower()
+                self._names.setdefault(key, dn)
+                keys.add(key)
+                keys |= self._ancestors(key)
+            return sorted(self._names[key] for key in keys)
+
+    def stats(self):
+        return {
+            "groups": len(self._parents),
+            "highest_usn": self._highest_usn,
+            "dc": self._dc,
+            "built_at": self.built_at,
+            "refreshed_at": self.refreshed_at
+        }
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def _refresh_loop(graph):
+    last_full = time.monotonic()
+    while True:
+        time.sleep(GROUP_GRAPH_CONFIG["REFRESH_INTERVAL"])
+        try:
+            if time.monotonic() - last_full >= GROUP_GRAPH_CONFIG["FULL_REBUILD_INTERVAL"]:
+                graph.rebuild()
+                last_full = time.monotonic()
+            else:
+                graph.refresh()
+        except Exception as e:
+            logger.warning(f"Group graph refresh failed: {str(e)}")
+
+
+def get_group_graph():
+    """Return the process-wide graph, building it on first use."""
+    global _graph
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                graph = GroupGraph(
+                    get_pool(),
+                    LDAP_CONFIG["BASE_DN"],
+                    GROUP_GRAPH_CONFIG["GROUP_FILTER"],
+                    GROUP_GRAPH_CONFIG["PAGE_SIZE"],
+                    max(1, BATCH_CONFIG["CHUNK_SIZE"])
+                )
+                graph.rebuild()
+                threading.Thread(target=_refresh_loop, args=(graph,),
+                                 name="group-graph-refresh", daemon=True).start()
+                _graph = graph
+    return _graph
+
+
+def _reset_after_fork():
+    # the refresh thread does not survive fork; rebuild in the worker
+    global _graph, _graph_lock
+    _graph = None
+    _graph_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,33 +1,356 @@
-from ldap3 import Server, Connection, ALL, NTLM
-from config import LDAP_CONFIG
+import re
+import time
+
+from ldap3 import Connection, NTLM
+from ldap3.core.exceptions import LDAPCommunicationError
+from ldap3.utils.conv import escape_filter_chars
+from config import LDAP_CONFIG, BATCH_CONFIG, EXPORT_CONFIG, REPLICA_CONFIG, USER_FIELDS_CONFIG
+from middleware.directory_replica import get_replica
+from middleware.group_graph import get_group_graph, as_list
+from middleware.ldap_pool import get_pool
+from middleware.server_registry import get_auth_servers, selector
+from middleware.single_flight import coalesce
+from middleware.user_cache import get_user_cache
+from utils.logger import get_logger, set_context_field
+from utils.metrics import LDAP_BIND_DURATION, timed
+
+logger = get_logger(__name__)
+
+USER_ATTRIBUTES = ['cn', 'mail', 'memberOf', 'sAMAccountName']
+
+# allow-list of ?fields= names and the directory attribute each one reads
+FIELD_ATTRIBUTES = {"displayName": "cn", "email": "mail", "groups": "memberOf"}
+FIELD_ATTRIBUTES.update({field: field for field in USER_FIELDS_CONFIG["EXTRA_FIELDS"]})
+DEFAULT_FIELDS = ("displayName", "email", "groups")
 
 def authenticate_user(username, password):
-    server = Server(LDAP_CONFIG["LDAP_SERVER"], get_info=ALL)
-    user_dn = f"{LDAP_CONFIG['BIND_DN']}"
+    # The user's own NTLM bind cannot share the service account's sockets,
+    # but it reuses the shared (bind-only) Server descriptors and fails over
+    # to the next DC when one is unreachable.
+    for url, server in get_auth_servers():
+        set_context_field("dc", url)
+        started = time.monotonic()
+        try:
+            with timed(LDAP_BIND_DURATION, "ldap-bind", server=url, kind="user") as timer:
+                try:
+                    conn = Connection(server, user=username, password=password, authentication=NTLM, auto_bind=True)
+                except LDAPCommunicationError:
+                    timer.outcome = "unreachable"
+                    raise
+                except Exception:
+                    timer.outcome = "rejected"
+                    raise
+            selector.record_success(url, time.monotonic() - started)
+            conn.unbind()
+            return True
+        except LDAPCommunicationError as e:
+            selector.record_failure(url, e)
+            logger.warning(f"LDAP server {url} unreachable: {str(e)}")
+        except Exception as e:
+            logger.info(f"Authentication failed: {str(e)}")
+            return False
+    return False
+
+def _user_filter(username):
+    return LDAP_CONFIG["USER_SEARCH_FILTER"].format(username=escape_filter_chars(username))
+
+def _to_user_info(user_data, username, fields=DEFAULT_FIELDS):
+    user_info = {"username": username}
+    for field in fields:
+        if field == "displayName":
+            user_info["displayName"] = user_data.cn.value
+        elif field == "email":
+            user_info["email"] = user_data.mail.value if hasattr(user_data, 'mail') else "N/A"
+        elif field == "groups":
+            user_info["groups"] = user_data.memberOf.value if hasattr(user_data, 'memberOf') else []
+        else:
+            attribute = FIELD_ATTRIBUTES[field]
+            user_info[field] = user_data[attribute].value if attribute in user_data else None
+    return user_info
+
+def _search_user(username, fields=DEFAULT_FIELDS):
+    # only the attributes behind the requested fields leave the DC
+    attributes = [FIELD_ATTRIBUTES[field] for field in fields] or ['1.1']
+
+    def search(conn):
+        conn.search(LDAP_CONFIG["BASE_DN"], _user_filter(username), attributes=attributes)
+        return conn.entries[0] if conn.entries else None
+
+    user_data = get_pool().execute(search)
     
+    if user_data is not None:
+        return _to_user_info(user_data, username, fields)
+    return None
+
+# userAccountControl flag of a disabled account
+ACCOUNTDISABLE = 0x2
+
+def get_session_groups(username):
+    """
+    Direct groups for issuing or refreshing a session token, read from the DC
+    (never the cache or the replica) together with the account state. None
+    when the account no longer exists or is disabled; directory errors are
+    raised, so a token is never issued with groups from a failed lookup.
+    """
+    def search(conn):
+        conn.search(LDAP_CONFIG["BASE_DN"], _user_filter(username), attributes=['memberOf', 'userAccountControl'])
+        if not conn.entries:
+            return None
+        entry = conn.entries[0]
+        flags = entry.userAccountControl.value if 'userAccountControl' in entry else 0
+        if int(flags or 0) & ACCOUNTDISABLE:
+            return None
+        return as_list(entry.memberOf.value) if 'memberOf' in entry else []
+
+    return get_pool().execute(search)
+
+def get_user_version(username):
+    """
+    Read only uSNChanged, as "<server>:<usn>" since USNs are local to each DC;
+    None when the user does not exist or the attribute is not readable.
+    Linked attributes (memberOf) do not bump it, so it can only validate
+    representations that leave the groups out.
+    """
+    def search(conn):
+        conn.search(LDAP_CONFIG["BASE_DN"], _user_filter(username), attributes=['uSNChanged'])
+        if not conn.entries or 'uSNChanged' not in conn.entries[0]:
+            return None
+        return f"{conn.server.name}:{conn.entries[0].uSNChanged.value}"
+
+    return get_pool().execute(search)
+
+def get_user_details_versioned(username, fields):
+    """
+    Fetch the requested fields and uSNChanged in one search, so the version
+    describes exactly the entry that was read. Always goes to the DC: a body
+    from the cache or the replica may predate the version read next to it.
+    Returns (user_info, version) or (None, None) when the user does not exist.
+    """
+    attributes = [FIELD_ATTRIBUTES[field] for field in fields] + ['uSNChanged']
+
+    def search(conn):
+        conn.search(LDAP_CONFIG["BASE_DN"], _user_filter(username), attributes=attributes)
+        if not conn.entries:
+            return None, None
+        entry = conn.entries[0]
+        version = f"{conn.server.name}:{entry.uSNChanged.value}" if 'uSNChanged' in entry else None
+        return _to_user_info(entry, username, fields), version
+
+    return get_pool().execute(search)
+
+def _search_user_ranged(username, fields, start, end):
+    """
+    Fetch memberOf;range=start-end so very large memberships come back in
+    bounded chunks. The caller asks for the next chunk while "more" is true.
+    """
+    other_fields = [field for field in fields if field != "groups"]
+    attributes = [FIELD_ATTRIBUTES[field] for field in other_fields]
+    attributes.append(f"memberOf;range={start}-{end}")
+
+    def search(conn):
+        # ldap3 would otherwise transparently fetch every remaining range
+        auto_range = conn.auto_range
+        conn.auto_range = False
+        try:
+            conn.search(LDAP_CONFIG["BASE_DN"], _user_filter(username), attributes=attributes)
+            # ranged attribute names ("memberOf;range=0-*") are read from the raw response
+            entries = [r for r in conn.response or [] if r.get('type') == 'searchResEntry']
+            return entries[0]['attributes'] if entries else None
+        finally:
+            conn.auto_range = auto_range
+
+    found = get_pool().execute(search)
+    if found is None:
+        return None
+
+    user_info = {"username": username}
+    for field in other_fields:
+        values = as_list(found.get(FIELD_ATTRIBUTES[field]))
+        if field == "email":
+            user_info[field] = values[0] if values else "N/A"
+        else:
+            user_info[field] = values[0] if len(values) == 1 else (values or None)
+
+    values, last, more = [], start - 1, False
+    for name, attribute_values in found.items():
+        option = name.lower()
+        if option == "memberof" or option.startswith("memberof;range="):
+            values = as_list(attribute_values)
+            upper = option.partition("range=")[2].partition("-")[2]
+            more = upper not in ("", "*")
+            last = int(upper) if more else start + len(values) - 1
+            break
+    user_info["groups"] = values
+    user_info["groupsRange"] = {"start": start, "end": last, "more": more}
+    return user_info
+
+def _project(user_info, fields):
+    keep = set(fields) | {"username", "replicaLag", "directGroups", "groupsPartial"}
+    return {key: value for key, value in user_info.items() if key in keep}
+
+def _with_effective_groups(user_info):
+    # transitive membership comes from the in-memory group graph, not the DC
+    direct = as_list(user_info["groups"])
     try:
-        conn = Connection(server, user=username, password=password, authentication=NTLM, auto_bind=True)
-        return True
+        effective = get_group_graph().effective_groups(direct)
     except Exception as e:
-        print(f"Authentication failed: {str(e)}")
-        return False
+        # without the graph only the direct groups are known; say so rather than fail the lookup
+        logger.error(f"Group graph unavailable, returning direct groups only: {str(e)}")
+        return dict(user_info, directGroups=direct, groups=direct, groupsPartial=True)
+    return dict(user_info, directGroups=direct, groups=effective)
 
-def get_user_details(username):
-    server = Server(LDAP_CONFIG["LDAP_SERVER"], get_info=ALL)
-    
-    try:
-        conn = Connection(server, LDAP_CONFIG["BIND_DN"], LDAP_CONFIG["BIND_PASSWORD"], auto_bind=True)
-        conn.search(LDAP_CONFIG["BASE_DN"], LDAP_CONFIG["USER_SEARCH_FILTER"].format(username=username), attributes=['cn', 'mail', 'memberOf'])
-        
-        if conn.entries:
-            user_data = conn.entries[0]
-            return {
-                "username": username,
-                "displayName": user_data.cn.value,
-                "email": user_data.mail.value if hasattr(user_data, 'mail') else "N/A",
-                "groups": user_data.memberOf.value if hasattr(user_data, 'memberOf') else []
-            }
+def _from_replica(username):
+    replica = get_replica(_username_attribute())
+    if replica is None:
+        return False, None
+    lag = replica.lag()
+    if lag is None or lag > REPLICA_CONFIG["MAX_LAG"]:
+        return False, None
+    found, user_info = replica.lookup(username)
+    # a synced replica is authoritative, so a miss there is a definitive "not found"
+    return True, dict(user_info, replicaLag=round(lag, 3)) if found else None
+
+def get_user_details(username, groups='direct', fields=None, groups_range=None):
+    projected = fields is not None
+    fields = tuple(fields) if projected else DEFAULT_FIELDS
+    if groups == 'effective' and 'groups' not in fields:
+        fields += ('groups',)
+
+    if groups_range is not None:
+        try:
+            return _search_user_ranged(username, fields, *groups_range)
+        except Exception as e:
+            logger.error(f"LDAP search failed: {str(e)}")
+            return None
+
+    # the replica and the cache hold the default fields only
+    servable = set(fields) <= set(DEFAULT_FIELDS)
+    found, user_info = _from_replica(username) if servable else (False, None)
+
+    cache = get_user_cache()
+    if not found and servable and cache is not None:
+        found, user_info = cache.get(username)
+
+    if not found:
+        # concurrent identical lookups share a single directory search
+        def recheck():
+            if cache is None or fields != DEFAULT_FIELDS:
+                return False, None
+            return cache.get(username)
+
+        def lookup():
+            user_info = _search_user(username, fields)
+            if cache is not None and (fields == DEFAULT_FIELDS or user_info is None):
+                cache.set(username, user_info)
+            return user_info
+
+        try:
+            user_info = coalesce(("user", username.strip().lower(), fields), lookup, recheck)
+        except Exception as e:
+            # directory errors are never cached, only definitive answers
+            logger.error(f"LDAP search failed: {str(e)}")
+            return None
+
+    if user_info is None:
         return None
-    except Exception as e:
-        print(f"LDAP search failed: {str(e)}")
+    if groups == 'effective':
+        user_info = _with_effective_groups(user_info)
+    return _project(user_info, fields) if projected else user_info
+
+def _username_attribute():
+    # attribute USER_SEARCH_FILTER matches on, used to map results back to input
+    match = re.search(r'\((\w+)=\{username\}\)', LDAP_CONFIG["USER_SEARCH_FILTER"])
+    return match.group(1) if match else 'sAMAccountName'
+
+def _entry_value(entry, attribute):
+    if attribute == 'distinguishedName':
+        return entry.entry_dn
+    if attribute not in entry:
         return None
+    value = entry[attribute].value
+    return value[0] if isinstance(value, list) else value
+
+def get_users_details(usernames=(), mails=(), dns=()):
+    """
+    Resolve many accounts with chunked (|...) filters over one pooled
+    connection. Returns {kind: {input: user_info or None}} for each kind.
+    """
+    username_attr = _username_attribute()
+    lookups = [
+        ("usernames", list(dict.fromkeys(usernames)), username_attr, _user_filter),
+        ("mails", list(dict.fromkeys(mails)), 'mail', lambda v: f"(mail={escape_filter_chars(v)})"),
+        ("dns", list(dict.fromkeys(dns)), 'distinguishedName', lambda v: f"(distinguishedName={escape_filter_chars(v)})"),
+    ]
+    attributes = list(dict.fromkeys(USER_ATTRIBUTES + ([username_attr] if username_attr != 'distinguishedName' else [])))
+    chunk_size = max(1, BATCH_CONFIG["CHUNK_SIZE"])
+    cache = get_user_cache()
+    results = {}
+    pending = {}
+
+    for kind, values, attribute, make_filter in lookups:
+        results[kind] = {}
+        pending[kind] = []
+        for value in values:
+            if kind == "usernames" and cache is not None:
+                found, user_info = cache.get(value)
+                if found:
+                    results[kind][value] = user_info
+                    continue
+            pending[kind].append(value)
+
+    def search(conn):
+        # one (|...) search per chunk, whatever the number of names in it
+        matches = {}
+        for kind, values, attribute, make_filter in lookups:
+            todo = pending[kind]
+            for start in range(0, len(todo), chunk_size):
+                filters = [make_filter(value) for value in todo[start:start + chunk_size]]
+                search_filter = filters[0] if len(filters) == 1 else "(|" + "".join(filters) + ")"
+                conn.search(LDAP_CONFIG["BASE_DN"], search_filter, attributes=attributes)
+                for entry in conn.entries:
+                    key = _entry_value(entry, attribute)
+                    if key is not None:
+                        matches[(kind, str(key).lower())] = entry
+        return matches
+
+    matches = get_pool().execute(search) if any(pending.values()) else {}
+
+    for kind, values in pending.items():
+        for value in values:
+            entry = matches.get((kind, value.lower()))
+            if entry is None:
+                user_info = None
+            elif kind == "usernames":
+                user_info = _to_user_info(entry, value)
+            else:
+                user_info = _to_user_info(entry, _entry_value(entry, 'sAMAccountName') or value)
+            results[kind][value] = user_info
+            if kind == "usernames" and cache is not None:
+                cache.set(value, user_info)
+
+    return results
+
+def iter_directory_entries(search_filter=None, attributes=None):
+    """
+    Yield {"dn": ..., <attribute>: ...} for every user under BASE_DN, one page
+    at a time, so memory stays flat regardless of the size of the domain. The
+    pooled connection is held until the generator is exhausted or closed.
+    """
+    combined_filter = EXPORT_CONFIG["BASE_FILTER"]
+    if search_filter:
+        combined_filter = f"(&{combined_filter}{search_filter})"
+
+    with get_pool().connection() as conn:
+        entries = conn.extend.standard.paged_search(
+            LDAP_CONFIG["BASE_DN"],
+            combined_filter,
+            attributes=attributes or EXPORT_CONFIG["DEFAULT_ATTRIBUTES"],
+            paged_size=EXPORT_CONFIG["PAGE_SIZE"],
+            generator=True
+        )
+        for entry in entries:
+            if entry.get('type') != 'searchResEntry':
+                continue
+            record = {"dn": entry['dn']}
+            record.update(entry['attributes'])
+            yield record
@@ -0,0 +1,254 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from ldap3 import Connection, BASE
+from ldap3.core.exceptions import LDAPException, LDAPBindError, LDAPCommunicationError, LDAPSocketOpenError
+from config import LDAP_CONFIG, LDAP_POOL_CONFIG
+from middleware.server_registry import get_servers, selector, start_background_refresh, start_health_probes
+from utils.logger import get_logger, set_context_field
+from utils.metrics import LDAP_BIND_DURATION, LDAP_SEARCH_DURATION, timed
+
+logger = get_logger(__name__)
+
+
+class PoolExhaustedError(Exception):
+    """Raised when no pooled connection becomes available within POOL_TIMEOUT."""
+
+
+class _PooledConnection:
+    def __init__(self, conn, url):
+        self.conn = conn
+        self.url = url
+        self.created = time.monotonic()
+        self.last_used = self.created
+
+
+class LdapConnectionPool:
+    """
+    Fixed-size pool of long-lived connections bound as the service account.
+
+    Connections are opened lazily, health-checked when they have been idle for
+    longer than HEALTH_CHECK_INTERVAL, recycled after MAX_LIFETIME and rebuilt
+    transparently when the socket turns out to be stale or reset. New
+    connections go to the fastest available server and fail over to the next
+    one; connections to a server that gets ejected are not handed out again.
+    """
+
+    def __init__(self, servers, user, password, size=10, timeout=5.0,
+                 health_check_interval=30.0, max_lifetime=3600.0, receive_timeout=10.0):
+        self.servers = servers
+        self.user = user
+        self.password = password
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.max_lifetime = max_lifetime
+        self.receive_timeout = receive_timeout
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._rebinds = 0
+        self._closed = False
+
+    def _open(self, prefer=None):
+        last_error = None
+        servers = self.servers()
+        if prefer is not None:
+            # the pinned DC goes first while it is healthy, otherwise normal failover
+            servers.sort(key=lambda s: not (s[1].name == prefer and selector.is_available(s[0])))
+        for url, server in servers:
+            started = time.monotonic()
+            conn = Connection(server, self.user, self.password,
+                              receive_timeout=self.receive_timeout)
+            try:
+                with timed(LDAP_BIND_DURATION, "ldap-bind", server=url, kind="service") as timer:
+                    bound = conn.bind()
+                    if not bound:
+                        timer.outcome = "rejected"
+            except LDAPCommunicationError as e:
+                selector.record_failure(url, e)
+                last_error = e
+                continue
+            if not bound:
+                raise LDAPBindError(f"Service account bind failed: {conn.last_error}")
+            selector.record_success(url, time.monotonic() - started)
+            with self._lock:
+                self._opened += 1
+            return _PooledConnection(conn, url)
+        raise last_error or LDAPSocketOpenError("No LDAP server configured")
+
+    def _discard(self, pooled):
+        try:
+            pooled.conn.unbind()
+        except Exception:
+            pass
+
+    def _is_healthy(self, pooled):
+        conn = pooled.conn
+        if conn.closed or not conn.bound or not selector.is_available(pooled.url):
+            return False
+        now = time.monotonic()
+        if now - pooled.created > self.max_lifetime:
+            return False
+        if now - pooled.last_used > self.health_check_interval:
+            # cheap root DSE read; only the round trip matters, not the result
+            try:
+                conn.search("", "(objectClass=*)", search_scope=BASE, attributes=["1.1"])
+            except LDAPException as e:
+                selector.record_failure(pooled.url, e)
+                return False
+        return True
+
+    def _checkout(self, prefer=None):
+        skipped = []
+        try:
+            while True:
+                try:
+                    pooled = self._idle.get_nowait()
+                except queue.Empty:
+                    if skipped:
+                        # the pinned connection replaces one to another DC, keeping the pool at its size
+                        self._discard(skipped.pop())
+                    return self._open(prefer)
+                if not self._is_healthy(pooled):
+                    self._discard(pooled)
+                elif prefer is None or pooled.conn.server.name == prefer:
+                    return pooled
+                else:
+                    skipped.append(pooled)
+        finally:
+            for pooled in skipped:
+                self._idle.put(pooled)
+
+    def _checkin(self, pooled):
+        pooled.last_used = time.monotonic()
+        if self._closed:
+            self._discard(pooled)
+        else:
+            self._idle.put(pooled)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a bound connection; waits at most POOL_TIMEOUT when the pool is exhausted."""
+        with self._borrow() as pooled:
+            yield pooled.conn
+
+    @contextmanager
+    def _borrow(self, prefer=None):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolExhaustedError(f"No LDAP connection available after {self.timeout}s")
+        pooled = None
+        try:
+            pooled = self._checkout(prefer)
+            yield pooled
+        except LDAPCommunicationError as e:
+            # broken socket: never hand it out again, and steer new connections elsewhere
+            if pooled is not None:
+                selector.record_failure(pooled.url, e)
+                self._discard(pooled)
+                pooled = None
+            raise
+        finally:
+            if pooled is not None:
+                self._checkin(pooled)
+            self._slots.release()
+
+    def _run(self, operation, prefer=None):
+        with self._borrow(prefer) as pooled:
+            set_context_field("dc", pooled.url)
+            with timed(LDAP_SEARCH_DURATION, "ldap-search", server=pooled.url):
+                return operation(pooled.conn)
+
+    def execute(self, operation, prefer=None):
+        """
+        Run operation(conn) on a pooled connection. A stale or reset socket is
+        replaced with a freshly bound connection and the operation retried once.
+        prefer pins the operation to that server (conn.server.name) while it is
+        available; callers must still check which DC actually served them.
+        """
+        try:
+            return self._run(operation, prefer)
+        except LDAPCommunicationError as e:
+            logger.warning(f"LDAP connection lost, rebinding: {str(e)}")
+            with self._lock:
+                self._rebinds += 1
+            # idle sockets to the same DC are most likely dead as well;
+            # the retry opens a connection to the next available server
+            self._drain_idle()
+            return self._run(operation, prefer)
+
+    def warm(self, count):
+        """Open up to count connections ahead of traffic so first requests skip the bind."""
+        opened = []
+        try:
+            for _ in range(min(count, self.size) - self._idle.qsize()):
+                opened.append(self._open())
+        finally:
+            for pooled in opened:
+                self._checkin(pooled)
+        return len(opened)
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "opened": self._opened,
+            "rebinds": self._rebinds
+        }
+
+    def _drain_idle(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def close(self):
+        self._closed = True
+        self._drain_idle()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = LdapConnectionPool(
+                    get_servers,
+                    LDAP_CONFIG["BIND_DN"],
+                    LDAP_CONFIG["BIND_PASSWORD"],
+                    size=LDAP_POOL_CONFIG["POOL_SIZE"],
+                    timeout=LDAP_POOL_CONFIG["POOL_TIMEOUT"],
+                    health_check_interval=LDAP_POOL_CONFIG["HEALTH_CHECK_INTERVAL"],
+                    max_lifetime=LDAP_POOL_CONFIG["MAX_LIFETIME"],
+                    receive_timeout=LDAP_POOL_CONFIG["RECEIVE_TIMEOUT"]
+                )
+                start_background_refresh(_pool)
+                start_health_probes()
+    return _pool
+
+
+def close_pool():
+    """Unbind the idle connections of the process-wide pool, if one was created."""
+    if _pool is not None:
+        _pool.close()
+
+
+def _reset_after_fork():
+    # a forked worker must never talk over the parent's sockets; it opens its own
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,210 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import LOGIN_THROTTLE_CONFIG
+
+
+class MemoryStateStore:
+    """Per-process throttle state, bounded by evicting the least recently touched keys."""
+
+    name = "memory"
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def update(self, key, fn):
+        """Atomically replace the state of key with fn(state) -> (state, result); returns result."""
+        with self._lock:
+            state, result = fn(self._data.get(key))
+            self._data[key] = state
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_keys:
+                self._data.popitem(last=False)
+            return result
+
+    def size(self):
+        return len(self._data)
+
+
+class SqliteStateStore:
+    """Throttle state in a SQLite file, so every worker on the host sees the same buckets."""
+
+    name = "sqlite"
+
+    def __init__(self, path, max_age):
+        self.path = path
+        self.max_age = max_age
+        self._local = threading.local()
+        self._writes = 0
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS login_throttle (key TEXT PRIMARY KEY, state TEXT, updated REAL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def update(self, key, fn):
+        conn = self._conn()
+        now = time.time()
+        # IMMEDIATE takes the write lock up front so concurrent workers serialize per update
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT state FROM login_throttle WHERE key = ?", (key,)).fetchone()
+            state, result = fn(json.loads(row[0]) if row else None)
+            conn.execute("INSERT OR REPLACE INTO login_throttle (key, state, updated) VALUES (?, ?, ?)",
+                         (key, json.dumps(state), now))
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                conn.execute("DELETE FROM login_throttle WHERE updated < ?", (now - self.max_age,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def size(self):
+        return self._conn().execute("SELECT COUNT(*) FROM login_throttle").fetchone()[0]
+
+
+class LoginThrottle:
+    """
+    Token buckets keyed on client IP and on account name, plus a failure
+    counter per key that blocks the key for an exponentially growing period
+    once it has more than its allowance of recent failed logins. Checked before
+    any LDAP work, so rejected attempts never reach a DC.
+    """
+
+    def __init__(self, store, limits, free_failures, backoff_base, backoff_max, failure_window):
+        self.store = store
+        self.limits = limits
+        self.free_failures = free_failures
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_window = failure_window
+        self._lock = threading.Lock()
+        self._counters = {"allowed": 0, "throttled": 0, "blocked": 0}
+
+    def _fresh(self, kind, now):
+        return {"tokens": float(self.limits[kind][0]), "updated": now, "failures": 0,
+                "last_failure": 0.0, "blocked_until": 0.0}
+
+    def _admit(self, kind, key):
+        burst, per_second = self.limits[kind]
+
+        def admit(state):
+            now = time.time()
+            state = state or self._fresh(kind, now)
+            state["tokens"] = min(burst, state["tokens"] + (now - state["updated"]) * per_second)
+            state["updated"] = now
+            if state["blocked_until"] > now:
+                return state, ("blocked", state["blocked_until"] - now)
+            if state["tokens"] < 1:
+                return state, ("throttled", (1 - state["tokens"]) / per_second if per_second else self.backoff_max)
+            state["tokens"] -= 1
+            return state, ("allowed", 0.0)
+
+        return self.store.update(f"{kind}:{key}", admit)
+
+    def check(self, username, ip):
+        """Return 0 when the attempt may proceed, otherwise the seconds to wait before retrying."""
+        for kind, key in (("ip", ip), ("user", username)):
+            if not key:
+                continue
+            outcome, retry_after = self._admit(kind, key)
+            if outcome != "allowed":
+                with self._lock:
+                    self._counters[outcome] += 1
+                return max(1, math.ceil(retry_after))
+        with self._lock:
+            self._counters["allowed"] += 1
+        return 0
+
+    def record_failure(self, username, ip):
+        def fail(kind):
+            def apply(state):
+                now = time.time()
+                state = state or self._fresh(kind, now)
+                if now - state["last_failure"] > self.failure_window:
+                    state["failures"] = 0
+                state["failures"] += 1
+                state["last_failure"] = now
+                excess = state["failures"] - self.free_failures[kind]
+                if excess > 0:
+                    state["blocked_until"] = now + min(self.backoff_max, self.backoff_base * 2 ** (excess - 1))
+                return state, None
+            return apply
+
+        for kind, key in (("ip", ip), ("user", username)):
+            if key:
+                self.store.update(f"{kind}:{key}", fail(kind))
+
+    def record_success(self, username, ip):
+        # only the account is forgiven; a spraying IP keeps its failure history
+        def reset(state):
+            state = state or self._fresh("user", time.time())
+            state["failures"] = 0
+            state["blocked_until"] = 0.0
+            return state, None
+
+        if username:
+            self.store.update(f"user:{username}", reset)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, keys=self.store.size(), backend=self.store.name)
+
+
+_throttle = None
+_throttle_lock = threading.Lock()
+
+
+def get_login_throttle():
+    """Return the process-wide throttle, or None when LOGIN_THROTTLE_ENABLED is false."""
+    global _throttle
+    if not LOGIN_THROTTLE_CONFIG["ENABLED"]:
+        return None
+    if _throttle is None:
+        with _throttle_lock:
+            if _throttle is None:
+                if LOGIN_THROTTLE_CONFIG["BACKEND"] == "sqlite":
+                    store = SqliteStateStore(LOGIN_THROTTLE_CONFIG["SQLITE_PATH"],
+                                             max(LOGIN_THROTTLE_CONFIG["FAILURE_WINDOW"],
+                                                 LOGIN_THROTTLE_CONFIG["BACKOFF_MAX"]))
+                else:
+                    store = MemoryStateStore(LOGIN_THROTTLE_CONFIG["MAX_KEYS"])
+                _throttle = LoginThrottle(
+                    store,
+                    {
+                        "ip": (LOGIN_THROTTLE_CONFIG["IP_BURST"], LOGIN_THROTTLE_CONFIG["IP_PER_MINUTE"] / 60.0),
+                        "user": (LOGIN_THROTTLE_CONFIG["USER_BURST"], LOGIN_THROTTLE_CONFIG["USER_PER_MINUTE"] / 60.0)
+                    },
+                    {"ip": LOGIN_THROTTLE_CONFIG["IP_FREE_FAILURES"], "user": LOGIN_THROTTLE_CONFIG["USER_FREE_FAILURES"]},
+                    LOGIN_THROTTLE_CONFIG["BACKOFF_BASE"],
+                    LOGIN_THROTTLE_CONFIG["BACKOFF_MAX"],
+                    LOGIN_THROTTLE_CONFIG["FAILURE_WINDOW"]
+                )
+    return _throttle
+
+
+def _reset_after_fork():
+    # SQLite connections must not cross fork
+    global _throttle, _throttle_lock
+    _throttle = None
+    _throttle_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,248 @@
+import os
+import threading
+import time
+
+from ldap3 import Server, Connection, ALL, DSA, SCHEMA, NONE, BASE
+from ldap3.core.exceptions import LDAPException, LDAPCommunicationError
+from config import LDAP_CONFIG, LDAP_POOL_CONFIG, LDAP_SERVER_INFO_CONFIG, LDAP_SERVER_HEALTH_CONFIG
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_GET_INFO = {"ALL": ALL, "DSA": DSA, "SCHEMA": SCHEMA, "NO_INFO": NONE, "NONE": NONE}
+
+_servers = {}
+_lock = threading.Lock()
+_refresher = None
+_prober = None
+
+
+def server_urls():
+    """LDAP_SERVER as a list; it may be a single URL, a comma-separated string or a list."""
+    value = LDAP_CONFIG["LDAP_SERVER"]
+    if isinstance(value, str):
+        value = value.split(",")
+    return [url.strip() for url in value if url.strip()]
+
+
+class ServerSelector:
+    """
+    Latency-aware ordering of the configured servers. Servers that fail are
+    ejected for an exponentially growing backoff; the rest are ordered by a
+    moving average of the RTT measured by probes and new connections.
+    """
+
+    def __init__(self, urls, backoff_base, backoff_max, ewma_alpha):
+        self.urls = list(urls)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.ewma_alpha = ewma_alpha
+        self._lock = threading.Lock()
+        self._stats = {
+            url: {"latency": None, "last_rtt": None, "successes": 0, "failures": 0,
+                  "consecutive_failures": 0, "ejected_until": 0.0, "last_error": None}
+            for url in self.urls
+        }
+
+    def candidates(self):
+        """Available servers fastest first, then ejected ones as a last resort."""
+        now = time.monotonic()
+        with self._lock:
+            available = [u for u in self.urls if self._stats[u]["ejected_until"] <= now]
+            ejected = [u for u in self.urls if self._stats[u]["ejected_until"] > now]
+            # unmeasured servers sort first so they get a sample
+            available.sort(key=lambda u: self._stats[u]["latency"] or 0.0)
+            ejected.sort(key=lambda u: self._stats[u]["ejected_until"])
+        return available + ejected
+
+    def is_available(self, url):
+        with self._lock:
+            stats = self._stats.get(url)
+            return stats is None or stats["ejected_until"] <= time.monotonic()
+
+    def record_success(self, url, rtt):
+        with self._lock:
+            stats = self._stats[url]
+            stats["successes"] += 1
+            stats["consecutive_failures"] = 0
+            stats["ejected_until"] = 0.0
+            stats["last_rtt"] = rtt
+            if stats["latency"] is None:
+                stats["latency"] = rtt
+            else:
+                stats["latency"] += self.ewma_alpha * (rtt - stats["latency"])
+
+    def record_failure(self, url, error):
+        with self._lock:
+            stats = self._stats[url]
+            stats["failures"] += 1
+            stats["consecutive_failures"] += 1
+            stats["last_error"] = str(error)
+            backoff = min(self.backoff_base * 2 ** (stats["consecutive_failures"] - 1), self.backoff_max)
+            stats["ejected_until"] = time.monotonic() + backoff
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                url: {
+                    "latency_ms": round(s["latency"] * 1000, 2) if s["latency"] is not None else None,
+                    "last_rtt_ms": round(s["last_rtt"] * 1000, 2) if s["last_rtt"] is not None else None,
+                    "successes": s["successes"],
+                    "failures": s["failures"],
+                    "consecutive_failures": s["consecutive_failures"],
+                    "ejected_for": round(max(0.0, s["ejected_until"] - now), 1),
+                    "last_error": s["last_error"]
+                }
+                for url, s in self._stats.items()
+            }
+
+
+selector = ServerSelector(
+    server_urls(),
+    LDAP_SERVER_HEALTH_CONFIG["BACKOFF_BASE"],
+    LDAP_SERVER_HEALTH_CONFIG["BACKOFF_MAX"],
+    LDAP_SERVER_HEALTH_CONFIG["EWMA_ALPHA"]
+)
+
+
+def get_server(bind_only=False, url=None):
+    """
+    Return the shared Server descriptor for one of the LDAP_SERVER URLs
+    (the currently preferred one by default).
+
+    ldap3 only downloads the root DSE and schema while server.info/schema are
+    empty, so reusing one descriptor per process means they are fetched once.
+    The bind-only descriptor never requests them at all.
+    """
+    url = url or selector.candidates()[0]
+    get_info = NONE if bind_only else _GET_INFO[LDAP_SERVER_INFO_CONFIG["GET_INFO"].upper()]
+    key = (url, get_info)
+    server = _servers.get(key)
+    if server is None:
+        with _lock:
+            server = _servers.get(key)
+            if server is None:
+                server = Server(url, get_info=get_info,
+                                connect_timeout=LDAP_POOL_CONFIG["CONNECT_TIMEOUT"])
+                _servers[key] = server
+    return server
+
+
+def get_servers(bind_only=False):
+    """Descriptors for every configured server, in failover order."""
+    return [(url, get_server(bind_only, url)) for url in selector.candidates()]
+
+
+def get_auth_servers():
+    return get_servers(bind_only=LDAP_SERVER_INFO_CONFIG["AUTH_BIND_ONLY"])
+
+
+def load_server_info(pool):
+    """Fetch (or re-fetch) schema/DSA info over a pooled connection."""
+    pool.execute(lambda conn: conn.refresh_server_info())
+
+
+def _first_raw(conn, attribute):
+    for entry in conn.response or []:
+        if entry.get('type') == 'searchResEntry':
+            values = entry.get('raw_attributes', {}).get(attribute) or []
+            return values[0] if values else None
+    return None
+
+
+def read_dc_identity(conn):
+    """
+    "<dnsHostName>/<invocationId>" of the DC behind conn. uSNChanged values
+    are only comparable on the same DC, and a restored DC gets a new
+    invocationId. Falls back to the server name outside Active Directory
+    or when the root DSE cannot be read.
+    """
+    try:
+        conn.search("", "(objectClass=*)", search_scope=BASE, attributes=["dnsHostName", "dsServiceName"])
+        host, service = _first_raw(conn, "dnsHostName"), _first_raw(conn, "dsServiceName")
+        if not host or not service:
+            return conn.server.name
+        conn.search(service.decode("utf-8"), "(objectClass=*)", search_scope=BASE, attributes=["invocationId"])
+        invocation = _first_raw(conn, "invocationId")
+    except LDAPCommunicationError:
+        # a dead socket is the pool's to handle (rebind and retry)
+        raise
+    except LDAPException as e:
+        logger.warning(f"Root DSE read failed, identifying the DC by its URL: {str(e)}")
+        return conn.server.name
+    return f"{host.decode('utf-8').lower()}/{invocation.hex() if invocation else '-'}"
+
+
+def _refresh_loop(pool, ttl):
+    while True:
+        time.sleep(ttl)
+        try:
+            load_server_info(pool)
+        except Exception as e:
+            logger.warning(f"Server info refresh failed: {str(e)}")
+
+
+def start_background_refresh(pool):
+    global _refresher
+    ttl = LDAP_SERVER_INFO_CONFIG["REFRESH_TTL"]
+    if ttl <= 0 or _GET_INFO[LDAP_SERVER_INFO_CONFIG["GET_INFO"].upper()] == NONE:
+        return
+    with _lock:
+        if _refresher is None:
+            _refresher = threading.Thread(target=_refresh_loop, args=(pool, ttl),
+                                          name="ldap-server-info-refresh", daemon=True)
+            _refresher.start()
+
+
+def probe_server(url):
+    """Bind as the service account and read the root DSE, recording the RTT."""
+    started = time.monotonic()
+    conn = Connection(get_server(bind_only=True, url=url), LDAP_CONFIG["BIND_DN"], LDAP_CONFIG["BIND_PASSWORD"],
+                      receive_timeout=LDAP_POOL_CONFIG["RECEIVE_TIMEOUT"])
+    try:
+        if not conn.bind():
+            raise ConnectionError(f"bind failed: {conn.last_error}")
+        conn.search("", "(objectClass=*)", search_scope=BASE, attributes=["1.1"])
+        selector.record_success(url, time.monotonic() - started)
+    except Exception as e:
+        selector.record_failure(url, e)
+    finally:
+        try:
+            conn.unbind()
+        except Exception:
+            pass
+
+
+def _probe_loop(interval):
+    while True:
+        for url in selector.urls:
+            # ejected servers are only probed again once their backoff expires
+            if selector.is_available(url):
+                probe_server(url)
+        time.sleep(interval)
+
+
+def start_health_probes():
+    global _prober
+    interval = LDAP_SERVER_HEALTH_CONFIG["PROBE_INTERVAL"]
+    if interval <= 0:
+        return
+    with _lock:
+        if _prober is None:
+            _prober = threading.Thread(target=_probe_loop, args=(interval,),
+                                       name="ldap-server-probe", daemon=True)
+            _prober.start()
+
+
+def _reset_after_fork():
+    # descriptors and their schema carry over; the parent's threads do not
+    global _lock, _refresher, _prober
+    _lock = threading.Lock()
+    _refresher = None
+    _prober = None
+    selector._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from config import SINGLE_FLIGHT_CONFIG
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Concurrent calls for the same key share one execution: the first caller
+    (the leader) runs the function, the others wait and receive its result or
+    its exception. With cross-process locking, leaders in different workers
+    also serialize on a per-key file lock and re-check a shared cache first.
+    """
+
+    def __init__(self, lock_dir=None, lock_timeout=10.0):
+        self.lock_dir = lock_dir
+        self.lock_timeout = lock_timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._counters = {"leaders": 0, "coalesced": 0, "cross_process_hits": 0}
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    @contextmanager
+    def _process_lock(self, key):
+        # keys are hashed onto a fixed set of lock files so the directory stays bounded
+        bucket = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:2]
+        fd = os.open(os.path.join(self.lock_dir, f"{bucket}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        locked = False
+        deadline = time.monotonic() + self.lock_timeout
+        try:
+            while not locked:
+                try:
+                    if fcntl is not None:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    else:
+                        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                    locked = True
+                except OSError:
+                    if time.monotonic() >= deadline:
+                        break  # give up on coalescing rather than on the request
+                    time.sleep(0.01)
+            yield
+        finally:
+            if locked:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                else:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            os.close(fd)
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _lead(self, key, fn, recheck):
+        if not self.lock_dir:
+            return fn()
+        with self._process_lock(key):
+            if recheck is not None:
+                # another worker may have answered while we waited for the lock
+                found, value = recheck()
+                if found:
+                    self._count("cross_process_hits")
+                    return value
+            return fn()
+
+    def do(self, key, fn, recheck=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._counters["leaders"] += 1
+            else:
+                self._counters["coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._lead(key, fn, recheck)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, in_flight=len(self._calls))
+
+    def reset(self):
+        """Forget in-flight calls, e.g. those of the parent's threads after fork."""
+        self._lock = threading.Lock()
+        self._calls = {}
+
+
+single_flight = SingleFlight(
+    SINGLE_FLIGHT_CONFIG["LOCK_DIR"] if SINGLE_FLIGHT_CONFIG["CROSS_PROCESS"] else None,
+    SINGLE_FLIGHT_CONFIG["LOCK_TIMEOUT"]
+)
+
+
+def coalesce(key, fn, recheck=None):
+    """Run fn through the process-wide SingleFlight unless coalescing is disabled."""
+    if not SINGLE_FLIGHT_CONFIG["ENABLED"]:
+        return fn()
+    return single_flight.do(key, fn, recheck)
+
+
+def _reset_after_fork():
+    single_flight.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
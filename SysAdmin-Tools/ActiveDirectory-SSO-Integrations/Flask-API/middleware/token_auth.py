@@ -0,0 +1,147 @@
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from functools import wraps
+
+from flask import g, request, jsonify
+from config import TOKEN_CONFIG
+from utils.logger import get_logger, set_context_field
+
+logger = get_logger(__name__)
+
+
+class TokenError(Exception):
+    """Raised when a session token is malformed, forged or expired."""
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _load_keys():
+    keys = []
+    for pair in TOKEN_CONFIG["SIGNING_KEYS"].split(","):
+        kid, sep, secret = pair.strip().partition(":")
+        if sep and kid and secret:
+            keys.append((kid, secret.encode("utf-8")))
+    if not keys:
+        # tokens will only verify inside this process; configure SESSION_SIGNING_KEYS
+        logger.warning("SESSION_SIGNING_KEYS is not set, using an ephemeral signing key")
+        keys.append(("ephemeral", secrets.token_bytes(32)))
+    return keys
+
+
+_keys = _load_keys()
+_keys_by_id = dict(_keys)
+
+
+def _sign(kid, signing_input):
+    return hmac.new(_keys_by_id[kid], signing_input, hashlib.sha256).digest()
+
+
+def issue_token(username, groups, auth_time=None):
+    """Return a compact HS256 JWT carrying the user's identity and groups."""
+    now = int(time.time())
+    kid = _keys[0][0]
+    header = {"alg": "HS256", "typ": "JWT", "kid": kid}
+    claims = {
+        "iss": TOKEN_CONFIG["ISSUER"],
+        "sub": username,
+        "groups": groups,
+        "iat": now,
+        "exp": now + TOKEN_CONFIG["TTL"],
+        "auth_time": auth_time or now
+    }
+    signing_input = (_b64encode(json.dumps(header, separators=(",", ":")).encode("utf-8")) + "." +
+                     _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8")))
+    return signing_input + "." + _b64encode(_sign(kid, signing_input.encode("ascii")))
+
+
+def verify_token(token):
+    """Check signature, issuer and expiry locally; returns the claims."""
+    try:
+        header_b64, claims_b64, signature_b64 = token.split(".")
+        header = json.loads(_b64decode(header_b64))
+        signature = _b64decode(signature_b64)
+        signing_input = (header_b64 + "." + claims_b64).encode("ascii")
+    except (ValueError, TypeError):
+        raise TokenError("Malformed token")
+    # valid JSON is not necessarily an object ("[1]", "1", "null")
+    if not isinstance(header, dict):
+        raise TokenError("Malformed token")
+
+    kid = header.get("kid")
+    if header.get("alg") != "HS256" or not isinstance(kid, str) or kid not in _keys_by_id:
+        raise TokenError("Unknown signing key")
+
+    expected = _sign(kid, signing_input)
+    if not hmac.compare_digest(signature, expected):
+        raise TokenError("Invalid signature")
+
+    try:
+        claims = json.loads(_b64decode(claims_b64))
+    except (ValueError, TypeError):
+        raise TokenError("Malformed token")
+    if not isinstance(claims, dict):
+        raise TokenError("Malformed token")
+    if claims.get("iss") != TOKEN_CONFIG["ISSUER"]:
+        raise TokenError("Invalid issuer")
+    exp = claims.get("exp", 0)
+    if not isinstance(exp, (int, float)) or exp <= time.time():
+        raise TokenError("Token expired")
+    return claims
+
+
+def refresh_token(claims, load_groups):
+    """
+    Re-issue a verified token without another bind. Groups come from
+    load_groups(username), so removals and disabled accounts take effect at
+    the next refresh; it returns None for an account that is gone or disabled.
+    """
+    if time.time() - claims["auth_time"] > TOKEN_CONFIG["MAX_SESSION_AGE"]:
+        raise TokenError("Session too old, authenticate again")
+    groups = load_groups(claims["sub"])
+    if groups is None:
+        raise TokenError("Account disabled or removed")
+    return issue_token(claims["sub"], groups, auth_time=claims["auth_time"])
+
+
+def _bearer_token():
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    return token.strip() if scheme.lower() == "bearer" else None
+
+
+def _check_request():
+    token = _bearer_token()
+    if not token:
+        return jsonify({"error": "Missing bearer token"}), 401
+    try:
+        g.token_claims = verify_token(token)
+    except TokenError as e:
+        return jsonify({"error": str(e)}), 401
+    set_context_field("user", g.token_claims["sub"])
+    return None
+
+
+def require_token(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        denied = _check_request()
+        if denied is not None:
+            return denied
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def protect_blueprint(blueprint):
+    """Require a valid session token on every route of the blueprint."""
+    # create_app() may run more than once; the hook must only be added the first time
+    if _check_request not in blueprint.before_request_funcs.get(None, []):
+        blueprint.before_request(_check_request)
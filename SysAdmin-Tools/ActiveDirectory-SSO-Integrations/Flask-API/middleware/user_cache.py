@@ -0,0 +1,205 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import USER_CACHE_CONFIG
+
+
+class MemoryBackend:
+    """Per-process LRU dictionary."""
+
+    name = "memory"
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, ttl):
+        evicted = 0
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                evicted += 1
+        return evicted
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def size(self):
+        return len(self._data)
+
+
+class SqliteBackend:
+    """LRU table in a SQLite file shared by every worker process on the host."""
+
+    name = "sqlite"
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS user_cache ("
+            "key TEXT PRIMARY KEY, value TEXT, expires_at REAL, last_access REAL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute("SELECT value, expires_at FROM user_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] <= now:
+            conn.execute("DELETE FROM user_cache WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE user_cache SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO user_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + ttl, now)
+        )
+        cur = conn.execute(
+            "DELETE FROM user_cache WHERE key IN "
+            "(SELECT key FROM user_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+        return max(cur.rowcount, 0)
+
+    def delete(self, key):
+        cur = self._conn().execute("DELETE FROM user_cache WHERE key = ?", (key,))
+        return cur.rowcount > 0
+
+    def clear(self):
+        self._conn().execute("DELETE FROM user_cache")
+
+    def size(self):
+        return self._conn().execute("SELECT COUNT(*) FROM user_cache").fetchone()[0]
+
+
+class UserDetailsCache:
+    """
+    TTL/LRU cache for user lookups. Negative results ("user not found") are
+    stored too, with NEGATIVE_TTL, so unknown names do not hammer the DC.
+    """
+
+    _NOT_FOUND = {"__not_found__": True}
+
+    def __init__(self, backend, ttl, negative_ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "negative_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def normalize(username):
+        return username.strip().lower()
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def get(self, username):
+        """Return (found, value); value is None for a cached "not found"."""
+        value = self.backend.get(self.normalize(username))
+        if value is None:
+            self._count("misses")
+            return False, None
+        if value == self._NOT_FOUND:
+            self._count("negative_hits")
+            return True, None
+        self._count("hits")
+        return True, value
+
+    def set(self, username, value):
+        if value is None:
+            evicted = self.backend.set(self.normalize(username), self._NOT_FOUND, self.negative_ttl)
+        else:
+            evicted = self.backend.set(self.normalize(username), value, self.ttl)
+        if evicted:
+            self._count("evictions", evicted)
+
+    def invalidate(self, username):
+        removed = self.backend.delete(self.normalize(username))
+        self._count("invalidations")
+        return removed
+
+    def clear(self):
+        self.backend.clear()
+        self._count("invalidations")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = stats["hits"] + stats["negative_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["negative_hits"]) / lookups, 4) if lookups else 0.0
+        stats["size"] = self.backend.size()
+        stats["max_entries"] = self.backend.max_entries
+        stats["backend"] = self.backend.name
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    """Return the process-wide cache, or None when USER_CACHE_ENABLED is false."""
+    global _cache
+    if not USER_CACHE_CONFIG["ENABLED"]:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if USER_CACHE_CONFIG["BACKEND"] == "sqlite":
+                    backend = SqliteBackend(USER_CACHE_CONFIG["SQLITE_PATH"], USER_CACHE_CONFIG["MAX_ENTRIES"])
+                else:
+                    backend = MemoryBackend(USER_CACHE_CONFIG["MAX_ENTRIES"])
+                _cache = UserDetailsCache(backend, USER_CACHE_CONFIG["TTL"], USER_CACHE_CONFIG["NEGATIVE_TTL"])
+    return _cache
+
+
+def _reset_after_fork():
+    # SQLite connections must not cross fork; memory entries are rebuilt per worker
+    global _cache, _cache_lock
+    _cache = None
+    _cache_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
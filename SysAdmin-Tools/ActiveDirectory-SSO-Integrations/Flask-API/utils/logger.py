@@ -1,11 +1,175 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from config import AUDIT_LOG_CONFIG
+
+# Request threads only enqueue records; formatting and disk I/O happen on the
+# QueueListener thread. The queue is bounded and overflow is counted, never blocked on.
+
+_ROOT = "flask_api"
+
+# client-supplied X-Request-ID values are only echoed when they look like an id
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,128}$')
+
+# request id, source IP, DC... of the current request; offloaded calls run in a
+# copied context and share the same dict, so fields set there still show up
+_request_context = ContextVar("log_request_context", default=None)
+
+
+def start_request_context(request_id=None, source_ip=None):
+    if not request_id or not _REQUEST_ID.match(request_id):
+        request_id = uuid.uuid4().hex
+    context = {"request_id": request_id, "source_ip": source_ip,
+               "started": time.perf_counter()}
+    _request_context.set(context)
+    return context
+
+
+def set_context_field(name, value):
+    context = _request_context.get()
+    if context is not None:
+        context[name] = value
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any structured fields."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the caller: records are dropped and counted when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record):
+        # runs on the calling thread, so this is where the request context is still visible
+        context = _request_context.get()
+        fields = {k: v for k, v in (context or {}).items() if k != "started" and v is not None}
+        fields.update(getattr(record, "fields", None) or {})
+        record = super().prepare(record)
+        record.fields = fields
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+
+def _file_handler():
+    # "{pid}" gives each worker its own file; rotation is not safe across processes
+    path = AUDIT_LOG_CONFIG["PATH"].replace("{pid}", str(os.getpid()))
+    if AUDIT_LOG_CONFIG["ROTATE"] == "time":
+        handler = logging.handlers.TimedRotatingFileHandler(
+            path, when=AUDIT_LOG_CONFIG["WHEN"], backupCount=AUDIT_LOG_CONFIG["BACKUP_COUNT"],
+            encoding="utf-8", utc=True)
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=AUDIT_LOG_CONFIG["MAX_BYTES"], backupCount=AUDIT_LOG_CONFIG["BACKUP_COUNT"],
+            encoding="utf-8")
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+_queue_handler = None
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        try:
+            listener.stop()
+        except queue.Full:
+            pass
+
+
+def setup_logging():
+    """Build the queue -> listener -> (JSON file, stderr) pipeline once per process."""
+    global _queue_handler, _listener
+    if _queue_handler is None:
+        with _setup_lock:
+            if _queue_handler is None:
+                console = logging.StreamHandler()
+                console.setLevel(logging.WARNING)
+                console.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+                log_queue = queue.Queue(maxsize=AUDIT_LOG_CONFIG["QUEUE_SIZE"])
+                handler = DroppingQueueHandler(log_queue)
+                _listener = logging.handlers.QueueListener(log_queue, _file_handler(), console,
+                                                           respect_handler_level=True)
+                _listener.start()
+                atexit.register(stop_logging)
+
+                root = logging.getLogger(_ROOT)
+                root.setLevel(AUDIT_LOG_CONFIG["LEVEL"])
+                root.addHandler(handler)
+                root.propagate = False
+                _queue_handler = handler
+    return _queue_handler
+
+
+def get_logger(name):
+    # handlers hang off the "flask_api" root, installed by setup_logging()
+    return logging.getLogger(f"{_ROOT}.{name}")
+
+
+def audit(event, **fields):
+    """Record an audit event; latency_ms is measured from the start of the current request."""
+    context = _request_context.get()
+    if context is not None:
+        fields.setdefault("latency_ms", round((time.perf_counter() - context["started"]) * 1000, 2))
+    setup_logging()
+    get_logger("audit").info(event, extra={"fields": dict(fields, event=event)})
 
-# Configure logging
-logging.basicConfig(
-    filename='authentication.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
 
 def log_authentication_attempt(username, status):
-    logging.info(f"User: {username} | Status: {status}")
+    audit("authentication", user=username, status=status)
+
+
+def logging_stats():
+    if _queue_handler is None:
+        return {"queued": 0, "capacity": AUDIT_LOG_CONFIG["QUEUE_SIZE"], "dropped": 0}
+    return {"queued": _queue_handler.queue.qsize(), "capacity": AUDIT_LOG_CONFIG["QUEUE_SIZE"],
+            "dropped": _queue_handler.dropped}
+
+
+def _reset_after_fork():
+    # the listener thread does not survive fork; start a fresh pipeline in the child
+    global _queue_handler, _listener, _setup_lock
+    handler = _queue_handler
+    _queue_handler, _listener, _setup_lock = None, None, threading.Lock()
+    if handler is not None:
+        logging.getLogger(_ROOT).removeHandler(handler)
+        setup_logging()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,377 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from config import METRICS_CONFIG
+from utils.logger import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = get_logger(__name__)
+
+# Minimal Prometheus text-format registry, so /metrics needs no extra dependency.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = ((k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')) for k, v in labels.items())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _render(families):
+    """families: [(name, kind, help, [(sample_name, labels_dict, value), ...]), ...]"""
+    lines = []
+    for name, kind, documentation, samples in families:
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample_name, labels, value in samples:
+            if value is not None:
+                lines.append(f"{sample_name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def family(self):
+        return (self.name, self.kind, self.documentation, self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, dict(zip(self.labels, k)), v) for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        samples = []
+        for key, (counts, total, count) in items:
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples.append((f"{self.name}_bucket", dict(labels, le=le), cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """collector() returns [(name, kind, help, [(labels_dict, value), ...]), ...] at scrape time."""
+        self._collectors.append(collector)
+
+    def collect(self):
+        """Families of this process: registered metrics first, then collector output."""
+        families = [metric.family() for metric in self._metrics]
+        for collector in self._collectors:
+            try:
+                collected = collector()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {str(e)}")
+                continue
+            families.extend((name, kind, documentation, [(name, labels, value) for labels, value in samples])
+                            for name, kind, documentation, samples in collected)
+        return families
+
+    def render(self):
+        if _store is not None:
+            return _render(_store.collect())
+        return _render(self.collect())
+
+
+registry = Registry()
+
+HTTP_REQUEST_DURATION = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by endpoint.", ("endpoint", "method", "status")))
+HTTP_REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served.", ("endpoint",)))
+LDAP_BIND_DURATION = registry.register(Histogram(
+    "ldap_bind_duration_seconds", "LDAP bind latency by server and outcome.", ("server", "kind", "outcome")))
+LDAP_SEARCH_DURATION = registry.register(Histogram(
+    "ldap_search_duration_seconds", "LDAP operation latency on pooled connections by server and outcome.",
+    ("server", "outcome")))
+AUTH_ATTEMPTS = registry.register(Counter(
+    "auth_attempts_total", "Login attempts by outcome.", ("outcome",)))
+
+
+def _merge(snapshots):
+    """
+    Sum counters and histograms over (pid, families) snapshots. Gauges describe
+    a live process, so they keep a pid label and are left out of the archive
+    (pid None).
+    """
+    merged = {}
+    for pid, families in snapshots:
+        for name, kind, documentation, samples in families:
+            values = merged.setdefault(name, (kind, documentation, {}))[2]
+            for sample_name, labels, value in samples:
+                if value is None:
+                    continue
+                if kind == "gauge":
+                    if pid is None:
+                        continue
+                    labels = dict(labels, pid=pid)
+                key = (sample_name, tuple(sorted(labels.items())))
+                if key in values:
+                    values[key][1] += value
+                else:
+                    values[key] = [labels, value]
+    return [(name, kind, documentation, [(sample_name, labels, value)
+                                         for (sample_name, _), (labels, value) in values.items()])
+            for name, (kind, documentation, values) in merged.items()]
+
+
+class MultiProcessStore:
+    """
+    Each Gunicorn worker keeps its own counters, so a scrape answered by one
+    worker would only show its share. Here every worker writes its families
+    to <pid>.json in a shared directory (every interval, on scrape and on
+    exit), and a scrape merges all of them. mark_process_dead() folds an
+    exited worker into archive.json so its counts are not lost.
+    """
+
+    ARCHIVE = "archive.json"
+
+    def __init__(self, directory, interval):
+        self.directory = directory
+        self.interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f"{pid}.json")
+
+    @contextmanager
+    def _locked(self):
+        fd = os.open(os.path.join(self.directory, ".lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            os.close(fd)
+
+    def _read(self, path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unreadable metrics snapshot {path}: {str(e)}")
+            return None
+
+    def _write(self, path, families):
+        # readers only ever see a complete file
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(families, f)
+        os.replace(temp, path)
+
+    def write_snapshot(self):
+        self._write(self._path(os.getpid()), registry.collect())
+
+    def collect(self):
+        self.write_snapshot()
+        snapshots = []
+        with self._locked():
+            for name in sorted(os.listdir(self.directory)):
+                if not name.endswith(".json"):
+                    continue
+                families = self._read(os.path.join(self.directory, name))
+                if families is not None:
+                    snapshots.append((None if name == self.ARCHIVE else name[:-len(".json")], families))
+        return _merge(snapshots)
+
+    def mark_process_dead(self, pid):
+        path = self._path(pid)
+        with self._locked():
+            families = self._read(path)
+            if families is None:
+                return
+            archive = self._read(os.path.join(self.directory, self.ARCHIVE)) or []
+            self._write(os.path.join(self.directory, self.ARCHIVE), _merge([(None, archive), (None, families)]))
+            os.remove(path)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.directory, name))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="metrics-snapshot", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write_snapshot()
+            except Exception as e:
+                logger.warning(f"Metrics snapshot failed: {str(e)}")
+
+    def stop(self):
+        """Stop the writer thread and leave a final snapshot for mark_process_dead()."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+            self._thread = None
+        self.write_snapshot()
+
+
+_store = (MultiProcessStore(METRICS_CONFIG["MULTIPROC_DIR"], METRICS_CONFIG["MULTIPROC_INTERVAL"])
+          if METRICS_CONFIG["MULTIPROC_DIR"] else None)
+
+
+def start_snapshots():
+    if _store is not None:
+        _store.start()
+
+
+def stop_snapshots():
+    if _store is not None:
+        _store.stop()
+
+
+def mark_process_dead(pid):
+    if _store is not None:
+        _store.mark_process_dead(pid)
+
+
+def clear_snapshots():
+    if _store is not None:
+        _store.clear()
+
+
+def _reset_after_fork():
+    # the parent's counts are reported by the parent; a worker starts from zero
+    for metric in registry._metrics:
+        metric._values = {}
+        metric._lock = threading.Lock()
+    if _store is not None:
+        _store._thread = None
+        _store._stop = threading.Event()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# Per-request timings for the Server-Timing header. The list is shared by
+# reference, so work offloaded with a copied context still lands in it.
+_request_timings = ContextVar("request_timings", default=None)
+
+
+def start_request_timing():
+    _request_timings.set([])
+
+
+def record_timing(name, seconds):
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+def server_timing_header(total_seconds):
+    totals = {}
+    for name, seconds in _request_timings.get() or ():
+        duration, count = totals.get(name, (0.0, 0))
+        totals[name] = (duration + seconds, count + 1)
+    parts = [f'{name};dur={duration * 1000:.1f};desc="{count}x"' for name, (duration, count) in totals.items()]
+    parts.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class timed:
+    """Context manager observing a histogram and recording a Server-Timing entry.
+
+    The outcome label defaults to success/error; set .outcome inside the block to override it.
+    """
+
+    def __init__(self, histogram, timing_name, **labels):
+        self.histogram = histogram
+        self.timing_name = timing_name
+        self.labels = labels
+        self.outcome = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        outcome = self.outcome or ("error" if exc_type else "success")
+        self.histogram.observe(elapsed, outcome=outcome, **self.labels)
+        record_timing(self.timing_name, elapsed)
+        return False